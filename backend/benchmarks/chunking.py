@@ -0,0 +1,179 @@
+# Chunking benchmark
+# Compares the old fixed 1000-char slicer with the structure-aware chunker on
+# the same documents: chunking speed, peak memory, embedding cost and recall.
+#
+# Usage (from backend/):
+#   python benchmarks/chunking.py                       # bundled data/ folder
+#   python benchmarks/chunking.py --data ~/papers       # your own PDFs / notes
+#   python benchmarks/chunking.py --embedder hashing    # no model download, rough recall only
+#
+# Recall@k: sentences are sampled from the documents and the first half of each
+# is used as the query. A hit means one of the top-k chunks contains the whole
+# sentence, i.e. the retrieved context actually holds the answer.
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import chunker  # noqa: E402
+import rag_ingest  # noqa: E402
+
+
+# ---------------------------------------------------------
+# The slicer being replaced (kept here verbatim for comparison)
+# ---------------------------------------------------------
+def _legacy_read(path):
+    if path.endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        text = ""
+        for page in reader.pages:
+            t = page.extract_text()
+            if t: text += t + "\n"
+        return text
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def legacy_chunks(path, chunk_size=1000, overlap=100):
+    text = _legacy_read(path)
+    chunks = []
+    start = 0
+    while start < len(text):
+        chunks.append(text[start:start + chunk_size])
+        start += (chunk_size - overlap)
+    return chunks
+
+
+def structured_chunks(path):
+    return (c.text for c in chunker.iter_chunks(path))
+
+
+METHODS = {"fixed-1000": legacy_chunks, "structured": structured_chunks}
+
+
+# ---------------------------------------------------------
+# Embedders
+# ---------------------------------------------------------
+def _minilm():
+    from chromadb.utils import embedding_functions
+
+    fn = embedding_functions.DefaultEmbeddingFunction()
+    return lambda texts: np.asarray(fn(texts), dtype=np.float32)
+
+
+def _hashing(dim=2048):
+    """Bag-of-words hashed into a fixed vector; crude but needs nothing installed."""
+    def embed(texts):
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[row, hash(word) % dim] += 1.0
+        return out
+    return embed
+
+
+EMBEDDERS = {"minilm": _minilm, "hashing": _hashing}
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+def _squash(text):
+    return " ".join(text.split())
+
+
+def sample_questions(paths, count, seed):
+    """(query, answer sentence) pairs taken from the documents themselves."""
+    sentences = []
+    for path in paths:
+        for block in chunker.iter_blocks(path):
+            if block.heading:
+                continue
+            for sentence, _, _ in chunker._split_sentences(block):
+                words = sentence.split()
+                if len(words) >= 8:
+                    sentences.append((" ".join(words[:len(words) // 2]), _squash(sentence)))
+    random.Random(seed).shuffle(sentences)
+    return sentences[:count]
+
+
+def run_method(name, chunk_fn, paths, questions, embed, k):
+    started = time.perf_counter()
+    chunks = [c for path in paths for c in chunk_fn(path)]
+    chunk_seconds = time.perf_counter() - started
+
+    # Separate pass: tracemalloc slows allocation-heavy code and would skew the timing.
+    # Peak is per document, since ingestion handles one document at a time.
+    peak = 0
+    for path in paths:
+        tracemalloc.start()
+        for _ in chunk_fn(path):
+            pass
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    started = time.perf_counter()
+    chunk_vectors = _normalize(embed(chunks)) if chunks else np.zeros((0, 1), dtype=np.float32)
+    embed_seconds = time.perf_counter() - started
+
+    hits = 0
+    if questions and chunks:
+        query_vectors = _normalize(embed([q for q, _ in questions]))
+        top = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :k]
+        squashed = [_squash(c) for c in chunks]
+        for (_, answer), row in zip(questions, top):
+            if any(answer in squashed[i] for i in row):
+                hits += 1
+
+    return {
+        "method": name,
+        "chunks": len(chunks),
+        "avg_chunk_chars": round(sum(len(c) for c in chunks) / max(len(chunks), 1)),
+        "chunk_seconds": round(chunk_seconds, 4),
+        "chunk_peak_mb": round(peak / (1024 * 1024), 2),
+        "embed_seconds": round(embed_seconds, 3),
+        f"recall@{k}": round(hits / len(questions), 3) if questions else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed slicing vs structure-aware chunking.")
+    parser.add_argument("--data", default=os.path.join(BACKEND_DIR, "data"), help="Folder of PDF/TXT/MD files")
+    parser.add_argument("--embedder", choices=sorted(EMBEDDERS), default="minilm")
+    parser.add_argument("--questions", type=int, default=200, help="Sentences sampled for recall")
+    parser.add_argument("--k", type=int, default=3, help="Chunks retrieved per query (n_results)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.data, name) for name in os.listdir(args.data)
+        if name.endswith(rag_ingest.SUPPORTED_EXTENSIONS)
+    )
+    if not paths:
+        sys.exit(f"No documents in {args.data}")
+
+    embed = EMBEDDERS[args.embedder]()
+    questions = sample_questions(paths, args.questions, args.seed)
+    print(f"{len(paths)} documents, {len(questions)} questions, embedder={args.embedder}")
+
+    results = [run_method(name, fn, paths, questions, embed, args.k) for name, fn in METHODS.items()]
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
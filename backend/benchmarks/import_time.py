@@ -0,0 +1,130 @@
+# Import-time benchmark
+# Profiles `import main` (what `uvicorn main:app` does before it can answer the
+# health check) with `python -X importtime`, in a fresh interpreter each run.
+# Reports total import time, resident memory and the slowest top-level imports,
+# and fails if a heavy dependency (torch, whisper, chromadb, google.adk, ...)
+# is imported eagerly again instead of during warm-up.
+#
+# Usage (from backend/):
+#   python benchmarks/import_time.py                  # report
+#   python benchmarks/import_time.py --check          # compare with the saved baseline (exit 1 on regression)
+#   python benchmarks/import_time.py --save           # record a new baseline
+#   python benchmarks/import_time.py --module agent   # profile another module
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "import_time.json")
+
+# Must only load during warm-up / first use (see warmup.py)
+HEAVY_MODULES = (
+    "torch", "whisper", "faster_whisper", "ctranslate2", "chromadb", "onnxruntime",
+    "sentence_transformers", "transformers", "pypdf", "pyttsx3",
+    "google.adk", "google.genai",
+)
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+rss_kb = 0
+try:
+    with open("/proc/self/status") as f:
+        rss_kb = next(int(l.split()[1]) for l in f if l.startswith("VmRSS:"))
+except (OSError, StopIteration):
+    pass
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{"seconds": seconds, "rss_mb": rss_kb / 1024, "heavy": heavy}}))
+"""
+
+
+def profile_once(module):
+    """One fresh interpreter: (summary dict, [(cumulative_us, self_us, name)] for top-level imports)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        sys.exit(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    summary = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    top_level = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match and len(match.group(3)) == 2:  # Direct imports of `module`
+            top_level.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+    return summary, top_level
+
+
+def run(module, repeat, top):
+    runs = [profile_once(module) for _ in range(repeat)]
+    # The fastest run is the least disturbed by the rest of the machine
+    summary, top_level = min(runs, key=lambda r: r[0]["seconds"])
+    slowest = sorted(top_level, reverse=True)[:top]
+    return {
+        "module": module,
+        "python": sys.version.split()[0],
+        "import_seconds": round(summary["seconds"], 3),
+        "rss_mb": round(summary["rss_mb"], 1),
+        "heavy_modules": summary["heavy"],
+        "slowest_imports": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+            for cumulative, self_us, name in slowest
+        ],
+    }
+
+
+def check(result, baseline, tolerance):
+    """Returns a list of regressions (empty = pass)."""
+    problems = []
+    if result["heavy_modules"]:
+        problems.append(f"heavy modules imported eagerly: {', '.join(result['heavy_modules'])}")
+    limit = baseline["import_seconds"] * (1 + tolerance)
+    if result["import_seconds"] > limit:
+        problems.append(f"import took {result['import_seconds']}s, baseline {baseline['import_seconds']}s "
+                        f"(limit {limit:.3f}s)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the server's import time (python -X importtime).")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters; the fastest run is kept")
+    parser.add_argument("--top", type=int, default=15, help="Slowest top-level imports to list")
+    parser.add_argument("--save", action="store_true", help=f"Write the result to {os.path.relpath(BASELINE_PATH, BACKEND_DIR)}")
+    parser.add_argument("--check", action="store_true", help="Fail on heavy imports or a slowdown vs the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown vs baseline (0.5 = +50%%)")
+    args = parser.parse_args()
+
+    result = run(args.module, args.repeat, args.top)
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+
+    if args.check:
+        try:
+            with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except OSError:
+            sys.exit(f"No baseline at {BASELINE_PATH}; run with --save first")
+        problems = check(result, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Retrieval benchmark
+# Dense-only vs BM25-only vs hybrid (RRF) vs hybrid + cross-encoder reranking
+# over the chunks of the same documents: recall@k, MRR and per-query latency.
+#
+# Usage (from backend/):
+#   python benchmarks/retrieval_quality.py                          # bundled data/ folder
+#   python benchmarks/retrieval_quality.py --embedder hashing       # no model download
+#   python benchmarks/retrieval_quality.py --reranker cross-encoder/ms-marco-MiniLM-L-6-v2
+#   python benchmarks/retrieval_quality.py --dense-candidates 50 --lexical-candidates 50
+#
+# Two query sets:
+# - "sentence": the first half of a sampled sentence; a hit is a chunk holding the whole sentence
+# - "term": rare exact tokens (tickers, EIP numbers, names) asked about in a question;
+#   a hit is a chunk containing the token
+# Latency excludes embedding the corpus but includes embedding each query.
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import chunker  # noqa: E402
+import rag_ingest  # noqa: E402
+import retrieval  # noqa: E402
+from chunking import EMBEDDERS, _normalize, _squash, sample_questions  # noqa: E402
+
+_TERM = re.compile(r"\b(?:[A-Z]{2,6}|[A-Za-z]+-?\d+[A-Za-z0-9-]*)\b")
+
+
+def sample_terms(chunks, count, seed, max_df=3):
+    """(query, term) pairs for tokens that appear in at most `max_df` chunks."""
+    seen = {}
+    for text in chunks:
+        for term in set(_TERM.findall(text)):
+            seen[term] = seen.get(term, 0) + 1
+    terms = sorted(t for t, df in seen.items() if df <= max_df)
+    random.Random(seed).shuffle(terms)
+    return [(f"What does the knowledge base say about {t}?", t) for t in terms[:count]]
+
+
+class Retriever:
+    def __init__(self, chunks, embed, reranker=None, dense_candidates=20, lexical_candidates=20,
+                 rerank_candidates=10):
+        self.chunks = chunks
+        self.embed = embed
+        self.reranker = reranker
+        self.dense_candidates = dense_candidates
+        self.lexical_candidates = lexical_candidates
+        self.rerank_candidates = rerank_candidates
+        self.vectors = _normalize(embed(chunks))
+        self.bm25 = retrieval.BM25Index()
+        for i, text in enumerate(chunks):
+            self.bm25.add(i, text, "benchmark")
+
+    def dense(self, query, k):
+        scores = self.vectors @ _normalize(self.embed([query]))[0]
+        return list(np.argsort(-scores)[:k])
+
+    def lexical(self, query, k):
+        return [i for i, _ in self.bm25.search(query, k)]
+
+    def hybrid(self, query, k):
+        fused = retrieval.reciprocal_rank_fusion([
+            self.dense(query, self.dense_candidates),
+            self.lexical(query, self.lexical_candidates),
+        ])
+        return fused[:k]
+
+    def hybrid_rerank(self, query, k):
+        fused = self.hybrid(query, max(self.rerank_candidates, k))
+        scores = self.reranker(query, [self.chunks[i] for i in fused])
+        return [i for _, i in sorted(zip(scores, fused), key=lambda pair: pair[0], reverse=True)][:k]
+
+
+def evaluate(name, search, queries, is_hit, chunks, k):
+    hits, reciprocal_ranks, latencies = 0, 0.0, []
+    for query, answer in queries:
+        started = time.perf_counter()
+        top = search(query, k)
+        latencies.append(time.perf_counter() - started)
+        for rank, i in enumerate(top, start=1):
+            if is_hit(answer, chunks[i]):
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+    latencies.sort()
+    n = max(len(queries), 1)
+    return {
+        "mode": name,
+        "queries": len(queries),
+        f"recall@{k}": round(hits / n, 3),
+        "mrr": round(reciprocal_ranks / n, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense vs BM25 vs hybrid retrieval on the RAG corpus.")
+    parser.add_argument("--data", default=os.path.join(BACKEND_DIR, "data"), help="Folder of PDF/TXT/MD files")
+    parser.add_argument("--embedder", choices=sorted(EMBEDDERS), default="minilm")
+    parser.add_argument("--reranker", default="", help="Cross-encoder model; adds a hybrid+rerank run")
+    parser.add_argument("--questions", type=int, default=200, help="Queries per query set")
+    parser.add_argument("--k", type=int, default=3, help="Chunks retrieved per query (n_results)")
+    parser.add_argument("--dense-candidates", type=int, default=20)
+    parser.add_argument("--lexical-candidates", type=int, default=20)
+    parser.add_argument("--rerank-candidates", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.data, name) for name in os.listdir(args.data)
+        if name.endswith(rag_ingest.SUPPORTED_EXTENSIONS)
+    )
+    if not paths:
+        sys.exit(f"No documents in {args.data}")
+
+    chunks = [c.text for path in paths for c in chunker.iter_chunks(path)]
+    reranker = retrieval.load_reranker(args.reranker)
+    retriever = Retriever(chunks, EMBEDDERS[args.embedder](), reranker, args.dense_candidates,
+                          args.lexical_candidates, args.rerank_candidates)
+
+    query_sets = {
+        "sentence": (sample_questions(paths, args.questions, args.seed),
+                     lambda answer, chunk: answer in _squash(chunk)),
+        "term": (sample_terms(chunks, args.questions, args.seed),
+                 lambda answer, chunk: re.search(rf"\b{re.escape(answer)}\b", chunk) is not None),
+    }
+    modes = {"dense": retriever.dense, "bm25": retriever.lexical, "hybrid": retriever.hybrid}
+    if reranker is not None:
+        modes["hybrid+rerank"] = retriever.hybrid_rerank
+
+    print(f"{len(paths)} documents, {len(chunks)} chunks, embedder={args.embedder}")
+    for set_name, (queries, is_hit) in query_sets.items():
+        for mode, search in modes.items():
+            result = evaluate(mode, search, queries, is_hit, chunks, args.k)
+            print(json.dumps({"query_set": set_name, **result}))
+
+
+if __name__ == "__main__":
+    main()
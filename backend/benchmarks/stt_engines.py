@@ -0,0 +1,147 @@
+# STT engine benchmark
+# Reports real-time factor (RTF) and memory for each STT engine on the same clip
+#
+# Usage (from backend/):
+#   python benchmarks/stt_engines.py                      # all engines, sample clip
+#   python benchmarks/stt_engines.py --audio clip.webm    # your own recording
+#   python benchmarks/stt_engines.py --engines faster-whisper --model-size base
+#
+# RTF = inference time / audio duration (lower is better, < 1 is faster than real time).
+# Each engine runs in its own process so the memory numbers don't mix.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import stt_service  # noqa: E402
+
+SAMPLE_TEXT_FILE = os.path.join(BACKEND_DIR, "data", "bitcoin_history.txt")
+
+
+def _rss_mb():
+    """Current resident memory of this process in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _load_audio(path):
+    """Decodes any ffmpeg-readable file to float32 16kHz PCM with the streaming decoder."""
+    with open(path, "rb") as f:
+        data = f.read()
+    decoder = stt_service.StreamingDecoder()
+    decoder.feed(data)
+    return decoder.finish(timeout=60)
+
+
+def _make_sample_clip():
+    """
+    Speaks the first paragraph of the bundled knowledge base with pyttsx3.
+    The repo ships no recordings, so this gives every run the same clip.
+    """
+    import pyttsx3
+
+    with open(SAMPLE_TEXT_FILE, encoding="utf-8") as f:
+        text = " ".join(f.read().split()[:120])
+
+    path = os.path.join(tempfile.gettempdir(), "stt_benchmark_sample.wav")
+    engine = pyttsx3.init()
+    engine.setProperty("rate", 175)
+    engine.save_to_file(text, path)
+    engine.runAndWait()
+    return path
+
+
+def run_engine(name, audio_path, model_size, runs):
+    """Benchmarks one engine in this process and returns the results."""
+    audio = _load_audio(audio_path)
+    duration = len(audio) / stt_service.SAMPLE_RATE
+    segments = [
+        audio[start:start + stt_service.SEGMENT_SAMPLES]
+        for start in range(0, len(audio), stt_service.SEGMENT_SAMPLES)
+    ]
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    engine = stt_service.create_engine(name, model_size=model_size)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = _rss_mb()
+
+    engine.transcribe_batch(segments)  # Warm-up (first call allocates buffers)
+
+    timings = []
+    text = ""
+    for _ in range(runs):
+        started = time.perf_counter()
+        text = " ".join(engine.transcribe_batch(segments))
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    median = timings[len(timings) // 2]
+    return {
+        "engine": name,
+        "model_size": model_size,
+        "audio_seconds": round(duration, 2),
+        "load_seconds": round(load_seconds, 2),
+        "median_seconds": round(median, 3),
+        "rtf": round(median / duration, 3) if duration else None,
+        "model_rss_mb": round(rss_loaded - rss_before, 1) if rss_before is not None else None,
+        "peak_rss_mb": round(_rss_mb(), 1) if rss_before is not None else None,
+        "text": text[:80],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark STT engines (RTF and memory).")
+    parser.add_argument("--audio", help="Audio file to transcribe (default: generated sample clip)")
+    parser.add_argument("--engines", nargs="+", default=list(stt_service.ENGINES))
+    parser.add_argument("--model-size", default=stt_service.STT_MODEL_SIZE)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    audio_path = args.audio or _make_sample_clip()
+
+    if args.child:
+        print(json.dumps(run_engine(args.engines[0], audio_path, args.model_size, args.runs)))
+        return
+
+    results = []
+    for name in args.engines:
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--child",
+            "--audio", audio_path, "--engines", name,
+            "--model-size", args.model_size, "--runs", str(args.runs),
+        ]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{name}: failed\n{proc.stderr.strip()[-500:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'engine':<16}{'model':<8}{'audio s':>9}{'load s':>9}{'infer s':>9}{'RTF':>8}{'model MB':>10}{'peak MB':>9}")
+    for r in results:
+        print(
+            f"{r['engine']:<16}{r['model_size']:<8}{r['audio_seconds']:>9}{r['load_seconds']:>9}"
+            f"{r['median_seconds']:>9}{r['rtf']:>8}{r['model_rss_mb']!s:>10}{r['peak_rss_mb']!s:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
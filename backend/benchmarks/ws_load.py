@@ -0,0 +1,458 @@
+# WebSocket load test
+# Opens N concurrent /ws/chat/{client_id} connections and drives text turns
+# (text_input) and voice turns (streamed audio chunks + transcribe_request).
+# Reports throughput, time to first text, time to first audio and turn
+# latency (p50/p95/p99), plus the server's own per-stage timings.
+#
+# By default the server runs in a child process against deterministic fakes,
+# so the test works offline and runs compare with each other:
+# - agent: a fake runner that calls the real price and chain-stats tools, then
+#   streams a canned reply token by token (sessions use the real session store)
+# - HTTP: the tools' shared client answers from canned CoinMarketCap and
+#   Blockchair payloads after a fixed latency
+# - STT / TTS: fixed-latency engines; recordings are decoded by ffmpeg when it
+#   is installed, by a fake decoder otherwise (recorded in the results)
+# Everything between the socket and those fakes is the real server code.
+#
+# Usage (from backend/):
+#   python benchmarks/ws_load.py                          # 20 connections x 5 turns, text + voice
+#   python benchmarks/ws_load.py --connections 50 --flows text
+#   python benchmarks/ws_load.py --check                  # compare with the saved baseline (exit 1 on regression)
+#   python benchmarks/ws_load.py --save                   # record a new baseline
+#   python benchmarks/ws_load.py --url ws://localhost:8001   # a running server (no fakes)
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "ws_load.json")
+
+AUDIO_FRAME_HEADER = struct.Struct("!BBHI")  # Same layout as main.encode_audio_frame
+AUDIO_FRAME_FINAL = 0x01
+
+# Bytes per second of the fake recording (~Opus at 16 kbps)
+FAKE_AUDIO_BYTES_PER_SECOND = 2000
+
+
+# ---------------------------------------------------------
+# Server side (child process): the real app with fake models and upstreams
+# ---------------------------------------------------------
+def serve_fake(args):
+    # Before importing the app: no warm-up, no prefetch, nothing persistent or shared
+    os.environ.update({
+        "WARMUP_EAGER": "",
+        "MARKET_DATA_PREFETCH": "false",
+        "RAG_INGEST_ON_STARTUP": "false",
+        "TTS_CACHE_DIR": "",
+        "SESSION_DB_PATH": "",
+        "SHARED_STORE_URL": "",
+        "MODEL_HOST_ADDRESS": "",
+        "LOG_LEVEL": "WARNING",
+        "COINMARKETCAP_API_KEY": "load-test",
+        "COINMARKETCAP_URL": "https://coinmarketcap.invalid/v2/cryptocurrency/quotes/latest",
+        "BLOCKCHAIR_BASE_URL": "https://blockchair.invalid",
+    })
+    sys.path.insert(0, BACKEND_DIR)
+
+    import httpx
+    import uvicorn
+    from google.adk.events import Event
+    from google.genai import types
+
+    import crypto_tools
+    import http_client
+    import main
+    import session_store
+    import stt_service
+
+    async def fake_upstream(request):
+        await asyncio.sleep(args.http_ms / 1000)
+        if request.url.host == "coinmarketcap.invalid":
+            symbols = request.url.params["symbol"].split(",")
+            convert = request.url.params["convert"]
+            quote = {"price": 64250.5, "market_cap": 1.27e12, "volume_24h": 3.1e10,
+                     "percent_change_24h": 1.8, "last_updated": "2024-01-01T00:00:00Z"}
+            return httpx.Response(200, json={"data": {s: [{"quote": {convert: quote}}] for s in symbols}})
+        return httpx.Response(200, json={"data": {
+            "blocks": 830000, "transactions_24h": 412345, "average_transaction_fee_24h": 2.35,
+            "market_price_usd": 64250.5, "difficulty": 8.6e13, "hashrate_24h": "6.1e20",
+        }})
+
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+
+    class FakeSTTEngine(stt_service.STTEngine):
+        name = "fake"
+
+        def __init__(self):
+            self.count = 0
+
+        def transcribe_batch(self, segments):
+            time.sleep(args.stt_ms / 1000)
+            self.count += len(segments)
+            return [f"What is the bitcoin price, question {self.count + i}" for i in range(len(segments))]
+
+    class FakeTTS:
+        async def stream(self, text, audio_format="wav"):
+            await asyncio.sleep(args.tts_ms_per_char * len(text) / 1000)
+            audio = b"\0" * (len(text) * 200)
+            if audio_format == "wav":
+                yield audio
+            else:
+                for start in range(0, len(audio), 4000):
+                    yield audio[start:start + 4000]
+
+    class FakeDecoder:
+        """Stands in for the ffmpeg decoder: each encoded byte becomes 8 samples, a tone for non-zero bytes."""
+
+        def __init__(self, max_seconds=stt_service.MAX_UTTERANCE_SECONDS):
+            self.pcm = stt_service.PCMRingBuffer(max_seconds)
+            self.bytes_received = 0
+
+        def feed(self, chunk):
+            import numpy as np
+            self.bytes_received += len(chunk)
+            voiced = np.repeat(np.frombuffer(bytes(chunk), dtype=np.uint8) != 0, 8)
+            tone = 0.2 * np.sin(np.arange(len(voiced)) * (2 * np.pi * 220 / stt_service.SAMPLE_RATE))
+            self.pcm.append((tone * voiced).astype(np.float32))
+
+        def finish(self, timeout=10.0):
+            return self.pcm.tail()
+
+        def close(self):
+            pass
+
+    class FakeRunner:
+        """Answers every message the same way, after the same delays."""
+
+        def __init__(self):
+            self.session_service = session_store.BoundedSessionService(db_path="")
+
+        async def run_async(self, user_id, session_id, new_message):
+            session = await self.session_service.get_session(
+                app_name="CryptoBackend", user_id=user_id, session_id=session_id)
+            await self.session_service.append_event(session, Event(author="user", content=new_message))
+
+            await asyncio.sleep(args.llm_first_token_ms / 1000)
+            price, stats = await asyncio.gather(
+                crypto_tools.get_crypto_price("BTC"), crypto_tools.get_chain_stats("bitcoin"))
+            reply = (
+                f"You asked: {new_message.parts[0].text}. "
+                f"Bitcoin is trading at ${price.get('price', 0):,.2f}. "
+                f"The network processed {stats.get('transactions_24h', 0):,} transactions in the last day. "
+                f"Average fees are about ${stats.get('average_transaction_fee_24h_usd', 0):.2f} per transaction."
+            )
+            for i, word in enumerate(reply.split(" ")):
+                await asyncio.sleep(args.llm_token_ms / 1000)
+                token = word if i == 0 else " " + word
+                yield Event(author="crypto_agent", partial=True,
+                            content=types.Content(role="model", parts=[types.Part(text=token)]))
+            await self.session_service.append_event(session, Event(
+                author="crypto_agent", content=types.Content(role="model", parts=[types.Part(text=reply)])))
+
+    main.tts_pool = FakeTTS()
+    main.warmup_manager.register("tts", lambda: None)
+    main.warmup_manager.register("stt", FakeSTTEngine)
+    main.warmup_manager.register("agent", FakeRunner)
+    if not shutil.which(stt_service.FFMPEG_BINARY):
+        stt_service.StreamingDecoder = FakeDecoder
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ---------------------------------------------------------
+# Client side
+# ---------------------------------------------------------
+def make_recording(seconds):
+    """An encoded recording to stream: WebM/Opus from ffmpeg, or filler bytes for the fake decoder."""
+    if not shutil.which("ffmpeg"):
+        # Two thirds "speech" (non-zero bytes) then trailing silence, as a user would leave it
+        size = int(seconds * FAKE_AUDIO_BYTES_PER_SECOND)
+        return b"\x01" * (size * 2 // 3) + b"\0" * (size - size * 2 // 3), "fake"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "clip.webm")
+        subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+             "-i", f"sine=frequency=220:duration={seconds}", "-ac", "1", "-c:a", "libopus", "-b:a", "16k", path],
+            check=True,
+        )
+        with open(path, "rb") as f:
+            return f.read(), "ffmpeg"
+
+
+class Results:
+    def __init__(self):
+        self.samples = {}  # (flow, metric) -> [seconds]
+        self.turns = 0
+        self.errors = []
+
+    def add(self, flow, metric, seconds):
+        if seconds is not None:
+            self.samples.setdefault((flow, metric), []).append(seconds)
+
+
+def _summary(values):
+    values = sorted(values)
+
+    def pct(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 1),
+        "p50_ms": round(1000 * pct(0.50), 1),
+        "p95_ms": round(1000 * pct(0.95), 1),
+        "p99_ms": round(1000 * pct(0.99), 1),
+    }
+
+
+async def _receive(ws, timeout):
+    message = await asyncio.wait_for(ws.recv(), timeout)
+    if isinstance(message, bytes):
+        return "audio", AUDIO_FRAME_HEADER.unpack_from(message)[1]
+    data = json.loads(message)
+    if data.get("type") == "error":
+        raise RuntimeError(data.get("message"))
+    return data.get("type"), data
+
+
+async def text_turn(ws, results, question, timeout):
+    started = time.perf_counter()
+    await ws.send(json.dumps({"type": "text_input", "text": question}))
+    first_text = None
+    while True:
+        kind, _ = await _receive(ws, timeout)
+        now = time.perf_counter() - started
+        if kind == "response.text_partial" and first_text is None:
+            first_text = now
+        elif kind == "response.text":
+            results.add("text", "time_to_first_text", first_text)
+            results.add("text", "turn_latency", now)
+            return
+
+
+async def voice_turn(ws, results, recording, chunk_bytes, chunk_seconds, timeout):
+    for start in range(0, len(recording), chunk_bytes):
+        await ws.send(recording[start:start + chunk_bytes])
+        if chunk_seconds:
+            await asyncio.sleep(chunk_seconds)  # Microphone pace: lets partial transcripts run
+
+    started = time.perf_counter()
+    await ws.send(json.dumps({"type": "transcribe_request"}))
+    marks = {}
+    while True:
+        kind, data = await _receive(ws, timeout)
+        now = time.perf_counter() - started
+        if kind == "transcript":
+            marks.setdefault("transcript", now)
+        elif kind == "response.text_partial":
+            marks.setdefault("time_to_first_text", now)
+        elif kind == "audio":
+            marks.setdefault("time_to_first_audio", now)
+            if data & AUDIO_FRAME_FINAL:
+                for metric, seconds in marks.items():
+                    results.add("voice", metric, seconds)
+                results.add("voice", "turn_latency", now)
+                return
+
+
+async def run_connection(index, url, args, recording, results):
+    import websockets
+
+    flows = args.flows
+    chunk_bytes = max(1, int(len(recording) * args.chunk_ms / 1000 / args.audio_seconds))
+    chunk_seconds = args.chunk_ms / 1000 if args.realtime else 0
+    async with websockets.connect(f"{url}/ws/chat/load-{index}?audio=binary", max_size=None) as ws:
+        for turn in range(args.turns):
+            flow = flows[(index + turn) % len(flows)]
+            try:
+                if flow == "text":
+                    await text_turn(ws, results, f"What is the bitcoin price, question {index}-{turn}", args.timeout)
+                else:
+                    await voice_turn(ws, results, recording, chunk_bytes, chunk_seconds, args.timeout)
+                results.turns += 1
+            except Exception as e:
+                results.errors.append(f"{flow}: {type(e).__name__}: {e}")
+                return
+
+
+async def run_load(url, args, recording):
+    results = Results()
+    # Connections start staggered over --ramp-seconds, like users arriving
+    async def start(index):
+        await asyncio.sleep(args.ramp_seconds * index / max(1, args.connections))
+        await run_connection(index, url, args, recording, results)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start(i) for i in range(args.connections)))
+    return results, time.perf_counter() - started
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_json(url, timeout=2.0):
+    import httpx
+    return httpx.get(url, timeout=timeout).json()
+
+
+def start_fake_server(args, log):
+    port = _free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve-fake", "--port", str(port)]
+    for name in ("llm_first_token_ms", "llm_token_ms", "http_ms", "stt_ms", "tts_ms_per_char"):
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=log, stderr=log)
+
+    deadline = time.time() + 60  # google.adk alone takes a few seconds to import
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            _get_json(f"http://127.0.0.1:{port}/")
+            return process, port
+        except Exception:
+            time.sleep(0.2)
+    process.kill()
+    log.seek(0)
+    sys.exit(f"Fake server did not start:\n{log.read().decode(errors='replace')[-2000:]}")
+
+
+def report(args, results, wall_seconds, decoder, server_stats):
+    config = {name: getattr(args, name) for name in (
+        "connections", "turns", "flows", "audio_seconds", "chunk_ms", "realtime",
+        "llm_first_token_ms", "llm_token_ms", "http_ms", "stt_ms", "tts_ms_per_char",
+    )}
+    result = {
+        "config": config,
+        "python": sys.version.split()[0],
+        "target": args.url or "fake",
+        "decoder": decoder,
+        "wall_seconds": round(wall_seconds, 2),
+        "turns": results.turns,
+        "errors": len(results.errors),
+        "throughput_turns_per_second": round(results.turns / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+    for (flow, metric), values in sorted(results.samples.items()):
+        result.setdefault(flow, {})[metric] = _summary(values)
+    if server_stats:
+        # The server's own view: where the time went inside each turn
+        result["server_stages"] = {
+            key: {"count": h["count"], "p50_ms": round(1000 * h["p50"], 1), "p95_ms": round(1000 * h["p95"], 1)}
+            for key, h in sorted(server_stats.get("histograms", {}).items())
+            if key.startswith("turn_stage_seconds")
+        }
+    return result
+
+
+def check(result, baseline, tolerance):
+    """Returns a list of regressions (empty = pass)."""
+    if result["config"] != baseline["config"] or result["decoder"] != baseline["decoder"]:
+        return ["configuration differs from the baseline; run with --save or the same options"]
+    problems = []
+    if result["errors"]:
+        problems.append(f"{result['errors']} connections failed")
+    for flow in ("text", "voice"):
+        for metric, summary in baseline.get(flow, {}).items():
+            current = result.get(flow, {}).get(metric)
+            if current is None:
+                problems.append(f"{flow} {metric}: no samples")
+                continue
+            limit = summary["p95_ms"] * (1 + tolerance)
+            if current["p95_ms"] > limit:
+                problems.append(f"{flow} {metric} p95 {current['p95_ms']}ms, baseline {summary['p95_ms']}ms "
+                                f"(limit {limit:.1f}ms)")
+    floor = baseline["throughput_turns_per_second"] * (1 - tolerance)
+    if result["throughput_turns_per_second"] < floor:
+        problems.append(f"throughput {result['throughput_turns_per_second']} turns/s, baseline "
+                        f"{baseline['throughput_turns_per_second']} (floor {floor:.2f})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the /ws/chat WebSocket endpoint.")
+    parser.add_argument("--url", default="", help="ws://host:port of a running server (default: in-process fakes)")
+    parser.add_argument("--connections", type=int, default=20, help="Concurrent WebSocket connections")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per connection")
+    parser.add_argument("--flows", default="text,voice", help="Turn types, cycled per connection: text, voice")
+    parser.add_argument("--ramp-seconds", type=float, default=1.0, help="Spread connection starts over this long")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Max seconds to wait for any server message")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="Length of each voice recording")
+    parser.add_argument("--chunk-ms", type=int, default=250, help="Recording chunk size (MediaRecorder timeslice)")
+    parser.add_argument("--no-realtime", dest="realtime", action="store_false",
+                        help="Send recordings as fast as possible instead of at microphone pace")
+    # Fake latencies (ignored with --url)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=10)
+    parser.add_argument("--http-ms", type=float, default=80)
+    parser.add_argument("--stt-ms", type=float, default=150, help="Per STT batch")
+    parser.add_argument("--tts-ms-per-char", type=float, default=1.0)
+    parser.add_argument("--save", action="store_true", help=f"Write the result to {os.path.relpath(BASELINE_PATH, BACKEND_DIR)}")
+    parser.add_argument("--check", action="store_true", help="Fail on errors or a slowdown vs the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown vs baseline (0.5 = +50%%)")
+    parser.add_argument("--serve-fake", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+
+    if args.serve_fake:
+        serve_fake(args)
+        return
+    if set(args.flows) - {"text", "voice"}:
+        sys.exit("--flows takes text and/or voice")
+
+    recording, decoder = make_recording(args.audio_seconds)
+    process = None
+    with tempfile.TemporaryFile() as log:
+        if args.url:
+            url, decoder = args.url.rstrip("/"), "server"
+        else:
+            process, port = start_fake_server(args, log)
+            url = f"ws://127.0.0.1:{port}"
+        try:
+            results, wall_seconds = asyncio.run(run_load(url, args, recording))
+            try:
+                server_stats = _get_json(url.replace("ws", "http", 1) + "/stats")
+            except Exception:
+                server_stats = None
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(10)
+
+    result = report(args, results, wall_seconds, decoder, server_stats)
+    print(json.dumps(result, indent=2))
+    for error in results.errors[:10]:
+        print(f"ERROR: {error}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+
+    if args.check:
+        try:
+            with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except OSError:
+            sys.exit(f"No baseline at {BASELINE_PATH}; run with --save first")
+        problems = check(result, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
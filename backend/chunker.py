@@ -0,0 +1,220 @@
+# Structure-aware streaming chunker
+# Replaces fixed 1000-char slicing. Everything is a generator, so memory stays
+# flat however large the document is:
+#   iter_blocks(path)   -> paragraphs / headings, page by page (PDF) or line by line (TXT/MD)
+#   chunk_blocks(...)   -> chunks packed from whole sentences up to a token budget,
+#                          never crossing a heading, with sentence-level overlap
+# Each chunk records its page range, character offsets and section heading.
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+# all-MiniLM-L6-v2 truncates at 256 word pieces; our token estimate runs a bit low, so stay under it
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
+# Optional Hugging Face tokenizer for exact sizing (needs the `tokenizers` package),
+# e.g. sentence-transformers/all-MiniLM-L6-v2. Empty = fast word/punctuation estimate.
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+# Stored in the ingest manifest; bump when chunk boundaries change so files get re-indexed
+CHUNKER_VERSION = "2"
+
+# Group 1 = closing quotes/brackets that still belong to the sentence
+_SENTENCE_END = re.compile(r"(?<=[.!?])([\"')\]]*)\s+(?=[\"'(\[]?[A-Z0-9])")
+_MARKDOWN_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class Block:
+    text: str
+    offset: int                  # Character offset in the document
+    page: Optional[int] = None   # 1-based, PDFs only
+    heading: bool = False
+
+
+@dataclass
+class Chunk:
+    text: str
+    char_start: int
+    char_end: int
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    heading: Optional[str] = None
+
+    def metadata(self):
+        """Chroma metadata values can't be None, so absent fields are left out."""
+        meta = {"char_start": self.char_start, "char_end": self.char_end}
+        if self.page_start is not None:
+            meta["page_start"] = self.page_start
+            meta["page_end"] = self.page_end
+        if self.heading:
+            meta["heading"] = self.heading
+        return meta
+
+
+# ---------------------------------------------------------
+# Token counting
+# ---------------------------------------------------------
+def _estimate_tokens(text):
+    return len(_TOKEN.findall(text))
+
+
+def make_token_counter(tokenizer_name=CHUNK_TOKENIZER):
+    """Returns count(text) -> int; exact when a tokenizer is configured and installed."""
+    if tokenizer_name:
+        try:
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_pretrained(tokenizer_name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+        except Exception as e:
+            print(f"Chunker: tokenizer '{tokenizer_name}' unavailable ({e}); estimating tokens")
+    return _estimate_tokens
+
+
+# ---------------------------------------------------------
+# Reading
+# ---------------------------------------------------------
+def _join_lines(lines):
+    # Line breaks become spaces one-for-one so offsets inside the block stay exact
+    return "".join(lines).replace("\r", " ").replace("\n", " ").rstrip()
+
+
+def _paragraph_blocks(lines, offset, page=None, markdown=False):
+    """Groups lines into paragraph blocks; markdown headings become their own blocks."""
+    paragraph, start = [], offset
+    for line in lines:
+        heading = _MARKDOWN_HEADING.match(line) if markdown else None
+        if heading or not line.strip():
+            if paragraph:
+                yield Block(_join_lines(paragraph), start, page)
+                paragraph = []
+            if heading:
+                yield Block(heading.group(1), offset, page, heading=True)
+        else:
+            if not paragraph:
+                start = offset
+            paragraph.append(line)
+        offset += len(line)
+    if paragraph:
+        yield Block(_join_lines(paragraph), start, page)
+
+
+def iter_blocks(path):
+    """Streams a document as blocks without ever holding the whole text."""
+    if path.endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        offset = 0
+        for page_number, page in enumerate(reader.pages, start=1):
+            try:
+                text = page.extract_text() or ""
+            except Exception as e:
+                print(f"RAG: Error reading page {page_number} of {path}: {e}")
+                continue
+            lines = text.splitlines(keepends=True)
+            yield from _paragraph_blocks(lines, offset, page_number)
+            offset += len(text) + 1
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            # Plain-text notes in data/ use markdown headings too
+            yield from _paragraph_blocks(f, 0, markdown=True)
+
+
+# ---------------------------------------------------------
+# Chunking
+# ---------------------------------------------------------
+def _split_sentences(block):
+    """Yields (sentence, offset, page) for a block."""
+    text, start = block.text, 0
+    bounds = [(m.end(1), m.end()) for m in _SENTENCE_END.finditer(text)] + [(len(text), len(text))]
+    for end, next_start in bounds:
+        segment = text[start:end]
+        sentence = segment.strip()
+        if sentence:
+            lead = len(segment) - len(segment.lstrip())
+            yield sentence, block.offset + start + lead, block.page
+        start = next_start
+
+
+def _split_long(sentence, offset, page, max_tokens, count_tokens):
+    """Hard-splits a single sentence that is over budget on word boundaries."""
+    words = [(m.start(), m.end()) for m in re.finditer(r"\S+", sentence)]
+    first = 0
+    for i in range(1, len(words) + 1):
+        too_long = i < len(words) and count_tokens(sentence[words[first][0]:words[i][1]]) > max_tokens
+        if i == len(words) or too_long:
+            start, end = words[first][0], words[i - 1][1]
+            yield sentence[start:end], offset + start, page
+            first = i
+
+
+def chunk_blocks(blocks, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                 count_tokens=_estimate_tokens):
+    """Packs whole sentences into chunks of at most `max_tokens`; yields Chunk objects."""
+    heading = None
+    current = []   # [(sentence, offset, page, tokens)]
+    tokens = 0
+
+    def emit():
+        text = " ".join(" ".join(s.split()) for s, _, _, _ in current)
+        pages = [p for _, _, p, _ in current if p is not None]
+        last_sentence, last_offset = current[-1][0], current[-1][1]
+        return Chunk(
+            text=f"{heading}\n\n{text}" if heading else text,
+            char_start=current[0][1],
+            char_end=last_offset + len(last_sentence),
+            page_start=min(pages) if pages else None,
+            page_end=max(pages) if pages else None,
+            heading=heading,
+        )
+
+    for block in blocks:
+        if block.heading:
+            # Sections never share a chunk
+            if current:
+                yield emit()
+                current, tokens = [], 0
+            heading = block.text
+            continue
+
+        for sentence, offset, page in _split_sentences(block):
+            n = count_tokens(sentence)
+            pieces = [(sentence, offset, page)] if n <= max_tokens else \
+                _split_long(sentence, offset, page, max_tokens, count_tokens)
+            for piece, piece_offset, piece_page in pieces:
+                n = count_tokens(piece) if piece is not sentence else n
+                if current and tokens + n > max_tokens:
+                    yield emit()
+                    # Carry trailing sentences forward as overlap
+                    carried, carried_tokens = [], 0
+                    for item in reversed(current):
+                        if carried_tokens + item[3] > overlap_tokens or carried_tokens + item[3] + n > max_tokens:
+                            break
+                        carried.insert(0, item)
+                        carried_tokens += item[3]
+                    current, tokens = carried, carried_tokens
+                current.append((piece, piece_offset, piece_page, n))
+                tokens += n
+
+    if current:
+        yield emit()
+
+
+_default_counter = None
+
+
+def iter_chunks(path, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, count_tokens=None):
+    """Streams the chunks of one document."""
+    global _default_counter
+    if count_tokens is None:
+        if _default_counter is None:
+            _default_counter = make_token_counter()
+        count_tokens = _default_counter
+    return chunk_blocks(iter_blocks(path), max_tokens, overlap_tokens, count_tokens)
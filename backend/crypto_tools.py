@@ -0,0 +1,291 @@
+# Crypto data tools used by the agent
+# News (CryptoPanic), prices (CoinMarketCap) and network stats (Blockchair),
+# plus the caches and background prefetcher behind them.
+# Kept free of google.adk so the server (health check, /stats, prefetcher)
+# can start without loading the agent framework; agent.py wires these in.
+
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import http_client
+    import market_data
+    import quote_cache
+    import shared_store
+    import swr_cache
+except ImportError:
+    from . import http_client
+    from . import market_data
+    from . import quote_cache
+    from . import shared_store
+    from . import swr_cache
+
+# Tool results are shared between workers when SHARED_STORE_URL is set
+_tool_store = shared_store.get_store() if shared_store.is_shared() else None
+
+# Prefetched prices, news and chain stats (empty unless the prefetcher runs)
+market_snapshot = market_data.SnapshotStore()
+
+# -------------------------------
+# External Tool: CryptoPanic v2
+# -------------------------------
+# Tools are async and share one pooled HTTP client (see http_client.py),
+# so when the model asks for several tools in one turn ADK runs them concurrently.
+# Each tool answers from the prefetched market snapshot when it can (see market_data.py)
+# and otherwise calls its live _fetch_* function.
+async def _fetch_news(limit: int) -> dict:
+    
+    api_key = os.getenv("CRYPTOPANIC_API_KEY")
+    base_url = os.getenv("CRYPTOPANIC_URL")
+    
+    if not api_key or not base_url:
+        return {"status": "error", "message": "Missing CryptoPanic configuration"}
+
+    params = {
+        "auth_token": api_key,
+        "filter": "trending",   # 🔥 REQUIRED
+        "limit": limit,
+    }
+
+    try:
+        response = await http_client.get(base_url, params=params)
+
+        if response.status_code != 200:
+            return {
+                "status": "error",
+                "http_status": response.status_code,
+                "raw": response.text[:500],
+            }
+
+        data = response.json()
+        results = data.get("results", [])
+
+        if not results:
+            return {
+                "status": "error",
+                "reason": "empty_results",
+                "raw": data,
+            }
+
+        news = []
+        for item in results:
+            news.append({
+                "title": item.get("title"),
+                "source": item.get("source", {}).get("title"),
+                "url": item.get("url"),
+                "published_at": item.get("published_at"),
+            })
+
+        return {
+            "status": "success",
+            "news": news,
+            "fetched_at": time.time(),
+        }
+
+    except Exception as e:
+        return {
+            "status": "exception",
+            "error": str(e),
+        }
+
+
+async def get_crypto_news(limit: int = 5) -> dict:
+    snapshot = market_snapshot.get("news", None)
+    if snapshot is not None and len(snapshot["news"]) >= limit:
+        return {**snapshot, "news": snapshot["news"][:limit]}
+
+    result = await _fetch_news(limit)
+    return market_data.annotate(result, "live") if result.get("status") == "success" else result
+
+# -------------------------------
+# External Tool 2: CoinMarketCap (Prices)
+# -------------------------------
+async def _fetch_cmc_quotes(symbols: list, convert: str) -> dict:
+    """One CoinMarketCap call for several symbols; returns {symbol: tool result}."""
+    api_key = os.getenv("COINMARKETCAP_API_KEY")
+    base_url = os.getenv("COINMARKETCAP_URL")
+    
+    if not api_key or not base_url:
+        error = {"status": "error", "message": "Missing CoinMarketCap configuration"}
+        return {symbol: error for symbol in symbols}
+        
+    headers = {
+        "X-CMC_PRO_API_KEY": api_key,
+        "Accept": "application/json",
+    }
+    params = {
+        "symbol": ",".join(symbols),
+        "convert": convert,
+        "skip_invalid": "true",  # One unknown symbol must not fail the whole batch
+    }
+
+    response = await http_client.get(base_url, headers=headers, params=params)
+    if response.status_code != 200:
+        error = {
+            "status": "error",
+            "http_status": response.status_code,
+            "raw": response.text[:500],
+        }
+        return {symbol: error for symbol in symbols}
+
+    data = response.json().get("data") or {}
+    results = {}
+    for symbol in symbols:
+        coin_data = data.get(symbol)
+
+        if not coin_data:
+            results[symbol] = {"status": "error", "reason": "symbol_not_found"}
+            continue
+
+        quote = coin_data[0]["quote"][convert]
+
+        results[symbol] = {
+            "status": "success",
+            "symbol": symbol,
+            "price": quote["price"],
+            "market_cap": quote["market_cap"],
+            "volume_24h": quote["volume_24h"],
+            "percent_change_24h": quote["percent_change_24h"],
+            "last_updated": quote["last_updated"],
+            "fetched_at": time.time(),
+        }
+    return results
+
+
+# Shared across sessions: repeated and concurrent lookups hit CoinMarketCap once per TTL
+price_quotes = quote_cache.QuoteCache(_fetch_cmc_quotes, store=_tool_store)
+
+
+async def get_crypto_price(symbol: str, convert: str = "USD") -> dict:
+    snapshot = market_snapshot.get("price", (symbol.upper(), convert.upper()))
+    if snapshot is not None:
+        return snapshot
+
+    try:
+        result = await price_quotes.get(symbol, convert)
+    except Exception as e:
+        return {"status": "exception", "error": str(e)}
+    return market_data.annotate(result, "live") if result.get("status") == "success" else result
+
+
+
+# -------------------------------
+# External Tool 3: On-Chain Network Stats (Blockchair)
+# -------------------------------
+async def _fetch_chain_stats(chain: str) -> dict:
+    base_url = os.getenv("BLOCKCHAIR_BASE_URL")
+    api_key = os.getenv("BLOCKCHAIR_API_KEY")
+    
+    if not base_url:
+        # Fallback if env var missing, though ideally shouldn't happen if properly configured
+        base_url = "https://api.blockchair.com"
+        
+    url = f"{base_url}/{chain}/stats"
+    
+    params = {}
+    if api_key:
+        params["key"] = api_key
+    
+    try:
+        # Shared client: keep-alive, timeout and retries come from http_client
+        response = await http_client.get(url, params=params)
+        
+        if response.status_code != 200:
+            return {
+                "status": "error",
+                "http_status": response.status_code,
+                "chain": chain,
+                "message": "Failed to fetch stats. Chain might be unsupported.",
+                "raw": response.text[:200]
+            }
+
+        data = response.json()
+        
+        # Validation
+        if "data" not in data:
+             return {"status": "error", "message": "Invalid API response", "raw": str(data)[:200]}
+             
+        stats = data["data"]
+        
+        # Return a summarized, agent-friendly dict
+        return {
+            "status": "success",
+            "chain": chain,
+            "blocks": stats.get("blocks"),
+            "transactions_24h": stats.get("transactions_24h"),
+            "inflation_24h": stats.get("inflation_24h"), # In USD or raw
+            "average_transaction_fee_24h_usd": stats.get("average_transaction_fee_24h"), # Note: Blockchair labels vary, often avg_fee_24h
+            "market_price_usd": stats.get("market_price_usd"),
+            "market_price_change_24h": stats.get("market_price_change_24h_percentage"),
+            "difficulty": stats.get("difficulty"),
+            "hashrate_24h": stats.get("hashrate_24h"),
+            "best_block_time": stats.get("best_block_time"),
+            "fetched_at": time.time(),
+        }
+
+    except Exception as e:
+        return {"status": "exception", "error": str(e)}
+
+
+# Blockchair rate-limits aggressively: serve cached stats (stale if need be) instead of
+# making users wait out timeouts; the breaker stops calls while it is failing.
+CHAIN_STATS_FRESH_SECONDS = float(os.getenv("CHAIN_STATS_FRESH_SECONDS", "60"))
+CHAIN_STATS_MAX_STALE_SECONDS = float(os.getenv("CHAIN_STATS_MAX_STALE_SECONDS", "1800"))
+
+chain_stats = swr_cache.StaleWhileRevalidateCache(
+    "blockchair",
+    _fetch_chain_stats,
+    fresh_ttl=CHAIN_STATS_FRESH_SECONDS,
+    max_stale=CHAIN_STATS_MAX_STALE_SECONDS,
+    store=_tool_store,
+)
+
+
+async def get_chain_stats(chain: str = "bitcoin") -> dict:
+    """
+    Fetches real-time network statistics (transactions, difficulty, fee, etc.).
+    Supported chains: bitcoin, ethereum, litecoin, dogecoin, bitcoin-cash.
+    """
+    # Use lowercase for compatibility
+    chain = chain.lower()
+    
+    # Map common aliases if needed, though agent usually handles this
+    if chain == "eth": chain = "ethereum"
+    if chain == "btc": chain = "bitcoin"
+
+    snapshot = market_snapshot.get("chain", chain)
+    if snapshot is not None:
+        return snapshot
+
+    result = await chain_stats.get(chain)
+    # Cached or stale answers say so; as_of is the time of the fetch they came from
+    return market_data.annotate(result, result.get("source", "live")) if result.get("status") == "success" else result
+
+# You can ask the agent about Network Stats, Congestion, Gas/Fees, and Activity for the following supported chains:
+
+# Bitcoin (BTC)
+# Ethereum (ETH)
+# Litecoin (LTC)
+# Dogecoin (DOGE)
+# Bitcoin Cash (BCH)
+# Here are some specific examples of what you can ask:
+
+# "How active is Bitcoin right now?" (Checks transaction counts and blocks)
+# "Is the Ethereum network congested?" (Checks for high activity)
+# "What are the current transaction fees on Bitcoin?"
+# "Show me the network stats for Dogecoin."
+# "What is the current difficulty of the Litecoin network?"
+
+# -------------------------------
+# Market Data Snapshot
+# -------------------------------
+# Filled by the background prefetcher when MARKET_DATA_PREFETCH is on (started by main.py)
+market_prefetcher = market_data.MarketDataPrefetcher(
+    market_snapshot,
+    fetch_prices=_fetch_cmc_quotes,
+    fetch_news=_fetch_news,
+    fetch_chain=chain_stats.fetch,
+)
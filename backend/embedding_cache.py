@@ -0,0 +1,174 @@
+# Embedding cache
+# Chunk vectors are cached on disk keyed by (model id, sha256 of chunk text),
+# so re-ingests, index rebuilds and duplicate chunks skip the model entirely.
+# Layout per model: <cache_dir>/<model id>/
+#   vectors.f32 - float32 rows, read through a memory map
+#   keys.bin    - 32-byte sha256 digest per row, same order
+#   lock        - held while appending: several processes (server workers, the
+#                 rag_ingest CLI) may share one store
+# Misses are embedded in fixed-size batches to bound peak memory.
+
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+_DIGEST_SIZE = 32
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock between processes on `path` (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingStore:
+    """Append-only float32 vector store addressed by text digest."""
+
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._lock_path = os.path.join(path, "lock")
+        self._rows = {}
+        self._count = 0  # Rows in the files that this process has read
+        self._mmap = None
+        with _file_lock(self._lock_path):
+            self._sync()
+
+    def _sync(self):
+        """Reads rows appended since the last call. Call with the file lock held."""
+        try:
+            keys_bytes = os.path.getsize(self._keys_path)
+            vector_bytes = os.path.getsize(self._vectors_path)
+        except OSError:
+            keys_bytes = vector_bytes = 0
+
+        # An interrupted append can leave keys and vectors out of step: keep only complete rows
+        row_bytes = self.dim * 4
+        count = min(keys_bytes // _DIGEST_SIZE, vector_bytes // row_bytes)
+        for path, size in ((self._keys_path, count * _DIGEST_SIZE), (self._vectors_path, count * row_bytes)):
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+        if count > self._count:
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._count * _DIGEST_SIZE)
+                keys = f.read((count - self._count) * _DIGEST_SIZE)
+            for i in range(count - self._count):
+                self._rows[keys[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE]] = self._count + i
+        self._count = count
+
+    def _vectors(self):
+        if self._mmap is None or len(self._mmap) < self._count:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return self._mmap
+
+    def get_many(self, digests):
+        """Returns {digest: vector} for the digests that are cached."""
+        if not self._rows:
+            return {}
+        vectors = self._vectors()
+        return {d: np.array(vectors[self._rows[d]]) for d in digests if d in self._rows}
+
+    def put_many(self, digests, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with _file_lock(self._lock_path):
+            # Row numbers come from the files, which other processes may have appended to
+            self._sync()
+            with open(self._vectors_path, "ab") as f:
+                vectors.tofile(f)
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(digests))
+            for i, digest in enumerate(digests):
+                self._rows[digest] = self._count + i
+            self._count += len(digests)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class CachedEmbedder:
+    """
+    Embeds texts with `embed_fn` (a Chroma-style embedding function) behind an EmbeddingStore.
+
+    `dim` must match the model; the store for each model id lives in its own folder.
+    """
+
+    def __init__(self, embed_fn, model_id, dim, cache_dir, batch_size=EMBEDDING_BATCH_SIZE):
+        self._embed_fn = embed_fn
+        self.model_id = model_id
+        self.dim = dim
+        self.batch_size = batch_size
+        self.store = EmbeddingStore(os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_id)), dim)
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        """Returns a float32 array of shape (len(texts), dim)."""
+        digests = [text_digest(t) for t in texts]
+        with self._lock:
+            found = self.store.get_many(digests)
+
+            # Each distinct missing text is embedded once, even if repeated in `texts`
+            missing = {}
+            for digest, text in zip(digests, texts):
+                if digest not in found and digest not in missing:
+                    missing[digest] = text
+            metrics.inc("embedding_cache_hits_total", len(texts) - len(missing))
+            metrics.inc("embedding_cache_misses_total", len(missing))
+
+            missing_items = list(missing.items())
+            for i in range(0, len(missing_items), self.batch_size):
+                batch = missing_items[i:i + self.batch_size]
+                with metrics.timer("embedding_batch_seconds"):
+                    vectors = np.asarray(self._embed_fn([text for _, text in batch]), dtype=np.float32)
+                batch_digests = [digest for digest, _ in batch]
+                self.store.put_many(batch_digests, vectors)
+                found.update(zip(batch_digests, vectors))
+
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, digest in enumerate(digests):
+            result[row] = found[digest]
+        return result
+
+    def embed_query(self, text):
+        """Embeds one query without storing it (queries rarely repeat verbatim across restarts)."""
+        return np.asarray(self._embed_fn([text]), dtype=np.float32)[0]
@@ -0,0 +1,113 @@
+# Shared async HTTP client for the agent's data tools
+# One pooled httpx.AsyncClient per process: keep-alive connections are reused
+# across tool calls instead of a fresh TCP+TLS handshake each time.
+# - HTTP/2 when the `h2` package is installed (falls back to HTTP/1.1)
+# - Per-host concurrency limit so one slow API can't take every connection
+# - Retries on connection errors and 5xx with jittered exponential backoff (429 goes straight back)
+
+import asyncio
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+try:
+    import h2  # noqa: F401  (only needed so httpx can negotiate HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.25"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "4"))
+
+# 429 is not retried: sleeping out a rate limit here would hold the caller, while
+# the SWR cache can answer from its stale copy and the breaker can back off
+RETRY_STATUSES = {500, 502, 503, 504}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout,
+                    httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+_client = None
+_host_limits = {}
+
+
+def get_client():
+    """Returns the shared client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
+
+
+def _host_limit(host):
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return limit
+
+
+def _backoff(attempt, response=None):
+    """Full-jitter exponential backoff; honours Retry-After (in seconds) when given."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+async def get(url, params=None, headers=None, retries=HTTP_RETRIES):
+    """
+    GET through the shared client.
+    Returns the final httpx.Response (which may still be an error status);
+    raises the last transport error once retries are exhausted.
+    """
+    host = urlsplit(url).netloc
+    client = get_client()
+
+    for attempt in range(retries + 1):
+        response = None
+        started = time.perf_counter()
+        try:
+            async with _host_limit(host):
+                response = await client.get(url, params=params, headers=headers)
+        except RETRY_EXCEPTIONS as e:
+            metrics.inc("http_requests_total", host=host, status=type(e).__name__)
+            if attempt == retries:
+                raise
+        else:
+            metrics.inc("http_requests_total", host=host, status=response.status_code)
+            metrics.observe("http_request_seconds", time.perf_counter() - started, host=host)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+
+        metrics.inc("http_retries_total", host=host)
+        await asyncio.sleep(_backoff(attempt, response))
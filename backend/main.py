@@ -1,9 +1,21 @@
 import os
 import asyncio
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# LOG_LEVEL=DEBUG logs every agent event; INFO logs one timing line per turn
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+log = logging.getLogger("cryptoai")
+log.setLevel(LOG_LEVEL)
+if not log.handlers:
+    # Our own handler: library loggers (httpx, google) keep their defaults
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    log.addHandler(_log_handler)
+    log.propagate = False
+
 # Add FFmpeg to PATH (installed via Winget)
 ffmpeg_path = r"C:\Users\rites\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-full_build\bin"
 if os.path.exists(ffmpeg_path):
@@ -11,16 +23,32 @@ if os.path.exists(ffmpeg_path):
 
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
-import pyttsx3 # Add import
 import shutil
-from agent import root_agent
+from contextlib import asynccontextmanager
+# Only light modules at import time: google.adk, chromadb, Whisper and the TTS
+# engines load during background warm-up or on first use (see warmup.py)
+try:
+    from crypto_tools import market_prefetcher
+except ImportError:
+    from .crypto_tools import market_prefetcher
 
-app = FastAPI(title="CryptoAI Backend")
+@asynccontextmanager
+async def lifespan(app):
+    # Background market data refresh is opt-in (MARKET_DATA_PREFETCH=true)
+    if market_data.MARKET_DATA_PREFETCH:
+        market_prefetcher.start()
+    # Heavy models load in the background; /ready reports when they're up
+    warmup_manager.start()
+    yield
+    await warmup_manager.stop()
+    await market_prefetcher.stop()
+    await http_client.aclose()
+    await shared_store.aclose()
+
+app = FastAPI(title="CryptoAI Backend", lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -31,131 +59,420 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize ADK Services
-session_service = InMemorySessionService()
-artifact_service = InMemoryArtifactService()
-
-# Initialize Runner
-# adk web runs automatically, but for Custom API we need manual runner
-runner = Runner(
-    agent=root_agent,
-    app_name="CryptoBackend",
-    session_service=session_service,
-    artifact_service=artifact_service
-)
-
-from google.genai import types
 try:
     import rag_service
 except ImportError:
     from . import rag_service
 
+try:
+    import stt_service
+except ImportError:
+    from . import stt_service
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+try:
+    import tts_service
+except ImportError:
+    from . import tts_service
+
+try:
+    import tts_cache
+except ImportError:
+    from . import tts_cache
+
+try:
+    import http_client
+except ImportError:
+    from . import http_client
+
+try:
+    import market_data
+except ImportError:
+    from . import market_data
+
+try:
+    import warmup
+except ImportError:
+    from . import warmup
+
+try:
+    import model_host
+except ImportError:
+    from . import model_host
+
+try:
+    import shared_store
+except ImportError:
+    from . import shared_store
+
 # Initialize RAG (Vector DB)
-# Initialize RAG (Vector DB)
-# Lazy load instead of global init to save memory on 512MB instances
-# rag_service.initialize_rag()
+# Warmed in the background at startup (WARMUP_EAGER), or lazily on the first
+# search to save memory on 512MB instances
+warmup_manager = warmup.WarmupManager()
+warmup_manager.register("rag", rag_service.warm_up, loaded=rag_service.is_ready)
+
+# Initialize ADK Services + Runner
+# google.adk takes seconds to import, so the agent is built by the warm-up
+# manager (or by the first message), never at import time
+def _load_runner():
+    from google.adk.runners import Runner
+    from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
+    try:
+        from agent import root_agent
+        import session_store
+    except ImportError:
+        from .agent import root_agent
+        from . import session_store
+
+    # adk web runs automatically, but for Custom API we need manual runner
+    return Runner(
+        agent=root_agent,
+        app_name="CryptoBackend",
+        # Bounded LRU/TTL sessions, optionally persisted to SQLite (see session_store.py)
+        session_service=session_store.BoundedSessionService(),
+        artifact_service=InMemoryArtifactService()
+    )
+
+warmup_manager.register("agent", _load_runner)
+
+def user_message(text):
+    from google.genai import types
+    return types.Content(role="user", parts=[types.Part(text=text)])
 
 @app.get("/")
 def health_check():
-    return {"status": "ok", "agent": root_agent.name}
+    # Never waits on warm-up: the process is alive even while models load
+    agent = warmup_manager.components["agent"]
+    return {
+        "status": "ok",
+        "agent": agent.value.agent.name if agent.ready else None,
+        "ready": warmup_manager.ready,
+    }
+
+@app.get("/ready")
+def readiness():
+    status = warmup_manager.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/stats")
+def stats():
+    agent = warmup_manager.components["agent"]
+    return {
+        **metrics.snapshot(),
+        "tts_cache": speech_cache.stats(),
+        "market_data": market_prefetcher.store.stats(),
+        "rag_cache": rag_service.cache_stats(),
+        "sessions": agent.value.session_service.stats() if agent.ready else None,
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # Per-process: with several workers, scrape each one (or aggregate in Prometheus)
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 # --- Voice Integration ---
-import whisper
 import shutil
-import tempfile
 from fastapi import WebSocket, WebSocketDisconnect
 import base64
 import json
 import re
+import struct
 import time
-import pyttsx3
-try:
-    import pythoncom  # Required for threading on Windows
-except ImportError:
-    pythoncom = None
 
-# Load Whisper model (lazy load or on startup)
-# Using "tiny" model for maximum speed.
-# Load Whisper model (lazy load or on startup)
-# Using "tiny" model for maximum speed.
-# audio_model = whisper.load_model("tiny")
-_audio_model_cache = None
+# Load STT engine (lazy load or on startup)
+# Engine and model size come from config (STT_ENGINE / STT_MODEL_SIZE).
+# Default is Whisper "tiny"; STT_ENGINE=faster-whisper runs int8 for 512MB instances.
+def _load_audio_model():
+    if model_host.enabled():
+        # One copy per machine, in the model host (see model_host.py)
+        model = model_host.RemoteSTTEngine()
+        print(f"STT engine: model host pid {model.host['pid']} ({model.host['stt_engine']}).")
+        return model
+    print(f"Loading STT engine: {stt_service.STT_ENGINE} / {stt_service.STT_MODEL_SIZE}...")
+    model = stt_service.create_engine()
+    print("STT engine loaded.")
+    return model
+
+warmup_manager.register("stt", _load_audio_model)
 
 def get_audio_model():
-    global _audio_model_cache
-    if _audio_model_cache is None:
-        print("Loading Whisper model (Lazy)...")
-        _audio_model_cache = whisper.load_model("tiny")
-        print("Whisper model loaded.")
-    return _audio_model_cache
-
-
-def generate_voice(text, output_file):
-    # Initialize engine in the thread
-    if pythoncom:
-        pythoncom.CoInitialize()
-    try:
-        engine = pyttsx3.init()
-        # Optional: Set properties (rate, volume, voice)
-        engine.setProperty('rate', 175) # Speed up a bit
-        
-        # Select a nice voice if available (e.g., Zira on Windows)
-        voices = engine.getProperty('voices')
-        for voice in voices:
-            if "Zira" in voice.name:
-                engine.setProperty('voice', voice.id)
-                break
-                
-        engine.save_to_file(text, output_file)
-        engine.runAndWait()
-    finally:
-        if pythoncom:
-            pythoncom.CoUninitialize()
+    # Loaded once, under a lock, however many sessions ask at the same time
+    return warmup_manager.ensure("stt")
+
+# Shared STT worker: batches segments from every session into one forward pass
+stt_inference = stt_service.STTInferenceService(get_audio_model)
+
+
+# TTS: long-lived worker processes, each with one initialized engine (voice resolved once)
+tts_pool = tts_service.TTSWorkerPool()
+warmup_manager.register("tts", tts_pool.wait_ready, loaded=lambda: tts_pool.ready)
+
+# Repeated sentences (boilerplate, failure messages, headlines) skip synthesis
+speech_cache = tts_cache.TTSCache(voice=tts_service.TTS_VOICE, rate=tts_service.TTS_RATE)
+
+def stream_speech(text, audio_format):
+    return speech_cache.stream(text, audio_format, tts_pool.stream)
 
 # --- WebSocket Streaming ---
 
+# Binary audio frames (opt-in with ?audio=binary on the WebSocket URL)
+# 8-byte big-endian header, then the raw audio bytes:
+#   version (u8) | flags (u8) | chunk seq within the sentence (u16) | sentence index (u32)
+#   flags: bit 0 = final chunk of the reply, bit 1 = last chunk of this sentence
+# (the final chunk may carry no audio: it only marks the end of the reply)
+# Text events stay JSON; clients that don't opt in keep base64-in-JSON audio.
+AUDIO_FRAME_HEADER = struct.Struct("!BBHI")
+AUDIO_FRAME_VERSION = 1
+AUDIO_FRAME_FINAL = 0x01
+AUDIO_FRAME_LAST = 0x02
+
+# Every MediaRecorder recording starts with this EBML header
+WEBM_MAGIC = b"\x1a\x45\xdf\xa3"
+
+def encode_audio_frame(index, seq, last, final, audio):
+    flags = (AUDIO_FRAME_FINAL if final else 0) | (AUDIO_FRAME_LAST if last else 0)
+    return AUDIO_FRAME_HEADER.pack(AUDIO_FRAME_VERSION, flags, seq & 0xFFFF, index) + audio
+
 @app.websocket("/ws/chat/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await websocket.accept()
     print(f"Client {client_id} connected")
     
-    # Audio buffer for STT
-    audio_buffer = bytearray()
+    # Negotiate audio transport (saves ~33% bandwidth and base64 CPU on both ends)
+    binary_audio = websocket.query_params.get("audio") == "binary"
+    # ...and audio format: "wav" (one file per sentence) or "opus" (WebM/Opus streamed in small chunks)
+    audio_format = websocket.query_params.get("audio_format", "wav")
+    if audio_format not in tts_service.AUDIO_FORMATS:
+        audio_format = "wav"
+    if binary_audio or audio_format != "wav":
+        await websocket.send_json({
+            "type": "session.config",
+            "audio": "binary" if binary_audio else "json",
+            "audio_format": audio_format,
+            "version": AUDIO_FRAME_VERSION,
+        })
+    
+    # Streaming decoder for STT (one ffmpeg process per recording)
+    stt_stream = None
+    # Server-side end of utterance (STT_VAD_ENDPOINT_MS > 0), one per recording
+    endpointer = None
+    # After speech.end the client restarts its recorder; chunks of the old one still in flight are dropped
+    await_header = False
     last_transcribe_time = time.time()
     
+    # Stage timings of the turn in progress (turn_stage_seconds on /metrics)
+    turn = None
+    
+    def record_send(started):
+        seconds = time.perf_counter() - started
+        if turn is not None:
+            turn.record("ws_send", seconds)
+        else:
+            metrics.observe("ws_send_seconds", seconds)
+    
+    async def send_json(payload):
+        started = time.perf_counter()
+        await websocket.send_json(payload)
+        record_send(started)
+    
+    def finish_turn():
+        nonlocal turn
+        if turn is not None:
+            durations = turn.finish()
+            if log.isEnabledFor(logging.INFO):
+                log.info("turn client=%s mode=%s %s", client_id, turn.labels["mode"], durations)
+            turn = None
+    
+    async def send_partial(text):
+        await send_json({"type": "transcript_partial", "text": text})
+    
+    async def run_voice_turn():
+        """Transcribes the finished recording and streams the reply (text + speech)."""
+        nonlocal stt_stream, turn
+        if stt_stream is None:
+            return
+        
+        speech = None
+        turn = metrics.Span("turn_stage_seconds", mode="voice")
+        
+        # Transcribe
+        try:
+            # Flush the decoder to get the whole recording as float32 PCM
+            with turn.stage("stt_decode"):
+                audio = await asyncio.to_thread(stt_stream.finish)
+            
+            # Only the speech goes to the model; silent recordings skip it entirely
+            with turn.stage("vad"):
+                audio = stt_service.trim_silence(audio)
+            if audio.size == 0:
+                log.debug("silent recording client=%s", client_id)
+                return
+            
+            # Shared batched worker (forced to English to prevent random language hallucinations)
+            with turn.stage("stt"):
+                user_text = await stt_inference.transcribe(audio)
+            
+            # Hallucination Filtering
+            # Common phrases Whisper outputs on silence
+            hallucinations = [
+                "Thank you for watching", "Subtitle by", "Amara.org", "MBC", 
+                "Copyright", "All rights reserverd", "Unidentified", "The end"
+            ]
+            
+            is_hallucination = any(h.lower() in user_text.lower() for h in hallucinations)
+            
+            # Validation: Ignore empty, short, or blacklisted input
+            if not user_text or len(user_text) < 2 or is_hallucination:
+                print(f"Ignored invalid transcription: '{user_text}'")
+                return
+            
+            # Send Transcript back
+            await send_json({"type": "transcript", "text": user_text})
+            
+            # Agent Processing and Streaming Response
+            response_text = ""
+            sentence_buffer = ""
+            
+            # Check session
+            runner = await warmup_manager.aensure("agent")
+            with turn.stage("session_lookup"):
+                session = await runner.session_service.get_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
+                if not session:
+                    await runner.session_service.create_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
+
+            async def send_audio(index, seq, audio_chunk, last, final):
+                if binary_audio:
+                    started = time.perf_counter()
+                    await websocket.send_bytes(encode_audio_frame(index, seq, last, final, audio_chunk))
+                    record_send(started)
+                    return
+                b64_audio = base64.b64encode(audio_chunk).decode('utf-8')
+                await send_json({
+                    "type": "response.audio", 
+                    "data": b64_audio, 
+                    "index": index,
+                    "seq": seq,
+                    "last": last,
+                    "format": audio_format,
+                    "final": final
+                })
+            
+            # Sentences are synthesized in parallel while the LLM keeps streaming,
+            # and their audio is sent in order as it becomes ready
+            speech = tts_service.SpeechPipeline(lambda text: stream_speech(text, audio_format), send_audio)
+            
+            agent_started = time.perf_counter()
+            async for event in runner.run_async(
+                user_id="user",
+                session_id=client_id,
+                new_message=user_message(user_text)
+            ):
+                  # Robust Event Parsing
+                  chunk_text = ""
+                  if hasattr(event, 'text') and event.text:
+                      chunk_text = event.text
+                  elif hasattr(event, 'content') and event.content:
+                      if hasattr(event.content, 'parts'):
+                          for part in event.content.parts:
+                              if hasattr(part, 'text') and part.text:
+                                  chunk_text += part.text
+                      elif hasattr(event.content, 'text') and event.content.text:
+                          chunk_text = event.content.text
+                  
+                  if chunk_text:
+                      turn.mark("llm_first_token", since=agent_started)
+                      log.debug("agent chunk client=%s text=%r", client_id, chunk_text)
+                      response_text += chunk_text
+                      sentence_buffer += chunk_text
+                      await send_json({"type": "response.text_partial", "text": chunk_text})
+                      
+                      # Check for sentence delimiters
+                      # Simple regex for . ! ? followed by space or end
+                      # We use non-consuming lookbehind to avoid eating the punctuation
+                      with turn.stage("sentence_detection"):
+                          sentences = re.split(r'(?<=[.!?])\s+', sentence_buffer)
+                      
+                      # If we have more than 1 part, the first parts are complete sentences
+                      if len(sentences) > 1:
+                          # Process all except the last incomplete buffer
+                          complete_sentences = sentences[:-1]
+                          sentence_buffer = sentences[-1] # Keep the rest
+                          
+                          for sentence in complete_sentences:
+                              if not sentence.strip(): continue
+                              
+                              # Queue Audio for sentence (doesn't wait for synthesis)
+                              speech.submit(sentence)
+
+            turn.record("agent", time.perf_counter() - agent_started)
+            
+            # Send Final Text
+            await send_json({"type": "response.text", "text": response_text})
+            
+            # Process any remaining buffer as the final sentence
+            if sentence_buffer.strip():
+                speech.submit(sentence_buffer, final=True)
+            
+            # Wait for the remaining audio to go out (synthesis itself: tts_synthesis_seconds)
+            with turn.stage("tts_drain"):
+                await speech.close()
+
+        except Exception as e:
+            print(f"Error processing: {e}")
+            await send_json({"type": "error", "message": str(e)})
+        finally:
+            if speech is not None:
+                await speech.cancel()
+            finish_turn()
+            
+            # Next recording starts a fresh WebM stream
+            stt_stream.close()
+            stt_stream = None
+    
+    # Partials run in the background so we keep reading audio frames meanwhile
+    # Whisper reads the PCM the recording's ffmpeg decoder already produced (no temp file, no second decode)
+    partials = stt_service.PartialTranscriber(stt_inference.transcribe, send_partial)
+    
     try:
         while True:
             # We expect either bytes (audio) or text (control/json)
             message = await websocket.receive()
             
             if "bytes" in message and message["bytes"]:
-                # Append audio chunk
-                audio_buffer.extend(message["bytes"])
+                # Decode audio chunk as it arrives
+                if stt_stream is None:
+                    if await_header and not message["bytes"].startswith(WEBM_MAGIC):
+                        continue
+                    await_header = False
+                    try:
+                        stt_stream = stt_service.StreamingDecoder()
+                        if stt_service.VAD_ENABLED and stt_service.VAD_ENDPOINT_SILENCE_MS > 0:
+                            endpointer = stt_service.Endpointer()
+                    except OSError as e:
+                        print(f"Could not start audio decoder: {e}")
+                        await send_json({"type": "error", "message": "Audio decoder unavailable"})
+                        continue
+                stt_stream.feed(message["bytes"])
                 
                 # Partial Transcription (every 1.5s)
-                if len(audio_buffer) > 32000 and (time.time() - last_transcribe_time) > 1.5:
+                if stt_stream.pcm.duration > stt_service.PARTIAL_MIN_SECONDS and (time.time() - last_transcribe_time) > 1.5:
                      last_transcribe_time = time.time()
                      
-                     # Async transcribe
-                     # We create a copy to avoid threading issues if buffer changes (though we're awaiting so it's safer)
-                     curr_buffer = audio_buffer[:]
-                     
-                     async def partial_stt():
-                         with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_p:
-                             temp_p.write(curr_buffer)
-                             temp_p_path = temp_p.name
-                         try:
-                             # Use beam_size=1 and fast decode for partial
-                             model = get_audio_model()
-                             res = await asyncio.to_thread(model.transcribe, temp_p_path, fp16=False, language="en")
-                             return res["text"].strip()
-                         finally:
-                             if os.path.exists(temp_p_path): os.remove(temp_p_path)
-                     
-                     # Run without blocking the loop too much (fire and await)
-                     partial_text = await partial_stt()
-                     if partial_text:
-                         await websocket.send_json({"type": "transcript_partial", "text": partial_text})
+                     # Only the most recent audio: cost stays bounded however long the user talks
+                     # (and a silent stretch is trimmed to nothing, so it costs no inference)
+                     partials.submit(lambda pcm=stt_stream.pcm: stt_service.trim_silence(pcm.tail(stt_service.PARTIAL_CONTEXT_SECONDS)))
+                
+                # The user paused long enough: answer without waiting for transcribe_request
+                if endpointer is not None and endpointer.update(stt_stream.pcm):
+                    endpointer = None
+                    await_header = True
+                    await send_json({"type": "speech.end"})
+                    await partials.cancel()
+                    await run_voice_turn()
 
             elif "text" in message and message["text"]:
                 data = json.loads(message["text"])
@@ -163,157 +480,37 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 
                 if msg_type == "transcribe_request":
                     # User stopped speaking, process buffer
-                    if len(audio_buffer) > 0:
-                        # Save buffer to temp wav
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_in:
-                             temp_in.write(audio_buffer)
-                             temp_in_path = temp_in.name
-                        
-                        # Transcribe
-                        try:
-                            # Note: Whisper needs ffmpeg to read .webm/bytes
-                            # Force English to prevent random language hallucinations
-                            model = get_audio_model()
-                            res = model.transcribe(temp_in_path, language="en")
-                            user_text = res["text"].strip()
-                            
-                            # Hallucination Filtering
-                            # Common phrases Whisper outputs on silence
-                            hallucinations = [
-                                "Thank you for watching", "Subtitle by", "Amara.org", "MBC", 
-                                "Copyright", "All rights reserverd", "Unidentified", "The end"
-                            ]
-                            
-                            is_hallucination = any(h.lower() in user_text.lower() for h in hallucinations)
-                            
-                            # Validation: Ignore empty, short, or blacklisted input
-                            if not user_text or len(user_text) < 2 or is_hallucination:
-                                print(f"Ignored invalid transcription: '{user_text}'")
-                                audio_buffer = bytearray()
-                                continue
-                            
-                            # Send Transcript back
-                            await websocket.send_json({"type": "transcript", "text": user_text})
-                            
-                            # Agent Processing and Streaming Response
-                            response_text = ""
-                            sentence_buffer = ""
-                            
-                            # Check session
-                            session = await session_service.get_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
-                            if not session:
-                                await session_service.create_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
-
-                            chunk_index = 0
-                            
-                            async for event in runner.run_async(
-                                user_id="user",
-                                session_id=client_id,
-                                new_message=types.Content(role="user", parts=[types.Part(text=user_text)])
-                            ):
-                                  # Robust Event Parsing
-                                  chunk_text = ""
-                                  if hasattr(event, 'text') and event.text:
-                                      chunk_text = event.text
-                                  elif hasattr(event, 'content') and event.content:
-                                      if hasattr(event.content, 'parts'):
-                                          for part in event.content.parts:
-                                              if hasattr(part, 'text') and part.text:
-                                                  chunk_text += part.text
-                                      elif hasattr(event.content, 'text') and event.content.text:
-                                          chunk_text = event.content.text
-                                  
-                                  if chunk_text:
-                                      print(f"DEBUG CHUNK: '{chunk_text}'") # DEBUG
-                                      response_text += chunk_text
-                                      sentence_buffer += chunk_text
-                                      await websocket.send_json({"type": "response.text_partial", "text": chunk_text})
-                                      
-                                      # Check for sentence delimiters
-                                      # Simple regex for . ! ? followed by space or end
-                                      # We use non-consuming lookbehind to avoid eating the punctuation
-                                      sentences = re.split(r'(?<=[.!?])\s+', sentence_buffer)
-                                      
-                                      # If we have more than 1 part, the first parts are complete sentences
-                                      if len(sentences) > 1:
-                                          # Process all except the last incomplete buffer
-                                          complete_sentences = sentences[:-1]
-                                          sentence_buffer = sentences[-1] # Keep the rest
-                                          
-                                          for sentence in complete_sentences:
-                                              if not sentence.strip(): continue
-                                              
-                                              # Generate Audio for sentence
-                                              with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                                                  temp_voice_path = fp.name
-                                                  
-                                              await asyncio.to_thread(generate_voice, sentence, temp_voice_path)
-                                              
-                                              with open(temp_voice_path, "rb") as audio_file:
-                                                  audio_chunk = audio_file.read()
-                                                  b64_audio = base64.b64encode(audio_chunk).decode('utf-8')
-                                                  await websocket.send_json({
-                                                      "type": "response.audio", 
-                                                      "data": b64_audio, 
-                                                      "index": chunk_index,
-                                                      "final": False
-                                                  })
-                                                  chunk_index += 1
-                                              
-                                              if os.path.exists(temp_voice_path): os.remove(temp_voice_path)
-
-                            # Send Final Text
-                            await websocket.send_json({"type": "response.text", "text": response_text})
-                            
-                            # Process any remaining buffer as the final sentence
-                            if sentence_buffer.strip():
-                                with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                                    temp_voice_path = fp.name
-                                    
-                                await asyncio.to_thread(generate_voice, sentence_buffer, temp_voice_path)
-                                
-                                with open(temp_voice_path, "rb") as audio_file:
-                                    audio_chunk = audio_file.read()
-                                    b64_audio = base64.b64encode(audio_chunk).decode('utf-8')
-                                    await websocket.send_json({
-                                        "type": "response.audio", 
-                                        "data": b64_audio, 
-                                        "index": chunk_index,
-                                        "final": True
-                                    })
-                                if os.path.exists(temp_voice_path): os.remove(temp_voice_path)
-
-                        except Exception as e:
-                            print(f"Error processing: {e}")
-                            await websocket.send_json({"type": "error", "message": str(e)})
-                        finally:
-                            # Cleanup input
-                            audio_buffer = bytearray()
-                            if os.path.exists(temp_in_path): os.remove(temp_in_path)
+                    # A partial would be stale now (and would compete with the final pass)
+                    await partials.cancel()
+                    
+                    await run_voice_turn()
 
                 elif msg_type == "text_input":
                      user_text = data.get("text", "")
                      
+                     turn = metrics.Span("turn_stage_seconds", mode="text")
+                     
                      # 1. Echo user text back (to confirm receipt/display)
-                     await websocket.send_json({"type": "transcript", "text": user_text})
+                     await send_json({"type": "transcript", "text": user_text})
                      
                      # 2. Agent Processing
                      response_text = ""
                      
-                     # Check session
-                     session = await session_service.get_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
-                     if not session:
-                         await session_service.create_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
-                     
                      try:
-                         print("Running agent (Text Mode)...") # DEBUG
+                         # Check session
+                         runner = await warmup_manager.aensure("agent")
+                         with turn.stage("session_lookup"):
+                             session = await runner.session_service.get_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
+                             if not session:
+                                 await runner.session_service.create_session(app_name="CryptoBackend", user_id="user", session_id=client_id)
+                         
+                         agent_started = time.perf_counter()
                          async for event in runner.run_async(
                              user_id="user",
                              session_id=client_id,
-                             new_message=types.Content(role="user", parts=[types.Part(text=user_text)])
+                             new_message=user_message(user_text)
                          ):
-                               # DEBUG: See what event we actually get
-                               print(f"DEBUG EVENT: {type(event)}")
+                               log.debug("agent event client=%s type=%s", client_id, type(event).__name__)
                                # Robust Event Parsing
                                chunk_text = ""
                                if hasattr(event, 'text') and event.text:
@@ -326,27 +523,32 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                                    elif hasattr(event.content, 'text') and event.content.text:
                                        chunk_text = event.content.text
                                
-                               print(f"Chunk: {chunk_text}") # DEBUG
-                               
                                if chunk_text:
+                                   turn.mark("llm_first_token", since=agent_started)
+                                   log.debug("agent chunk client=%s text=%r", client_id, chunk_text)
                                    response_text += chunk_text
-                                   await websocket.send_json({"type": "response.text_partial", "text": chunk_text})
+                                   await send_json({"type": "response.text_partial", "text": chunk_text})
                          
-                         print(f"Agent Reply (Text): {response_text}") # DEBUG
+                         turn.record("agent", time.perf_counter() - agent_started)
+                         log.debug("agent reply client=%s text=%r", client_id, response_text)
                          # Send Final Text
-                         await websocket.send_json({"type": "response.text", "text": response_text})
+                         await send_json({"type": "response.text", "text": response_text})
                          
                          # NO TTS for text input
                          
                      except Exception as e:
                          print(f"Error processing text: {e}")
-                         await websocket.send_json({"type": "error", "message": str(e)})
+                         await send_json({"type": "error", "message": str(e)})
+                     finally:
+                         finish_turn()
 
                 elif msg_type == "stop":
                      # Client interrupted, stop everything
-                     print("Received stop signal") # DEBUG
-                     audio_buffer = bytearray()
-                     pass
+                     log.debug("stop signal client=%s", client_id)
+                     await partials.cancel()
+                     if stt_stream is not None:
+                         stt_stream.close()
+                         stt_stream = None
                      
     except WebSocketDisconnect:
         print(f"Client {client_id} disconnected")
@@ -358,4 +560,7 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
              print(f"RuntimeError in websocket: {e}")
     except Exception as e:
         print(f"Unexpected error in websocket: {e}")
-
+    finally:
+        await partials.cancel()
+        if stt_stream is not None:
+            stt_stream.close()
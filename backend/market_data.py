@@ -0,0 +1,148 @@
+# Market data prefetcher
+# Optional background refresher started with the app. It polls the top
+# symbols, trending news and the supported chains on a schedule into a
+# versioned in-memory snapshot, so the tools answer without a network call
+# and only go live for data outside the snapshot (or too old to trust).
+# Every tool result carries staleness metadata (source, as_of, age_seconds).
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+MARKET_DATA_PREFETCH = os.getenv("MARKET_DATA_PREFETCH", "false").lower() in ("1", "true", "yes")
+MARKET_DATA_SYMBOLS = [
+    s.strip().upper()
+    for s in os.getenv("MARKET_DATA_SYMBOLS", "BTC,ETH,USDT,BNB,SOL,XRP,USDC,DOGE,ADA,TRX,LTC,BCH").split(",")
+    if s.strip()
+]
+MARKET_DATA_CHAINS = ["bitcoin", "ethereum", "litecoin", "dogecoin", "bitcoin-cash"]
+MARKET_DATA_NEWS_LIMIT = int(os.getenv("MARKET_DATA_NEWS_LIMIT", "20"))
+MARKET_DATA_PRICE_INTERVAL = float(os.getenv("MARKET_DATA_PRICE_INTERVAL", "30"))
+MARKET_DATA_NEWS_INTERVAL = float(os.getenv("MARKET_DATA_NEWS_INTERVAL", "300"))
+MARKET_DATA_CHAIN_INTERVAL = float(os.getenv("MARKET_DATA_CHAIN_INTERVAL", "120"))
+# Snapshot entries older than this are ignored and the tool fetches live
+MARKET_DATA_MAX_AGE_SECONDS = float(os.getenv("MARKET_DATA_MAX_AGE_SECONDS", "600"))
+
+
+def annotate(result, source):
+    """
+    Returns a copy of a tool result with staleness metadata.
+    Uses the result's `fetched_at` (epoch seconds) when present.
+    """
+    result = dict(result)
+    fetched_at = result.pop("fetched_at", None)
+    result["source"] = source
+    if fetched_at is not None:
+        result["as_of"] = datetime.fromtimestamp(fetched_at, timezone.utc).isoformat(timespec="seconds")
+        result["age_seconds"] = round(max(0.0, time.time() - fetched_at), 1)
+    return result
+
+
+class SnapshotStore:
+    """
+    Latest prefetched result per (kind, key).
+    `version` goes up on every write so readers can tell the data changed.
+    """
+
+    def __init__(self, max_age=MARKET_DATA_MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self.version = 0
+        self._entries = {}
+
+    def put(self, kind, key, result):
+        self._entries[(kind, key)] = result
+        self.version += 1
+        metrics.set_gauge("market_data_snapshot_version", self.version)
+
+    def get(self, kind, key):
+        """Returns the annotated result, or None when missing or older than max_age."""
+        result = self._entries.get((kind, key))
+        if result is None or time.time() - result.get("fetched_at", 0) > self.max_age:
+            metrics.inc("market_data_snapshot_misses_total", kind=kind)
+            return None
+        metrics.inc("market_data_snapshot_hits_total", kind=kind)
+        return annotate(result, "snapshot")
+
+    def stats(self):
+        now = time.time()
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "oldest_age_seconds": round(max((now - r.get("fetched_at", now) for r in self._entries.values()), default=0.0), 1),
+        }
+
+
+class MarketDataPrefetcher:
+    """
+    Background refresh loops feeding a SnapshotStore.
+
+    The fetchers are the tools' own live fetch functions:
+      fetch_prices(symbols, convert) -> {symbol: result}
+      fetch_news(limit) -> result
+      fetch_chain(chain) -> result
+    Only results with status "success" replace what is in the snapshot.
+    """
+
+    def __init__(self, store, fetch_prices, fetch_news, fetch_chain,
+                 symbols=MARKET_DATA_SYMBOLS, chains=MARKET_DATA_CHAINS):
+        self.store = store
+        self.fetch_prices = fetch_prices
+        self.fetch_news = fetch_news
+        self.fetch_chain = fetch_chain
+        self.symbols = symbols
+        self.chains = chains
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        print(f"Starting market data prefetcher ({len(self.symbols)} symbols, {len(self.chains)} chains)...")
+        self._tasks = [
+            asyncio.create_task(self._loop("prices", self.refresh_prices, MARKET_DATA_PRICE_INTERVAL)),
+            asyncio.create_task(self._loop("news", self.refresh_news, MARKET_DATA_NEWS_INTERVAL)),
+            asyncio.create_task(self._loop("chains", self.refresh_chains, MARKET_DATA_CHAIN_INTERVAL)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, kind, refresh, interval):
+        while True:
+            try:
+                with metrics.timer("market_data_refresh_seconds", kind=kind):
+                    await refresh()
+                metrics.inc("market_data_refresh_total", kind=kind, status="ok")
+            except Exception as e:
+                # Keep serving the previous snapshot; the age tells the agent how old it is
+                metrics.inc("market_data_refresh_total", kind=kind, status="error")
+                print(f"Market data refresh failed ({kind}): {e}")
+            await asyncio.sleep(interval)
+
+    async def refresh_prices(self):
+        results = await self.fetch_prices(self.symbols, "USD")
+        for symbol, result in results.items():
+            if result.get("status") == "success":
+                self.store.put("price", (symbol, "USD"), result)
+
+    async def refresh_news(self):
+        result = await self.fetch_news(MARKET_DATA_NEWS_LIMIT)
+        if result.get("status") == "success":
+            self.store.put("news", None, result)
+
+    async def refresh_chains(self):
+        results = await asyncio.gather(*(self.fetch_chain(c) for c in self.chains))
+        for chain, result in zip(self.chains, results):
+            if result.get("status") == "success":
+                self.store.put("chain", chain, result)
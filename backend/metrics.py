@@ -0,0 +1,213 @@
+# In-process metrics
+# Counters, gauges and latency histograms shared by every backend module
+# Thread-safe: tools and audio workers record from their own threads
+# Exposed as JSON on /stats and in the Prometheus text format on /metrics
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (good enough for p50/p95)."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, bound in enumerate(self.buckets):
+            running += self.counts[i]
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_key(key):
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def inc(name, value=1, **labels):
+    """Adds `value` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Sets a gauge to its current value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """Records one latency sample (in seconds) into a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram()
+        hist.observe(seconds)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Times the body of a `with` block into a histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+class Span:
+    """
+    Stage timings for one request (e.g. a voice turn). Every stage is recorded
+    into the `name{stage=...}` histogram as it ends, and summed per stage so the
+    whole request can be logged as one line by `durations()`.
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        observe(self.name, seconds, stage=stage, **self.labels)
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def mark(self, stage, since=None):
+        """Records, once, the time since `since` (default: span start), e.g. time to first token."""
+        if stage not in self.stages:
+            self.record(stage, time.perf_counter() - (self.started if since is None else since))
+
+    def finish(self):
+        self.record("total", time.perf_counter() - self.started)
+        return self.durations()
+
+    def durations(self):
+        return " ".join(f"{stage}={seconds:.3f}" for stage, seconds in self.stages.items())
+
+
+def snapshot():
+    """Returns every metric as a JSON-friendly dict."""
+    with _lock:
+        return {
+            "counters": {_format_key(k): v for k, v in _counters.items()},
+            "gauges": {_format_key(k): v for k, v in _gauges.items()},
+            "histograms": {
+                _format_key(k): {
+                    "count": h.count,
+                    "avg": h.sum / h.count if h.count else 0.0,
+                    "p50": h.quantile(0.50),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for k, h in _histograms.items()
+            },
+        }
+
+
+# ---------------------------------------------------------
+# Prometheus text exposition format
+# ---------------------------------------------------------
+def _prom_name(name):
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _prom_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{_prom_name(k)}="{v}"' for k, v in escaped) + "}"
+
+
+def _prom_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Every metric in the Prometheus text format (version 0.0.4)."""
+    # Series of one metric must be contiguous, under a single TYPE line
+    def order(item):
+        return item[0][0], _format_key(item[0])
+
+    with _lock:
+        counters = sorted(_counters.items(), key=order)
+        gauges = sorted(_gauges.items(), key=order)
+        histograms = sorted(
+            ((k, (h.buckets, list(h.counts), h.count, h.sum)) for k, h in _histograms.items()), key=order
+        )
+
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        declare(_prom_name(name), "counter")
+        lines.append(f"{_prom_name(name)}{_prom_labels(labels)} {_prom_number(value)}")
+    for (name, labels), value in gauges:
+        declare(_prom_name(name), "gauge")
+        lines.append(f"{_prom_name(name)}{_prom_labels(labels)} {_prom_number(value)}")
+    for (name, labels), (buckets, counts, count, total) in histograms:
+        name = _prom_name(name)
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_prom_labels(labels, [('le', _prom_number(bound))])} {cumulative}")
+        lines.append(f"{name}_sum{_prom_labels(labels)} {_prom_number(float(total))}")
+        lines.append(f"{name}_count{_prom_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
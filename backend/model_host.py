@@ -0,0 +1,252 @@
+# Model host
+# With several workers (uvicorn --workers N), each one loading Whisper and the
+# embedding model multiplies memory by N. The model host loads them once per
+# machine and serves speech-to-text and knowledge-base search to every worker
+# over a local socket (multiprocessing.connection, authenticated with a key).
+#   python model_host.py                                  # start the host first
+#   MODEL_HOST_ADDRESS=127.0.0.1:8765 MODEL_HOST_AUTHKEY=<secret> uvicorn main:app --workers 4
+# Segments from all workers share the host's STT batching queue, so batches
+# fill up faster than they would per worker.
+# Empty MODEL_HOST_ADDRESS (default) keeps the models in-process, as before.
+
+import asyncio
+import concurrent.futures
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import stt_service
+except ImportError:
+    from . import stt_service
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+MODEL_HOST_ADDRESS = os.getenv("MODEL_HOST_ADDRESS", "")  # host:port, or a unix socket path
+# Required, and secret: connections exchange pickles, so whoever holds the key can run code on the host
+MODEL_HOST_AUTHKEY = os.getenv("MODEL_HOST_AUTHKEY", "").encode("utf-8")
+MODEL_HOST_POOL_SIZE = int(os.getenv("MODEL_HOST_POOL_SIZE", "4"))  # Idle connections kept per worker
+# Longest a call may take; a hung or killed host fails the call instead of blocking the worker
+MODEL_HOST_TIMEOUT_SECONDS = float(os.getenv("MODEL_HOST_TIMEOUT_SECONDS", "60"))
+
+
+def enabled():
+    """True when this process should use the model host instead of loading models itself."""
+    return bool(MODEL_HOST_ADDRESS)
+
+
+def _require_authkey(authkey):
+    if not authkey:
+        raise RuntimeError("MODEL_HOST_AUTHKEY must be set (e.g. python -c \"import secrets; print(secrets.token_hex(32))\")")
+    return authkey
+
+
+def _parse_address(address):
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return (host, int(port))
+    return address
+
+
+# ---------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------
+class ModelHostError(RuntimeError):
+    """The host answered, but the call failed there."""
+
+
+class ModelHostTimeout(ModelHostError):
+    """The host didn't answer in time."""
+
+
+class ModelHostClient:
+    """
+    Connection pool to the model host. call() blocks and is thread-safe: each
+    call takes its own connection, so concurrent calls don't interleave.
+    """
+
+    def __init__(self, address=MODEL_HOST_ADDRESS, authkey=MODEL_HOST_AUTHKEY,
+                 pool_size=MODEL_HOST_POOL_SIZE, timeout=MODEL_HOST_TIMEOUT_SECONDS):
+        self.address = _parse_address(address)
+        self.authkey = _require_authkey(authkey)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def call(self, method, *args):
+        # A pooled connection may be dead (host restarted); retry once on a fresh one
+        for attempt in range(2):
+            conn, pooled = self._acquire(fresh=attempt > 0)
+            try:
+                conn.send((method, args))
+                if not conn.poll(self.timeout):
+                    # The reply may still come; this connection can't be reused
+                    conn.close()
+                    raise ModelHostTimeout(f"model host {method}: no reply after {self.timeout:.0f}s")
+                ok, value = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                if pooled and attempt == 0:
+                    continue
+                raise
+            self._release(conn)
+            if not ok:
+                raise ModelHostError(f"model host {method}: {value}")
+            return value
+
+    def _acquire(self, fresh=False):
+        if not fresh:
+            try:
+                return self._idle.get_nowait(), True
+            except queue.Empty:
+                pass
+        return Client(self.address, authkey=self.authkey), False
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ModelHostClient()
+        return _client
+
+
+class RemoteSTTEngine(stt_service.STTEngine):
+    """STTEngine that forwards each batch to the model host."""
+
+    name = "remote"
+
+    def __init__(self, client=None):
+        self.client = client or get_client()
+        # Fails fast (and the warm-up retries later) if the host isn't up
+        self.host = self.client.call("ping")
+
+    def transcribe_batch(self, segments):
+        return self.client.call("transcribe_batch", list(segments))
+
+
+# ---------------------------------------------------------
+# Host side
+# ---------------------------------------------------------
+class ModelHost:
+    """Loads the STT engine and the knowledge base once; one thread per worker connection."""
+
+    def __init__(self):
+        try:
+            import rag_service
+        except ImportError:
+            from . import rag_service
+
+        self.rag = rag_service
+        self.stt = stt_service.STTInferenceService(stt_service.create_engine)
+        # The inference service batches on an event loop; requests arrive on connection threads
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self._methods = {
+            "ping": self.ping,
+            "transcribe_batch": self.transcribe_batch,
+            "search": self.search,
+        }
+
+    def warm_up(self):
+        print(f"Model host: loading STT engine {stt_service.STT_ENGINE} / {stt_service.STT_MODEL_SIZE}...")
+        self.stt._get_engine(0)
+        print("Model host: loading knowledge base...")
+        try:
+            self.rag.warm_up_local()
+        except Exception as e:
+            # Search still retries on first use
+            print(f"Model host: knowledge base unavailable: {e}")
+
+    def ping(self):
+        return {"pid": os.getpid(), "stt_engine": stt_service.STT_ENGINE, "rag_ready": self.rag.is_loaded()}
+
+    def transcribe_batch(self, segments):
+        futures = [
+            asyncio.run_coroutine_threadsafe(self.stt.transcribe(segment), self._loop)
+            for segment in segments
+        ]
+        deadline = time.monotonic() + MODEL_HOST_TIMEOUT_SECONDS
+        try:
+            return [future.result(max(0.0, deadline - time.monotonic())) for future in futures]
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError(f"transcription took over {MODEL_HOST_TIMEOUT_SECONDS:.0f}s") from None
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def search(self, query, n_results):
+        return self.rag.search_local(query, n_results)
+
+    def serve(self, address=MODEL_HOST_ADDRESS, authkey=MODEL_HOST_AUTHKEY):
+        with Listener(_parse_address(address), authkey=_require_authkey(authkey)) as listener:
+            print(f"Model host: listening on {address} (pid {os.getpid()})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Wrong authkey or a client that hung up mid-handshake
+                    print(f"Model host: rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                handler = self._methods.get(method)
+                try:
+                    if handler is None:
+                        raise ValueError(f"unknown method {method!r}")
+                    reply = (True, handler(*args))
+                except Exception as e:
+                    reply = (False, str(e))
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+
+def main():
+    if not MODEL_HOST_ADDRESS:
+        sys.exit("Set MODEL_HOST_ADDRESS (e.g. 127.0.0.1:8765) for the host and the workers")
+    if not MODEL_HOST_AUTHKEY:
+        sys.exit("Set MODEL_HOST_AUTHKEY to the same secret for the host and the workers")
+    host = ModelHost()
+    host.warm_up()
+    try:
+        host.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Price quote cache
+# Users ask "what's BTC at?" in bursts; every tool call used to be its own
+# CoinMarketCap request. Quotes are now shared:
+# - TTL cache keyed by (symbol, convert)
+# - Single-flight: concurrent misses for a key wait on one fetch
+# - Batching: symbols missed within a short window go out as one request
+# - Optional shared store (see shared_store.py): with several workers, a quote
+#   one worker fetched is served by all of them until it expires
+# Runs on the server's event loop (tools are async), so no locking is needed.
+
+import asyncio
+import json
+import os
+import time
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+QUOTE_CACHE_TTL_SECONDS = float(os.getenv("QUOTE_CACHE_TTL_SECONDS", "30"))
+QUOTE_BATCH_WINDOW_MS = float(os.getenv("QUOTE_BATCH_WINDOW_MS", "25"))
+QUOTE_MAX_BATCH_SIZE = int(os.getenv("QUOTE_MAX_BATCH_SIZE", "50"))
+
+
+class QuoteCache:
+    """
+    Shared quote lookups in front of an async batch fetcher.
+
+    `fetch(symbols, convert)` must return {symbol: result dict} for every
+    requested symbol. Only results with status "success" are cached; errors
+    are handed to everyone waiting on that fetch and retried next time.
+    Successful results carry `fetched_at`, so copies from `store` expire on time.
+    """
+
+    def __init__(self, fetch, ttl=QUOTE_CACHE_TTL_SECONDS,
+                 batch_window_ms=QUOTE_BATCH_WINDOW_MS, max_batch_size=QUOTE_MAX_BATCH_SIZE, store=None):
+        self.fetch = fetch
+        self.store = store
+        self.ttl = ttl
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._entries = {}   # (symbol, convert) -> (expires_at, result)
+        self._pending = {}   # (symbol, convert) -> future shared by all waiters
+        self._batches = {}   # convert -> {symbol: future} collected in the open window
+        self._tasks = set()  # Keeps running batch tasks referenced
+
+    async def get(self, symbol, convert="USD"):
+        symbol, convert = symbol.upper(), convert.upper()
+        key = (symbol, convert)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            metrics.inc("quote_cache_hits_total")
+            return entry[1]
+
+        future = self._pending.get(key)
+        if future is not None:
+            metrics.inc("quote_cache_coalesced_total")
+            return await asyncio.shield(future)
+
+        metrics.inc("quote_cache_misses_total")
+        future = self._pending[key] = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Nobody may be waiting
+        batch = self._batches.get(convert)
+        if batch is None or len(batch) >= self.max_batch_size:
+            # First miss of a window opens it; the batch runs on its own task so
+            # a cancelled caller doesn't strand everyone else waiting on it
+            batch = self._batches[convert] = {}
+            task = asyncio.create_task(self._run_batch(convert, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        batch[symbol] = future
+        return await asyncio.shield(future)
+
+    async def _run_batch(self, convert, batch):
+        try:
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            # Close the window so later misses start a new batch
+            if self._batches.get(convert) is batch:
+                del self._batches[convert]
+            symbols = list(batch)
+
+            if self.store is not None:
+                symbols = await self._resolve_shared(convert, symbols)
+                if not symbols:
+                    return
+
+            metrics.inc("quote_batches_total")
+            metrics.inc("quote_batch_symbols_total", len(symbols))
+            try:
+                with metrics.timer("quote_fetch_seconds"):
+                    results = await self.fetch(symbols, convert)
+            except Exception as e:
+                self._resolve(convert, symbols, error=e)
+                return
+            self._resolve(convert, symbols, results=results)
+            if self.store is not None:
+                await self._share(convert, results)
+        finally:
+            # Cancelled (shutdown) or failed somewhere unexpected: nobody may be left waiting
+            if self._batches.get(convert) is batch:
+                del self._batches[convert]
+            self._fail_unresolved(convert, batch)
+
+    # Shared store: failures only cost the shared hit, never the lookup
+    async def _resolve_shared(self, convert, symbols):
+        """Answers what another worker already fetched; returns the symbols still missing."""
+        try:
+            values = await self.store.mget([f"quote:{convert}:{s}" for s in symbols])
+            found = {s: json.loads(v) for s, v in zip(symbols, values) if v is not None}
+        except Exception as e:
+            print(f"Quote cache: shared store unavailable ({e})")
+            return symbols
+        if found:
+            metrics.inc("quote_cache_shared_hits_total", len(found))
+            self._resolve(convert, list(found), results=found)
+        return [s for s in symbols if s not in found]
+
+    async def _share(self, convert, results):
+        try:
+            for symbol, result in results.items():
+                if result.get("status") == "success":
+                    await self.store.set(f"quote:{convert}:{symbol}", json.dumps(result), ttl=self.ttl)
+        except Exception as e:
+            print(f"Quote cache: shared store unavailable ({e})")
+
+    def _resolve(self, convert, symbols, results=None, error=None):
+        now = time.monotonic()
+        if results is not None:
+            for symbol, result in results.items():
+                if result.get("status") == "success":
+                    # Shared copies may already be partway through their TTL
+                    age = max(0.0, time.time() - result.get("fetched_at", time.time()))
+                    self._entries[(symbol, convert)] = (now + self.ttl - age, result)
+            self._prune()
+
+        for symbol in symbols:
+            future = self._pending.pop((symbol, convert), None)
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(symbol, {"status": "error", "reason": "symbol_not_found"}))
+
+    def _fail_unresolved(self, convert, batch):
+        error = RuntimeError(f"quote batch for {convert} did not complete")
+        for symbol, future in batch.items():
+            if future.done():
+                continue
+            # A later miss may have registered its own future for the symbol
+            if self._pending.get((symbol, convert)) is future:
+                del self._pending[(symbol, convert)]
+            future.set_exception(error)
+
+    def _prune(self):
+        # Keeps long-dead symbols from piling up
+        if len(self._entries) < 1024:
+            return
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
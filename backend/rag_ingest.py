@@ -0,0 +1,234 @@
+# RAG ingestion pipeline
+# Parses + chunks documents in a process pool, embeds in large batches and
+# keeps a manifest of (path, size, mtime, content hash) next to the vector DB:
+# - unchanged files are skipped without being read
+# - new / edited files are (re-)embedded, replacing their old chunks
+# - chunks of deleted files are removed
+# Workers stream chunks (see chunker.py) into a JSONL spool file that the main
+# process streams back, so neither side ever holds a whole document.
+# Kept free of heavy imports so spawned workers start fast.
+#
+# Offline usage (from backend/):
+#   python rag_ingest.py              # incremental
+#   python rag_ingest.py --full       # ignore the manifest, re-embed everything
+
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import chunker
+except ImportError:
+    from . import chunker
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+MANIFEST_FILENAME = "ingest_manifest.json"
+RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+
+
+# ---------------------------------------------------------
+# Parsing (runs in worker processes)
+# ---------------------------------------------------------
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_file(path, spool_dir):
+    """Worker entry point: returns (sha256, spool path, chunk count)."""
+    sha256 = file_sha256(path)
+    spool_path = os.path.join(spool_dir, os.path.basename(path) + ".jsonl")
+    count = 0
+    with open(spool_path, "w", encoding="utf-8") as f:
+        try:
+            for chunk in chunker.iter_chunks(path):
+                f.write(json.dumps([chunk.text, chunk.metadata()]) + "\n")
+                count += 1
+        except Exception as e:
+            print(f"RAG: Error reading {path}: {e}")
+    return sha256, spool_path, count
+
+
+def _read_spool(spool_path):
+    with open(spool_path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+# ---------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)  # Never leave a half-written manifest
+
+
+def scan_folder(folder_path):
+    """{filename: (path, size, mtime)} for every supported document."""
+    files = {}
+    for entry in os.scandir(folder_path):
+        if entry.is_file() and entry.name.endswith(SUPPORTED_EXTENSIONS):
+            stat = entry.stat()
+            files[entry.name] = (entry.path, stat.st_size, stat.st_mtime)
+    return files
+
+
+# ---------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------
+def ingest_folder(collection, folder_path, manifest_path, workers=RAG_INGEST_WORKERS,
+                  batch_size=RAG_EMBED_BATCH_SIZE, full=False, embed=None, lexical=None):
+    """
+    Brings `collection` in line with `folder_path`.
+    `embed(texts)` supplies the vectors; without it the collection embeds on its own.
+    `lexical` (a retrieval.BM25Index) is kept in step with the collection; the caller saves it.
+    Returns counts of {"added", "updated", "removed", "unchanged"} files.
+    """
+    started = time.perf_counter()
+    print(f"RAG: Scanning {folder_path}...")
+    manifest = load_manifest(manifest_path)
+    files = scan_folder(folder_path)
+    counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+    # Deleted files: drop their chunks
+    for filename in [f for f in manifest if f not in files]:
+        collection.delete(where={"source": filename})
+        if lexical is not None:
+            lexical.remove_source(filename)
+        del manifest[filename]
+        counts["removed"] += 1
+        print(f"RAG: Removed {filename}")
+
+    # Same size + mtime as last time → skip without reading it
+    changed = []
+    for filename, (path, size, mtime) in sorted(files.items()):
+        known = manifest.get(filename)
+        if not full and known and known["size"] == size and known["mtime"] == mtime \
+                and known.get("chunker") == chunker.CHUNKER_VERSION:
+            counts["unchanged"] += 1
+        else:
+            changed.append((filename, path, size, mtime))
+
+    if changed:
+        paths = [path for _, path, _, _ in changed]
+        spool_dir = tempfile.TemporaryDirectory(prefix="rag_ingest_")
+        spool_dirs = [spool_dir.name] * len(paths)
+        pool = None
+        if workers > 1 and len(changed) > 1:
+            # Spawn, never fork: ingestion can start from a thread of the running server
+            pool = ProcessPoolExecutor(max_workers=min(workers, len(changed)),
+                                       mp_context=multiprocessing.get_context("spawn"))
+        # Results arrive in order while later files are still parsing, so embedding overlaps parsing
+        parsed = pool.map(parse_file, paths, spool_dirs) if pool else map(parse_file, paths, spool_dirs)
+
+        batch = _ChunkBatch(collection, batch_size, embed, lexical)
+        try:
+            for (filename, _, size, mtime), (sha256, spool_path, chunk_count) in zip(changed, parsed):
+                known = manifest.get(filename)
+                entry = {"size": size, "mtime": mtime, "sha256": sha256, "chunks": chunk_count,
+                         "chunker": chunker.CHUNKER_VERSION}
+                if not full and known and known["sha256"] == sha256 \
+                        and known.get("chunker") == chunker.CHUNKER_VERSION:
+                    # Touched but not edited
+                    manifest[filename] = entry
+                    counts["unchanged"] += 1
+                    continue
+
+                counts["updated" if known else "added"] += 1
+                # Replace, never append: edited files may now have fewer chunks
+                collection.delete(where={"source": filename})
+                if lexical is not None:
+                    lexical.remove_source(filename)
+                batch.add(filename, _read_spool(spool_path), entry)
+                os.remove(spool_path)
+            batch.flush()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            spool_dir.cleanup()
+            # Only files whose chunks were fully written are recorded
+            manifest.update(batch.done)
+            save_manifest(manifest_path, manifest)
+    elif counts["removed"]:
+        save_manifest(manifest_path, manifest)
+
+    print(f"RAG: Ingest finished in {time.perf_counter() - started:.1f}s {counts}")
+    return counts
+
+
+class _ChunkBatch:
+    """Accumulates chunks across files so embeddings run in large batches."""
+
+    def __init__(self, collection, batch_size, embed=None, lexical=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.embed = embed
+        self.lexical = lexical
+        self.documents, self.metadatas, self.ids = [], [], []
+        self._pending = {}
+        self.done = {}
+
+    def add(self, filename, chunks, manifest_entry):
+        """`chunks` is consumed lazily: [(text, metadata)], in document order."""
+        for index, (text, meta) in enumerate(chunks):
+            self.documents.append(text)
+            self.metadatas.append({"source": filename, "chunk": index, **meta})
+            self.ids.append(f"{filename}_{index}")
+            if len(self.documents) >= self.batch_size:
+                self.flush()
+        # Complete once the next flush writes the rest of its chunks
+        self._pending[filename] = manifest_entry
+
+    def flush(self):
+        for i in range(0, len(self.documents), self.batch_size):
+            documents = self.documents[i:i + self.batch_size]
+            self.collection.upsert(
+                documents=documents,
+                embeddings=self.embed(documents) if self.embed else None,
+                metadatas=self.metadatas[i:i + self.batch_size],
+                ids=self.ids[i:i + self.batch_size],
+            )
+        if self.lexical is not None:
+            for doc_id, text, meta in zip(self.ids, self.documents, self.metadatas):
+                self.lexical.add(doc_id, text, meta["source"])
+        for filename, entry in self._pending.items():
+            print(f"RAG: Indexed {filename} ({entry['chunks']} chunks)")
+        self.done.update(self._pending)
+        self.documents, self.metadatas, self.ids = [], [], []
+        self._pending = {}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index ./data into the RAG vector DB offline.")
+    parser.add_argument("--data", help="Folder to ingest (default: rag_service.DATA_FOLDER)")
+    parser.add_argument("--workers", type=int, default=RAG_INGEST_WORKERS, help="Parser processes")
+    parser.add_argument("--batch-size", type=int, default=RAG_EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-embed every file")
+    args = parser.parse_args()
+
+    import rag_service
+
+    rag_service.ingest(args.data, workers=args.workers, batch_size=args.batch_size, full=args.full)
@@ -4,12 +4,31 @@
 # Stores them in ChromaDB
 # Searches them when a question is asked
 # Returns relevant text to the AI
+# chromadb (and the ONNX model behind it) is imported on first use, not at
+# import time, so importing this module stays cheap for the server.
+# With MODEL_HOST_ADDRESS set, searches go to the model host (model_host.py),
+# which holds the one copy of the collection and embedding model per machine.
 
+import asyncio
 import os
 import json
-import chromadb
-from chromadb.utils import embedding_functions
-from pypdf import PdfReader
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import embedding_cache
+    import metrics
+    import model_host
+    import rag_ingest
+    import retrieval
+except ImportError:
+    from . import embedding_cache
+    from . import metrics
+    from . import model_host
+    from . import rag_ingest
+    from . import retrieval
 
 # ---------------------------------------------------------
 # Configuration
@@ -17,160 +36,353 @@ from pypdf import PdfReader
 CHROMA_DB_PATH = "./chroma_db"
 COLLECTION_NAME = "crypto_knowledge"
 DATA_FOLDER = "./data"
+MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, rag_ingest.MANIFEST_FILENAME)
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_DB_PATH, "bm25_index.pkl")
+# Set to false when indexing is done offline (python rag_ingest.py)
+RAG_INGEST_ON_STARTUP = os.getenv("RAG_INGEST_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Chroma's DefaultEmbeddingFunction (ONNX all-MiniLM-L6-v2); change both if the model changes
+EMBEDDING_MODEL_ID = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(CHROMA_DB_PATH, "embedding_cache"))
+# Common questions ("what is DeFi?") skip the model and the vector search
+RAG_QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "512"))
+RAG_RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "256"))
+# Hybrid retrieval: dense (MiniLM) + lexical (BM25) candidates, fused with RRF,
+# then optionally reranked by a cross-encoder. Bigger = better recall, slower.
+RAG_DENSE_CANDIDATES = int(os.getenv("RAG_DENSE_CANDIDATES", "20"))
+RAG_LEXICAL_CANDIDATES = int(os.getenv("RAG_LEXICAL_CANDIDATES", "20"))
+RAG_RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "10"))
+RAG_RERANKER = os.getenv("RAG_RERANKER", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty = off
 
 # Global client/collection reference
 _collection = None
+_embedder = None
+_collection_version = 0  # Bumped whenever this process changes the collection
+_lexical = None
+_lexical_mtime = None
+_reranker = None
+_lexical_lock = threading.Lock()
+_init_lock = threading.Lock()  # Concurrent first searches wait for one initialization
+_host_ready = False  # Model host answered (remote mode only)
 
-def initialize_rag():
-    """Initializes ChromaDB (Latest) and ingests any new files."""
-    global _collection
-    
-    print("Initializing RAG Service (ChromaDB Latest)...")
-    
-    try:
-        # 1. Setup Client (Persistent)
-        client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        
-        # 2. Setup Embedding Function (Default is all-MiniLM-L6-v2)
-        embed_fn = embedding_functions.DefaultEmbeddingFunction()
-        
-        # 3. Get/Create Collection
-        _collection = client.get_or_create_collection(
-            name=COLLECTION_NAME, 
-            embedding_function=embed_fn
+
+class _LRUCache:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_query_embeddings = _LRUCache(RAG_QUERY_CACHE_SIZE)
+_search_results = _LRUCache(RAG_RESULT_CACHE_SIZE)
+_cache_counts = {"result": [0, 0], "query_embedding": [0, 0]}  # [hits, misses]
+
+def _record_cache(cache, hit):
+    _cache_counts[cache][0 if hit else 1] += 1
+    metrics.inc("rag_cache_hits_total" if hit else "rag_cache_misses_total", cache=cache)
+
+def cache_stats():
+    stats = {}
+    for cache, (hits, misses) in _cache_counts.items():
+        total = hits + misses
+        stats[cache] = {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+    return stats
+
+def get_embedder():
+    """Chunk embeddings go through an on-disk cache keyed by (model, chunk hash)."""
+    global _embedder
+    if _embedder is None:
+        from chromadb.utils import embedding_functions
+
+        _embedder = embedding_cache.CachedEmbedder(
+            embedding_functions.DefaultEmbeddingFunction(),
+            model_id=EMBEDDING_MODEL_ID,
+            dim=EMBEDDING_DIM,
+            cache_dir=EMBEDDING_CACHE_DIR,
         )
-        # If collection exists → load it
-        # If not → create it
-        
-        print(f"RAG: Collection '{COLLECTION_NAME}' loaded. Count: {_collection.count()}")
-        
-        # 4. Ingest Data Folder
-        if os.path.exists(DATA_FOLDER):
-            _ingest_folder(DATA_FOLDER)
-        else:
-            os.makedirs(DATA_FOLDER, exist_ok=True)
-
-        # This scans and ingests all documents inside ./data.
-
-    except Exception as e:
-        print(f"RAG Initialization Failed: {e}")
-        import traceback
-        traceback.print_exc()
-
-def _ingest_folder(folder_path):
-    """Scans and ingests all documents inside a folder."""
-    # Loops through files
-    # Reads text from each file
-    # Avoids re-indexing duplicates
-    # Sends text for chunking + storage
+    return _embedder
+
+def _open_collection():
+    import chromadb
+    from chromadb.utils import embedding_functions
+
+    # 1. Setup Client (Persistent)
+    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
     
-    print(f"RAG: Scanning {folder_path}...")
+    # 2. Setup Embedding Function (Default is all-MiniLM-L6-v2)
+    embed_fn = embedding_functions.DefaultEmbeddingFunction()
     
-    files_processed = 0
+    # 3. Get/Create Collection
+    # If collection exists → load it
+    # If not → create it
+    return client.get_or_create_collection(
+        name=COLLECTION_NAME, 
+        embedding_function=embed_fn
+    )
+
+def initialize_rag():
+    """Initializes ChromaDB (Latest) and ingests new or changed files. Runs once."""
+    global _collection
     
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        
-        text = ""
-        if filename.endswith(".pdf"):
-            text = _read_pdf(file_path)
-        elif filename.endswith(".txt") or filename.endswith(".md"):
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-            except Exception:
-                pass
+    with _init_lock:
+        if _collection is not None:
+            return
+
+        print("Initializing RAG Service (ChromaDB Latest)...")
         
-        if text:
-            # Check if this source exists
-            existing = _collection.get(where={"source": filename})
-            if existing and len(existing['ids']) > 0:
-                continue
+        try:
+            _collection = _open_collection()
+            print(f"RAG: Collection '{COLLECTION_NAME}' loaded. Count: {_collection.count()}")
+            
+            # 4. Ingest Data Folder (incremental: unchanged files are skipped via the manifest)
+            if RAG_INGEST_ON_STARTUP:
+                ingest()
 
-            # ❌ Re-embedding the same document again
-            # ✔ Uses metadata (source) to detect duplicates
+        except Exception as e:
+            print(f"RAG Initialization Failed: {e}")
+            import traceback
+            traceback.print_exc()
 
-            _add_text_to_db(filename, text)
-            files_processed += 1
-            
-    if files_processed > 0:
-        print(f"RAG: Ingested {files_processed} new files.")
+def warm_up():
+    """Readies the first search: in-process, or by checking the model host is up."""
+    global _host_ready
+    if model_host.enabled():
+        model_host.get_client().call("ping")
+        _host_ready = True
+        return
+    warm_up_local()
+
+def warm_up_local():
+    """Loads everything the first search needs: collection, embedding model, BM25 index, reranker."""
+    initialize_rag()
+    if _collection is None:
+        raise RuntimeError("Knowledge base unavailable")
+    get_embedder().embed_query("warm up")
+    _get_lexical()
+    _get_reranker()
 
-def _read_pdf(path):
+def is_ready():
+    return _host_ready if model_host.enabled() else is_loaded()
+
+def is_loaded():
+    """True when this process has the collection open (the model host reports this)."""
+    return _collection is not None
+
+def ingest(folder_path=None, **kwargs):
+    """Syncs the collection with the data folder; see rag_ingest.ingest_folder for options."""
+    global _collection
+    if _collection is None:
+        _collection = _open_collection()
+
+    folder_path = folder_path or DATA_FOLDER
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+        return None
+    lexical = _get_lexical()
+    with _lexical_lock:
+        try:
+            counts = rag_ingest.ingest_folder(_collection, folder_path, MANIFEST_PATH,
+                                              embed=get_embedder().embed, lexical=lexical, **kwargs)
+        finally:
+            _save_lexical(lexical)
+    if counts["added"] or counts["updated"] or counts["removed"]:
+        _bump_collection_version()
+    return counts
+
+def _save_lexical(lexical):
+    global _lexical_mtime
+    lexical.save(LEXICAL_INDEX_PATH)
+    _lexical_mtime = os.stat(LEXICAL_INDEX_PATH).st_mtime_ns
+
+def _get_lexical():
+    """
+    BM25 index for the collection. Reloaded when another process (the offline
+    ingest CLI) rewrote it; rebuilt from Chroma when missing (e.g. older DBs).
+    """
+    global _lexical, _lexical_mtime
     try:
-        reader = PdfReader(path)
-        text = ""
-        for page in reader.pages:
-            t = page.extract_text()
-            if t: text += t + "\n"
-        return text
-    except Exception as e:
-        print(f"RAG: Error reading PDF {path}: {e}")
-        return ""
-
-def _add_text_to_db(source_name, text):
-    chunk_size = 1000
-    overlap = 100
-
-    # Large docs → bad embeddings
-    # Chunking improves search accuracy
-    # Overlap preserves context
-    
-    chunks = []
-    metadatas = []
-    ids = []
-    
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        chunks.append(chunk)
-        metadatas.append({"source": source_name})
-        ids.append(f"{source_name}_{start}")
-        
-        start += (chunk_size - overlap)
-        
-    if chunks:
-        _collection.add(documents=chunks, metadatas=metadatas, ids=ids)
+        mtime = os.stat(LEXICAL_INDEX_PATH).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _lexical is not None and mtime == _lexical_mtime:
+        return _lexical
 
-        # Behind the scenes:
-        # Text → embeddings
-        # Embeddings → vector DB
-        # Metadata stored alongside
-        
-        print(f"RAG: Indexed {source_name} ({len(chunks)} chunks)")
+    with _lexical_lock:
+        if mtime is not None:
+            _lexical = retrieval.BM25Index.load(LEXICAL_INDEX_PATH)
+            _lexical_mtime = mtime
+        elif _lexical is None:
+            _lexical = retrieval.BM25Index()
+            if _collection is not None and _collection.count() > 0:
+                _rebuild_lexical(_lexical)
+    return _lexical
+
+def _rebuild_lexical(lexical, page_size=1000):
+    print("RAG: Building BM25 index from the collection...")
+    offset = 0
+    while True:
+        page = _collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        for doc_id, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+            lexical.add(doc_id, text, meta.get("source", "unknown"))
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    _save_lexical(lexical)
+
+def _bump_collection_version():
+    global _collection_version
+    _collection_version += 1
+    _search_results.clear()
+
+def collection_version():
+    """
+    Changes whenever the indexed content changes, including offline ingests
+    (python rag_ingest.py) from another process, which rewrite the manifest.
+    """
+    try:
+        manifest_mtime = os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        manifest_mtime = 0
+    return _collection_version, manifest_mtime
+
+def normalize_query(query):
+    """
+    Cache key for a query: case, spacing and trailing punctuation don't change
+    what is being asked. Only the caches use it; retrieval sees the query as typed.
+    """
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
 
-def search_knowledge_base(query: str, n_results: int = 3) -> str:    # This is what runs when a user asks a question.
+def _embed_query(query, key):
+    vector = _query_embeddings.get(key)
+    _record_cache("query_embedding", vector is not None)
+    if vector is not None:
+        return vector
+    with metrics.timer("rag_query_embedding_seconds"):
+        vector = get_embedder().embed_query(query)
+    _query_embeddings.put(key, vector)
+    return vector
+
+async def search_knowledge_base(query: str, n_results: int = 3) -> str:    # This is what runs when a user asks a question.
     """Searches the vector DB for relevant context."""
+    # Embedding + query (or the host round trip) block; keep them off the event loop
+    if model_host.enabled():
+        try:
+            return await asyncio.to_thread(model_host.get_client().call, "search", query, n_results)
+        except Exception as e:
+            print(f"RAG: model host search failed: {e}")
+            return "Knowledge base unavailable."
+    return await asyncio.to_thread(search_local, query, n_results)
+
+def search_local(query, n_results=3):
+    """search_knowledge_base() against this process's collection."""
     if _collection is None:
         initialize_rag()
     
     if _collection is None:
         return "Knowledge base unavailable."
 
-    if _collection.count() == 0:
+    started = time.perf_counter()
+    normalized = normalize_query(query)
+    # The version in the key means results from before an ingest are never served
+    result_key = (normalized, n_results, collection_version())
+    cached = _search_results.get(result_key)
+    _record_cache("result", cached is not None)
+    if cached is not None:
+        metrics.observe("rag_search_seconds", time.perf_counter() - started, cache="hit")
+        return cached
+
+    result = _search(query.strip(), n_results, normalized)
+    _search_results.put(result_key, result)
+    metrics.observe("rag_search_seconds", time.perf_counter() - started, cache="miss")
+    return result
+
+def _get_reranker():
+    global _reranker
+    if _reranker is None:
+        _reranker = retrieval.load_reranker(RAG_RERANKER) or False
+    return _reranker or None
+
+def _lexical_search(lexical, query, k):
+    # Skip BM25 (dense-only) rather than wait while an ingest is rewriting it
+    if not _lexical_lock.acquire(blocking=False):
+        return []
+    try:
+        return [doc_id for doc_id, _ in lexical.search(query, k)]
+    finally:
+        _lexical_lock.release()
+
+def _search(query, n_results, key):
+    count = _collection.count()
+    if count == 0:
         return "No documents found in knowledge base."
 
     # Behind the scenes:
-    # Query → embeddings
-    # Cosine similarity search
-    # Returns top N results/Top-K closest chunks returned
-    
-    results = _collection.query(
-        query_texts=[query],
-        n_results=n_results
-    )
+    # Query → embeddings → cosine similarity search (dense candidates)
+    # Query → BM25 over the same chunks (lexical candidates: tickers, EIP numbers, names)
+    # Both rankings fused with RRF, optionally reranked, top N returned
     
-    if not results or not results['documents']:
+    with metrics.timer("rag_retrieval_seconds", stage="dense"):
+        dense = _collection.query(
+            query_embeddings=[_embed_query(query, key)],
+            n_results=min(max(RAG_DENSE_CANDIDATES, n_results), count),
+            include=["documents", "metadatas"],
+        )
+    candidates = {}
+    dense_ids = dense["ids"][0] if dense and dense["ids"] else []
+    for doc_id, doc, meta in zip(dense_ids, dense["documents"][0], dense["metadatas"][0]):
+        candidates[doc_id] = (doc, meta)
+
+    lexical = _get_lexical()
+    with metrics.timer("rag_retrieval_seconds", stage="lexical"):
+        lexical_ids = _lexical_search(lexical, query, RAG_LEXICAL_CANDIDATES)
+
+    fused = retrieval.reciprocal_rank_fusion([dense_ids, lexical_ids])[:max(RAG_RERANK_CANDIDATES, n_results)]
+    missing = [doc_id for doc_id in fused if doc_id not in candidates]
+    if missing:
+        extra = _collection.get(ids=missing, include=["documents", "metadatas"])
+        for doc_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            candidates[doc_id] = (doc, meta)
+    fused = [doc_id for doc_id in fused if doc_id in candidates]
+
+    reranker = _get_reranker()
+    if reranker is not None and len(fused) > 1:
+        with metrics.timer("rag_retrieval_seconds", stage="rerank"):
+            scores = reranker(query, [candidates[doc_id][0] for doc_id in fused])
+        fused = [doc_id for _, doc_id in sorted(zip(scores, fused), key=lambda pair: pair[0], reverse=True)]
+
+    top = fused[:n_results]
+    if not top:
          return "No relevant info found."
 
-    docs = results['documents'][0]
-    metas = results['metadatas'][0]
+    docs = [candidates[doc_id][0] for doc_id in top]
+    metas = [candidates[doc_id][1] for doc_id in top]
     
     context_data = []
     for i, doc in enumerate(docs):
         source = metas[i].get('source', 'unknown')
-        context_data.append({"source": source, "content": doc})
+        item = {"source": source, "content": doc}
+        # PDF chunks know their pages, so answers can cite them
+        if "page_start" in metas[i]:
+            pages = (metas[i]["page_start"], metas[i]["page_end"])
+            item["pages"] = str(pages[0]) if pages[0] == pages[1] else f"{pages[0]}-{pages[1]}"
+        context_data.append(item)
 
     return json.dumps(context_data, indent=2)
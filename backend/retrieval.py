@@ -0,0 +1,148 @@
+# Hybrid retrieval building blocks
+# - BM25Index: lexical inverted index kept alongside the Chroma collection.
+#   Dense MiniLM search misses exact tokens (tickers, EIP numbers, protocol
+#   names); BM25 catches them.
+# - reciprocal_rank_fusion: merges lexical and dense rankings by rank, not score
+# - load_reranker: optional cross-encoder applied to the fused top-k
+
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Standard RRF constant; dampens the weight of top ranks
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was "
+    "were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Lowercased terms; compound tokens like "eip-1559" or "layer-2" are kept
+    whole and also split into their parts, so both spellings match.
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(p for p in re.split(r"[-_.]", token) if p and p not in _STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """In-memory BM25 over chunk ids, grouped by source file for removal."""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self.doc_lengths = {}               # doc_id -> number of terms
+        self.sources = defaultdict(set)     # source -> {doc_id}
+        self.doc_terms = {}                 # doc_id -> distinct terms (for removal)
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text, source):
+        if doc_id in self.doc_lengths:
+            self._remove_doc(doc_id)
+        terms = tokenize(text)
+        counts = Counter(terms)
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        self.doc_terms[doc_id] = tuple(counts)
+        self.doc_lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+        self.sources[source].add(doc_id)
+
+    def remove_source(self, source):
+        for doc_id in self.sources.pop(source, ()):
+            self._remove_doc(doc_id)
+
+    def _remove_doc(self, doc_id):
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def search(self, query, k):
+        """Returns [(doc_id, score)] best first."""
+        n = len(self.doc_lengths)
+        if n == 0:
+            return []
+        avg_length = self.total_length / n
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    # -----------------------------------------------------
+    # Persistence (next to the vector DB)
+    # -----------------------------------------------------
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((dict(self.postings), self.doc_lengths, dict(self.sources)), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, "rb") as f:
+            postings, doc_lengths, sources = pickle.load(f)
+        index.postings.update(postings)
+        index.doc_lengths = doc_lengths
+        index.sources.update(sources)
+        index.total_length = sum(doc_lengths.values())
+        terms = defaultdict(list)
+        for term, docs in postings.items():
+            for doc_id in docs:
+                terms[doc_id].append(term)
+        index.doc_terms = {doc_id: tuple(t) for doc_id, t in terms.items()}
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merges ranked id lists; returns ids ordered by sum of 1 / (k + rank)."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def load_reranker(model_name):
+    """
+    Returns rerank(query, texts) -> scores, or None when disabled/unavailable.
+    Uses a sentence-transformers CrossEncoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2.
+    """
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import CrossEncoder
+
+        model = CrossEncoder(model_name)
+    except Exception as e:
+        print(f"RAG: reranker '{model_name}' unavailable ({e}); using fused order")
+        return None
+    return lambda query, texts: model.predict([(query, t) for t in texts])
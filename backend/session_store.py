@@ -0,0 +1,480 @@
+# Bounded ADK session store
+# Replaces InMemorySessionService, where every client_id session keeps growing
+# and is never freed until the process runs out of memory:
+# - sessions live in an LRU with an idle TTL, a session cap and a hard memory
+#   budget (estimated from the size of their serialized events)
+# - each session keeps its most recent SESSION_MAX_EVENTS events, trimmed at a
+#   user turn so a tool call is never separated from its response
+# - optional persistent tier: every event is written through, so sessions
+#   evicted from memory are rehydrated on reconnect and several workers share
+#   conversations (a worker reloads a session another worker has updated since)
+#     SESSION_DB_PATH  -> SQLite file (workers on one machine)
+#     SHARED_STORE_URL -> the shared Redis store (workers on many machines, see shared_store.py)
+# app:/user: scoped state is shared per process only, as in InMemorySessionService.
+#
+# Imports google.adk, so main.py loads it with the agent, during warm-up.
+
+import asyncio
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from google.adk.events.event import Event
+from google.adk.sessions.base_session_service import BaseSessionService, ListSessionsResponse
+from google.adk.sessions.session import Session
+from google.adk.sessions.state import State
+
+try:
+    import metrics
+    import shared_store
+except ImportError:
+    from . import metrics
+    from . import shared_store
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))  # Idle time before a session leaves memory
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "64"))
+SESSION_MAX_EVENTS = int(os.getenv("SESSION_MAX_EVENTS", "200"))
+# SQLite file for the persistent tier (e.g. ./sessions.db); empty = memory only
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+SESSION_DB_RETENTION_SECONDS = float(os.getenv("SESSION_DB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+_PURGE_INTERVAL = 300  # Seconds between retention sweeps of the persistent tier
+
+
+def _event_json(event):
+    return event.model_dump_json(exclude_none=True)
+
+
+class _Entry:
+    __slots__ = ("session", "event_sizes", "size", "last_access")
+
+    def __init__(self, session, event_sizes):
+        self.session = session
+        self.event_sizes = event_sizes
+        self.size = sum(event_sizes)
+        self.last_access = time.monotonic()
+
+
+# ---------------------------------------------------------
+# Persistent tier
+# ---------------------------------------------------------
+class SessionDB:
+    """
+    SQLite tables: sessions (state + last update) and events (one JSON row each).
+    Blocking; the service calls it through asyncio.to_thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # WAL lets several worker processes read while one writes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                app_name TEXT, user_id TEXT, session_id TEXT,
+                state TEXT, last_update_time REAL,
+                PRIMARY KEY (app_name, user_id, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                app_name TEXT, user_id TEXT, session_id TEXT, data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS events_by_session ON events (app_name, user_id, session_id, seq);
+        """)
+
+    def _transaction(self, statements):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def save(self, session):
+        """Writes a whole session, replacing any previous copy."""
+        key = (session.app_name, session.user_id, session.id)
+        statements = [
+            ("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key),
+            ("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+             key + (json.dumps(session.state), session.last_update_time)),
+        ]
+        statements += [("INSERT INTO events (app_name, user_id, session_id, data) VALUES (?, ?, ?, ?)",
+                         key + (_event_json(e),)) for e in session.events]
+        self._transaction(statements)
+
+    def append(self, session, event_json, keep_events):
+        """Adds one event, updates state, and drops all but the newest `keep_events` events."""
+        key = (session.app_name, session.user_id, session.id)
+        self._transaction([
+            ("INSERT INTO events (app_name, user_id, session_id, data) VALUES (?, ?, ?, ?)", key + (event_json,)),
+            ("INSERT INTO sessions VALUES (?, ?, ?, ?, ?) ON CONFLICT (app_name, user_id, session_id) "
+             "DO UPDATE SET state = excluded.state, last_update_time = excluded.last_update_time",
+             key + (json.dumps(session.state), session.last_update_time)),
+            ("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq NOT IN "
+             "(SELECT seq FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? "
+             "ORDER BY seq DESC LIMIT ?)", key + key + (keep_events,)),
+        ])
+
+    def version(self, app_name, user_id, session_id):
+        """last_update_time of the stored session, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (app_name, user_id, session_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, app_name, user_id, session_id):
+        """Returns (Session, [event sizes]) or None."""
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq",
+                key,
+            ).fetchall()
+        events = [Event.model_validate_json(data) for (data,) in rows]
+        session = Session(app_name=app_name, user_id=user_id, id=session_id,
+                          state=json.loads(row[0]), events=events, last_update_time=row[1])
+        return session, [len(data) for (data,) in rows]
+
+    def list(self, app_name, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            ).fetchall()
+        return [Session(app_name=app_name, user_id=user_id, id=session_id, state=json.loads(state),
+                        last_update_time=updated) for session_id, state, updated in rows]
+
+    def delete(self, app_name, user_id, session_id):
+        key = (app_name, user_id, session_id)
+        self._transaction([
+            ("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key),
+            ("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key),
+        ])
+
+    def purge(self, older_than):
+        """Deletes sessions not updated since `older_than` (epoch seconds)."""
+        self._transaction([
+            ("DELETE FROM events WHERE (app_name, user_id, session_id) IN "
+             "(SELECT app_name, user_id, session_id FROM sessions WHERE last_update_time < ?)", (older_than,)),
+            ("DELETE FROM sessions WHERE last_update_time < ?", (older_than,)),
+        ])
+
+
+class StoreSessionDB:
+    """
+    The same tier on the shared key-value store: a JSON record and an event
+    list per session, plus a set of session ids per user for listing.
+    Keys expire after the retention period, so purge() has nothing to do.
+    """
+
+    def __init__(self, store, retention=SESSION_DB_RETENTION_SECONDS):
+        self.store = store
+        self.retention = retention
+
+    @staticmethod
+    def _keys(app_name, user_id, session_id):
+        base = f"{app_name}:{user_id}:{session_id}"
+        return f"session:{base}", f"session_events:{base}", f"sessions:{app_name}:{user_id}"
+
+    async def _write_record(self, session, record_key, events_key, index_key):
+        record = json.dumps({"state": session.state, "last_update_time": session.last_update_time})
+        await self.store.set(record_key, record, ttl=self.retention)
+        await self.store.expire(events_key, self.retention)
+        await self.store.sadd(index_key, session.id)
+        await self.store.expire(index_key, self.retention)
+
+    async def save(self, session):
+        record_key, events_key, index_key = self._keys(session.app_name, session.user_id, session.id)
+        await self.store.delete(events_key)
+        if session.events:
+            await self.store.rpush(events_key, *(_event_json(e) for e in session.events))
+        await self._write_record(session, record_key, events_key, index_key)
+
+    async def append(self, session, event_json, keep_events):
+        record_key, events_key, index_key = self._keys(session.app_name, session.user_id, session.id)
+        await self.store.rpush(events_key, event_json)
+        await self.store.ltrim(events_key, -keep_events, -1)
+        await self._write_record(session, record_key, events_key, index_key)
+
+    async def version(self, app_name, user_id, session_id):
+        record = await self.store.get(self._keys(app_name, user_id, session_id)[0])
+        return json.loads(record)["last_update_time"] if record else None
+
+    async def load(self, app_name, user_id, session_id):
+        record_key, events_key, _ = self._keys(app_name, user_id, session_id)
+        record = await self.store.get(record_key)
+        if record is None:
+            return None
+        record = json.loads(record)
+        rows = await self.store.lrange(events_key, 0, -1)
+        session = Session(app_name=app_name, user_id=user_id, id=session_id, state=record["state"],
+                          events=[Event.model_validate_json(data) for data in rows],
+                          last_update_time=record["last_update_time"])
+        return session, [len(data) for data in rows]
+
+    async def list(self, app_name, user_id):
+        index_key = self._keys(app_name, user_id, "")[2]
+        sessions = []
+        for session_id in sorted(await self.store.smembers(index_key)):
+            session_id = session_id.decode("utf-8")
+            record = await self.store.get(self._keys(app_name, user_id, session_id)[0])
+            if record is None:
+                await self.store.srem(index_key, session_id)  # Expired
+                continue
+            record = json.loads(record)
+            sessions.append(Session(app_name=app_name, user_id=user_id, id=session_id, state=record["state"],
+                                    last_update_time=record["last_update_time"]))
+        return sessions
+
+    async def delete(self, app_name, user_id, session_id):
+        record_key, events_key, index_key = self._keys(app_name, user_id, session_id)
+        await self.store.delete(record_key, events_key)
+        await self.store.srem(index_key, session_id)
+
+    async def purge(self, older_than):
+        pass
+
+
+def open_tier(db_path=SESSION_DB_PATH):
+    """The configured persistent tier, or None for memory only."""
+    if db_path:
+        return SessionDB(db_path)
+    if shared_store.is_shared():
+        return StoreSessionDB(shared_store.get_store())
+    return None
+
+
+# ---------------------------------------------------------
+# Session service
+# ---------------------------------------------------------
+class BoundedSessionService(BaseSessionService):
+    """Drop-in replacement for InMemorySessionService with bounded memory (see module header)."""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl=SESSION_TTL_SECONDS,
+                 memory_budget_mb=SESSION_MEMORY_BUDGET_MB, max_events=SESSION_MAX_EVENTS,
+                 db_path=SESSION_DB_PATH, db=None):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.max_events = max(1, max_events)
+        self.db = db if db is not None else open_tier(db_path)
+        self._sessions = OrderedDict()  # (app_name, user_id, session_id) -> _Entry, least recent first
+        self._bytes = 0
+        self._last_purge = 0.0
+        self.app_state = {}   # app_name -> {key: value}
+        self.user_state = {}  # (app_name, user_id) -> {key: value}
+        self.evictions = {"ttl": 0, "lru": 0, "budget": 0}
+        self.rehydrations = 0
+
+    # -----------------------------------------------------
+    # Memory tier
+    # -----------------------------------------------------
+    def _put(self, key, entry):
+        old = self._sessions.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._sessions[key] = entry
+        self._bytes += entry.size
+        self._evict(keep=key)
+
+    def _touch(self, key):
+        entry = self._sessions.get(key)
+        if entry is not None:
+            entry.last_access = time.monotonic()
+            self._sessions.move_to_end(key)
+        return entry
+
+    def _drop(self, key, reason):
+        entry = self._sessions.pop(key)
+        self._bytes -= entry.size
+        self.evictions[reason] += 1
+        metrics.inc("session_evictions_total", reason=reason)
+
+    def _evict(self, keep=None):
+        """Idle sessions first, then least recently used until within the caps."""
+        now = time.monotonic()
+        while self._sessions:
+            key, entry = next(iter(self._sessions.items()))
+            if now - entry.last_access <= self.ttl:
+                break
+            self._drop(key, "ttl")
+        while len(self._sessions) > 1:
+            key = next(iter(self._sessions))
+            if key == keep:
+                self._sessions.move_to_end(key)
+                key = next(iter(self._sessions))
+            if len(self._sessions) > self.max_sessions:
+                self._drop(key, "lru")
+            elif self._bytes > self.memory_budget:
+                self._drop(key, "budget")
+            else:
+                break
+        metrics.set_gauge("session_store_sessions", len(self._sessions))
+        metrics.set_gauge("session_store_bytes", self._bytes)
+
+    def _trim(self, entry):
+        """Keeps the newest `max_events` events, starting at a user message. Caller fixes _bytes."""
+        events = entry.session.events
+        cut = len(events) - self.max_events
+        if cut <= 0:
+            return
+        while cut < len(events) and events[cut].author != "user":
+            cut += 1
+        if cut >= len(events):
+            return  # No user turn to cut at yet; keep everything for now
+        del events[:cut]
+        entry.size -= sum(entry.event_sizes[:cut])
+        del entry.event_sizes[:cut]
+
+    def _merge_state(self, app_name, user_id, session):
+        for key, value in self.app_state.get(app_name, {}).items():
+            session.state[State.APP_PREFIX + key] = value
+        for key, value in self.user_state.get((app_name, user_id), {}).items():
+            session.state[State.USER_PREFIX + key] = value
+        return session
+
+    async def _db_call(self, method, *args):
+        # SQLite calls block, so they run in a thread; the shared store is async
+        fn = getattr(self.db, method)
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _persist(self, method, *args):
+        """Writes through to the persistent tier; no-op without one."""
+        if self.db is None:
+            return
+        await self._db_call(method, *args)
+        now = time.time()
+        if now - self._last_purge > _PURGE_INTERVAL:
+            self._last_purge = now
+            await self._db_call("purge", now - SESSION_DB_RETENTION_SECONDS)
+
+    # -----------------------------------------------------
+    # BaseSessionService
+    # -----------------------------------------------------
+    async def create_session(self, *, app_name, user_id, state=None, session_id=None):
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        session = Session(app_name=app_name, user_id=user_id, id=session_id,
+                          state=state or {}, last_update_time=time.time())
+        await self._persist("save", session)
+        self._put((app_name, user_id, session_id), _Entry(session, []))
+        return self._merge_state(app_name, user_id, copy.deepcopy(session))
+
+    async def get_session(self, *, app_name, user_id, session_id, config=None):
+        key = (app_name, user_id, session_id)
+        self._evict()
+        entry = self._touch(key)
+        if self.db is not None:
+            # Another worker may have moved this conversation on since we cached it
+            version = await self._db_call("version", *key)
+            if version is None:
+                entry = None
+            elif entry is None or version > entry.session.last_update_time:
+                loaded = await self._db_call("load", *key)
+                if loaded is None:
+                    return None
+                entry = _Entry(*loaded)
+                self._trim(entry)
+                self._put(key, entry)
+                self.rehydrations += 1
+                metrics.inc("session_rehydrations_total")
+        if entry is None:
+            return None
+
+        session = copy.deepcopy(entry.session)
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [e for e in session.events if e.timestamp >= config.after_timestamp]
+        return self._merge_state(app_name, user_id, session)
+
+    async def list_sessions(self, *, app_name, user_id):
+        if self.db is not None:
+            sessions = await self._db_call("list", app_name, user_id)
+        else:
+            sessions = []
+            for (app, user, _), entry in self._sessions.items():
+                if app == app_name and user == user_id:
+                    session = copy.deepcopy(entry.session)
+                    session.events = []
+                    sessions.append(session)
+        return ListSessionsResponse(sessions=[self._merge_state(app_name, user_id, s) for s in sessions])
+
+    async def delete_session(self, *, app_name, user_id, session_id):
+        key = (app_name, user_id, session_id)
+        entry = self._sessions.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        if self.db is not None:
+            await self._db_call("delete", *key)
+
+    async def append_event(self, session, event):
+        # The caller's copy (what the running invocation sees)
+        await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+        session.last_update_time = event.timestamp
+
+        if event.actions and event.actions.state_delta:
+            for key, value in event.actions.state_delta.items():
+                if key.startswith(State.APP_PREFIX):
+                    self.app_state.setdefault(session.app_name, {})[key.removeprefix(State.APP_PREFIX)] = value
+                if key.startswith(State.USER_PREFIX):
+                    self.user_state.setdefault((session.app_name, session.user_id), {})[
+                        key.removeprefix(State.USER_PREFIX)] = value
+
+        # The stored copy; if it was evicted mid-turn, the caller's copy takes its place
+        key = (session.app_name, session.user_id, session.id)
+        event_json = _event_json(event)
+        entry = self._touch(key)
+        if entry is None:
+            stored = copy.deepcopy(session)
+            entry = _Entry(stored, [len(_event_json(e)) for e in stored.events])
+            self._trim(entry)
+            self._put(key, entry)
+        else:
+            size_before = entry.size
+            await super().append_event(session=entry.session, event=event)
+            entry.session.last_update_time = event.timestamp
+            entry.event_sizes.append(len(event_json))
+            entry.size += len(event_json)
+            self._trim(entry)
+            self._bytes += entry.size - size_before
+            self._evict(keep=key)
+        # The persistent copy keeps exactly the events kept in memory
+        await self._persist("append", entry.session, event_json, len(entry.session.events))
+        return event
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "memory_mb": round(self._bytes / (1024 * 1024), 2),
+            "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 2),
+            "evictions": dict(self.evictions),
+            "rehydrations": self.rehydrations,
+            "persistent": type(self.db).__name__ if self.db is not None else None,
+        }
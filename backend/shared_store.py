@@ -0,0 +1,174 @@
+# Shared key-value store
+# State every worker must see when the app runs as several processes
+# (uvicorn --workers N, or replicas behind a load balancer): conversation
+# sessions and tool results. With it, any worker can serve any message, so
+# no sticky sessions are needed.
+# - SHARED_STORE_URL=redis://host:6379/0 -> RedisStore (needs the `redis` package;
+#   any Redis-compatible server works)
+# - empty -> MemoryStore, an in-process stand-in with the same interface, for
+#   single-process deployments and tests
+# Values are bytes (str is encoded); callers serialize to JSON.
+
+import os
+import time
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+SHARED_STORE_URL = os.getenv("SHARED_STORE_URL", "")
+SHARED_STORE_PREFIX = os.getenv("SHARED_STORE_PREFIX", "cryptoai:")  # Namespaces keys on a shared server
+
+
+def _encode(value):
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+class MemoryStore:
+    """
+    In-process store with Redis semantics for the commands used here
+    (TTL, lists with inclusive/negative ranges, sets). Not shared between processes.
+    """
+
+    def __init__(self):
+        self._data = {}     # key -> value (bytes, list or set)
+        self._expires = {}  # key -> monotonic deadline
+
+    def _live(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    @staticmethod
+    def _slice(values, start, stop):
+        n = len(values)
+        start = max(start + n if start < 0 else start, 0)
+        stop = stop + n if stop < 0 else stop
+        return values[start:stop + 1]
+
+    async def get(self, key):
+        return self._live(key)
+
+    async def mget(self, keys):
+        return [self._live(key) for key in keys]
+
+    async def set(self, key, value, ttl=None):
+        self._data[key] = _encode(value)
+        self._expires.pop(key, None)
+        if ttl is not None:
+            await self.expire(key, ttl)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    async def expire(self, key, ttl):
+        if self._live(key) is not None:
+            self._expires[key] = time.monotonic() + ttl
+
+    async def rpush(self, key, *values):
+        items = self._live(key)
+        if items is None:
+            items = self._data[key] = []
+        items.extend(_encode(v) for v in values)
+        return len(items)
+
+    async def lrange(self, key, start, stop):
+        return self._slice(self._live(key) or [], start, stop)
+
+    async def ltrim(self, key, start, stop):
+        items = self._live(key)
+        if items is not None:
+            items[:] = self._slice(items, start, stop)
+
+    async def sadd(self, key, *members):
+        items = self._live(key)
+        if items is None:
+            items = self._data[key] = set()
+        items.update(_encode(m) for m in members)
+
+    async def srem(self, key, *members):
+        items = self._live(key)
+        if items is not None:
+            items.difference_update(_encode(m) for m in members)
+
+    async def smembers(self, key):
+        return set(self._live(key) or ())
+
+    async def aclose(self):
+        pass
+
+
+class RedisStore:
+    """The same interface on redis.asyncio; keys are prefixed with SHARED_STORE_PREFIX."""
+
+    def __init__(self, url, prefix=SHARED_STORE_PREFIX):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+
+    def _k(self, key):
+        return self._prefix + key
+
+    async def get(self, key):
+        return await self._redis.get(self._k(key))
+
+    async def mget(self, keys):
+        return await self._redis.mget([self._k(k) for k in keys]) if keys else []
+
+    async def set(self, key, value, ttl=None):
+        await self._redis.set(self._k(key), value, px=int(ttl * 1000) if ttl is not None else None)
+
+    async def delete(self, *keys):
+        if keys:
+            await self._redis.delete(*(self._k(k) for k in keys))
+
+    async def expire(self, key, ttl):
+        await self._redis.pexpire(self._k(key), int(ttl * 1000))
+
+    async def rpush(self, key, *values):
+        return await self._redis.rpush(self._k(key), *values)
+
+    async def lrange(self, key, start, stop):
+        return await self._redis.lrange(self._k(key), start, stop)
+
+    async def ltrim(self, key, start, stop):
+        await self._redis.ltrim(self._k(key), start, stop)
+
+    async def sadd(self, key, *members):
+        await self._redis.sadd(self._k(key), *members)
+
+    async def srem(self, key, *members):
+        await self._redis.srem(self._k(key), *members)
+
+    async def smembers(self, key):
+        return await self._redis.smembers(self._k(key))
+
+    async def aclose(self):
+        await self._redis.aclose()
+
+
+_store = None
+
+
+def get_store():
+    """The process-wide store (created on first use)."""
+    global _store
+    if _store is None:
+        _store = RedisStore(SHARED_STORE_URL) if SHARED_STORE_URL else MemoryStore()
+    return _store
+
+
+def is_shared():
+    """True when the store is visible to other processes."""
+    return bool(SHARED_STORE_URL)
+
+
+async def aclose():
+    global _store
+    if _store is not None:
+        await _store.aclose()
+        _store = None
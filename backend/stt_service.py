@@ -0,0 +1,691 @@
+# Streaming Speech-to-Text helpers
+# Decodes the browser's WebM/Opus recording ONCE, as chunks arrive
+# Keeps the decoded audio in memory as float32 PCM (what Whisper expects)
+# Lets partial transcripts look at only the last few seconds of audio
+# Finds speech in it (energy VAD): silence is trimmed before inference, silent
+# recordings are never transcribed, and utterances can be endpointed server-side
+
+import asyncio
+import copy
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+log = logging.getLogger("cryptoai")
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+SAMPLE_RATE = 16000  # Whisper works on 16kHz mono audio
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+# Longest recording we keep in memory (4 bytes per sample: 10 min is ~38MB).
+# The buffer starts at INITIAL_UTTERANCE_SECONDS and doubles as needed; past the
+# cap, older audio is overwritten (with a warning) and only the tail is transcribed
+MAX_UTTERANCE_SECONDS = float(os.getenv("STT_MAX_UTTERANCE_SECONDS", "600"))
+INITIAL_UTTERANCE_SECONDS = 30
+
+# Partial transcripts only look at this much of the most recent audio
+PARTIAL_CONTEXT_SECONDS = float(os.getenv("STT_PARTIAL_CONTEXT_SECONDS", "10"))
+
+# Don't bother with a partial until we have at least this much audio
+PARTIAL_MIN_SECONDS = float(os.getenv("STT_PARTIAL_MIN_SECONDS", "1.0"))
+
+# STT engine: "whisper" (openai-whisper, fp32 PyTorch) or
+# "faster-whisper" (CTranslate2, int8-quantized by default; much less RAM on CPU)
+STT_ENGINE = os.getenv("STT_ENGINE", "whisper")
+STT_MODEL_SIZE = os.getenv("STT_MODEL_SIZE", "tiny")  # "tiny" for maximum speed
+STT_COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")  # faster-whisper only
+STT_CPU_THREADS = int(os.getenv("STT_CPU_THREADS", "0"))  # 0 = library default
+
+# Shared inference worker: segments from all connections are batched together
+MAX_BATCH_SIZE = int(os.getenv("STT_MAX_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.getenv("STT_BATCH_WAIT_MS", "20"))
+# Each extra worker holds its own copy of the model (concurrent decodes can't share one)
+MAX_CONCURRENCY = int(os.getenv("STT_MAX_CONCURRENCY", "1"))
+
+SEGMENT_SAMPLES = 30 * SAMPLE_RATE  # Whisper decodes fixed 30s windows
+
+# Long recordings are cut at the quietest 30ms frame of the last few seconds before
+# each 30s boundary, so a window never ends mid-word
+SEGMENT_SPLIT_SEARCH_SECONDS = 5
+
+# Same thresholds whisper.transcribe uses to skip silent windows and, at temperature 0,
+# to reject repetitive or unsure decodes and retry them hotter (temperature fallback)
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+BEST_OF = 5  # Samples per retry at temperature > 0
+
+# Voice activity detection: a 30ms frame is speech when it is louder than
+# STT_VAD_SPEECH_DB and than the background noise + STT_VAD_MARGIN_DB
+# (never more than the margin below the loudest frame, so speech without pauses still counts)
+VAD_ENABLED = os.getenv("STT_VAD", "true").lower() in ("1", "true", "yes")
+VAD_FRAME_MS = 30
+VAD_SPEECH_DB = float(os.getenv("STT_VAD_SPEECH_DB", "-45"))  # dBFS
+VAD_MARGIN_DB = float(os.getenv("STT_VAD_MARGIN_DB", "10"))
+VAD_PADDING_MS = float(os.getenv("STT_VAD_PADDING_MS", "200"))  # Kept around speech so word edges survive
+VAD_MIN_SPEECH_MS = float(os.getenv("STT_VAD_MIN_SPEECH_MS", "200"))  # Less than this counts as silence
+# > 0: the server ends the utterance after this much silence, without waiting for transcribe_request
+VAD_ENDPOINT_SILENCE_MS = float(os.getenv("STT_VAD_ENDPOINT_MS", "0"))
+
+_READ_BLOCK = 8192
+
+
+class PCMRingBuffer:
+    """
+    Ring buffer of float32 mono samples. It grows (doubling) up to `max_seconds`,
+    then overwrites the oldest audio.
+    """
+
+    def __init__(self, max_seconds=MAX_UTTERANCE_SECONDS, sample_rate=SAMPLE_RATE,
+                 initial_seconds=INITIAL_UTTERANCE_SECONDS):
+        self.sample_rate = sample_rate
+        self.max_samples = int(max_seconds * sample_rate)
+        self._buf = np.zeros(min(int(initial_seconds * sample_rate), self.max_samples), dtype=np.float32)
+        self._write = 0  # Next write position
+        self._size = 0   # Number of valid samples
+        self.total = 0   # Samples ever appended (not capped)
+        self.dropped = 0  # Samples overwritten once the buffer was full
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        """Seconds of audio currently held."""
+        return self._size / self.sample_rate
+
+    def append(self, samples):
+        n = len(samples)
+        if n == 0:
+            return
+
+        with self._lock:
+            if self._size + n > len(self._buf) < self.max_samples:
+                self._grow(self._size + n)
+            cap = len(self._buf)
+            overflow = self._size + n - cap
+            if overflow > 0:
+                if not self.dropped:
+                    log.warning("Recording longer than STT_MAX_UTTERANCE_SECONDS=%g; "
+                                "older audio is dropped", self.max_samples / self.sample_rate)
+                self.dropped += overflow
+
+            self.total += n
+            if n >= cap:
+                # Only the newest `cap` samples survive
+                self._buf[:] = samples[-cap:]
+                self._write = 0
+                self._size = cap
+                return
+
+            end = self._write + n
+            if end <= cap:
+                self._buf[self._write:end] = samples
+            else:
+                first = cap - self._write
+                self._buf[self._write:] = samples[:first]
+                self._buf[:n - first] = samples[first:]
+
+            self._write = end % cap
+            self._size = min(cap, self._size + n)
+
+    def _grow(self, needed):
+        # Called with the lock held; unrolls the ring into the new array
+        cap = min(self.max_samples, max(needed, 2 * len(self._buf)))
+        buf = np.zeros(cap, dtype=np.float32)
+        held = self._last(self._size)
+        buf[:len(held)] = held
+        self._buf = buf
+        self._write = len(held) % cap
+
+    def tail(self, seconds=None):
+        """Returns a contiguous copy of the last `seconds` of audio (all of it if None)."""
+        return self.last(None if seconds is None else int(seconds * self.sample_rate))
+
+    def last(self, n=None):
+        """Returns a contiguous copy of the last `n` samples (all of them if None)."""
+        with self._lock:
+            return self._last(self._size if n is None else min(n, self._size))
+
+    def since(self, total):
+        """
+        Returns (samples appended after the first `total`, current total), read
+        together so an append can't land in between. Samples already overwritten
+        are missing from the copy.
+        """
+        with self._lock:
+            return self._last(max(0, min(self.total - total, self._size))), self.total
+
+    def _last(self, n):
+        cap = len(self._buf)
+        start = (self._write - n) % cap
+        if start + n <= cap:
+            return self._buf[start:start + n].copy()
+        return np.concatenate((self._buf[start:], self._buf[:n - (cap - start)]))
+
+    def clear(self):
+        with self._lock:
+            self._write = 0
+            self._size = 0
+            self.total = 0
+            self.dropped = 0
+
+
+class StreamingDecoder:
+    """
+    Decodes one recording (a WebM/Opus stream from MediaRecorder) incrementally.
+
+    A single ffmpeg process lives for the whole recording: chunks are piped into
+    its stdin as they arrive and raw 16kHz PCM is read back into `self.pcm`.
+    Nothing touches the disk and no audio is decoded twice.
+    """
+
+    def __init__(self, max_seconds=MAX_UTTERANCE_SECONDS):
+        self.pcm = PCMRingBuffer(max_seconds)
+        self.bytes_received = 0
+
+        self._chunks = queue.Queue()
+        self._process = subprocess.Popen(
+            [
+                FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+                # Start emitting audio right away instead of probing seconds of input
+                "-probesize", "4096", "-analyzeduration", "0", "-fflags", "nobuffer",
+                "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                "-flush_packets", "1",
+                "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+        # Writes can block when ffmpeg is busy, so they never run on the event loop
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._writer.start()
+        self._reader.start()
+
+    def feed(self, chunk):
+        """Queues an encoded chunk for decoding. Never blocks."""
+        self.bytes_received += len(chunk)
+        self._chunks.put(bytes(chunk))
+
+    def finish(self, timeout=10.0):
+        """Flushes the decoder and returns every sample of the recording."""
+        self._chunks.put(None)
+        self._writer.join(timeout)
+        self._reader.join(timeout)
+        self.close()
+        return self.pcm.tail()
+
+    def close(self):
+        """Stops ffmpeg. Safe to call more than once."""
+        self._chunks.put(None)
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    def _write_loop(self):
+        stdin = self._process.stdin
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is None:
+                    break
+                stdin.write(chunk)
+                stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            # ffmpeg exited (bad input or close()); the reader sees EOF
+            pass
+        finally:
+            try:
+                stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def _read_loop(self):
+        stdout = self._process.stdout
+        leftover = b""
+        while True:
+            data = stdout.read1(_READ_BLOCK)
+            if not data:
+                break
+
+            data = leftover + data
+            usable = len(data) - (len(data) % 2)  # Whole int16 samples only
+            leftover = data[usable:]
+            if usable:
+                samples = np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                self.pcm.append(samples)
+
+
+# ---------------------------------------------------------
+# Voice activity detection
+# ---------------------------------------------------------
+_VAD_FRAME = int(SAMPLE_RATE * VAD_FRAME_MS / 1000)
+
+
+def frame_levels(audio):
+    """Loudness of each 30ms frame of 16kHz audio, in dBFS."""
+    n = len(audio) // _VAD_FRAME
+    frames = audio[:n * _VAD_FRAME].reshape(n, _VAD_FRAME)
+    return 20 * np.log10(np.sqrt(np.mean(np.square(frames), axis=1)) + 1e-10)
+
+
+def split_segments(audio):
+    """Splits audio into windows of at most 30s, each cut at a pause near the boundary."""
+    search = int(SEGMENT_SPLIT_SEARCH_SECONDS * SAMPLE_RATE)
+    segments = []
+    start = 0
+    while len(audio) - start > SEGMENT_SAMPLES:
+        window = start + SEGMENT_SAMPLES - search
+        quietest = int(np.argmin(frame_levels(audio[window:start + SEGMENT_SAMPLES])))
+        cut = window + quietest * _VAD_FRAME + _VAD_FRAME // 2
+        segments.append(audio[start:cut])
+        start = cut
+    segments.append(audio[start:])
+    return segments
+
+
+def _speech_threshold(noise_db, peak_db):
+    return max(VAD_SPEECH_DB, min(noise_db + VAD_MARGIN_DB, peak_db - VAD_MARGIN_DB))
+
+
+def trim_silence(audio):
+    """
+    Cuts leading and trailing silence, keeping VAD_PADDING_MS around the speech.
+    Returns an empty array when there is less than VAD_MIN_SPEECH_MS of speech,
+    so silent recordings never reach the model (nor its silence hallucinations).
+    """
+    if not VAD_ENABLED or audio.size == 0:
+        return audio
+
+    levels = frame_levels(audio)
+    if levels.size == 0:
+        return audio[:0]
+    # The quietest frames tell how loud the room is
+    speech = np.flatnonzero(levels > _speech_threshold(np.percentile(levels, 5), levels.max()))
+    if len(speech) * VAD_FRAME_MS < VAD_MIN_SPEECH_MS:
+        metrics.inc("stt_vad_silent_total")
+        return audio[:0]
+
+    padding = int(VAD_PADDING_MS / VAD_FRAME_MS)
+    start = max(0, int(speech[0]) - padding) * _VAD_FRAME
+    last_frame = int(speech[-1]) + 1 + padding
+    end = len(audio) if last_frame >= len(levels) else last_frame * _VAD_FRAME
+    metrics.inc("stt_vad_trimmed_seconds_total", (len(audio) - (end - start)) / SAMPLE_RATE)
+    return audio[start:end]
+
+
+class Endpointer:
+    """
+    Detects the end of an utterance on a recording as it is decoded: at least
+    VAD_MIN_SPEECH_MS of speech followed by `silence_ms` of silence.
+    The noise floor follows quiet frames down at once and drifts up slowly.
+    """
+
+    def __init__(self, silence_ms=VAD_ENDPOINT_SILENCE_MS):
+        self.silence_ms = silence_ms
+        self.speech_ms = 0.0
+        self.silence_after_speech_ms = 0.0
+        self._seen = 0  # Samples of the recording already looked at
+        self._noise = None
+        self._peak = None
+
+    def update(self, pcm):
+        """Looks at the audio decoded since the last call; True once the utterance has ended."""
+        audio, total = pcm.since(self._seen)
+        whole = len(audio) // _VAD_FRAME * _VAD_FRAME
+        if whole == 0:
+            return False
+        # A partial frame waits for the next call
+        self._seen = total - (len(audio) - whole)
+        audio = audio[:whole]
+
+        for level in frame_levels(audio).tolist():
+            if self._noise is None:
+                self._noise = self._peak = level
+            self._peak = max(self._peak, level)
+            if level > _speech_threshold(self._noise, self._peak):
+                self.speech_ms += VAD_FRAME_MS
+                self.silence_after_speech_ms = 0.0
+            elif self.speech_ms:
+                self.silence_after_speech_ms += VAD_FRAME_MS
+            self._noise = level if level < self._noise else self._noise + 0.05 * (level - self._noise)
+
+        return self.speech_ms >= VAD_MIN_SPEECH_MS and self.silence_after_speech_ms >= self.silence_ms
+
+
+class PartialTranscriber:
+    """
+    Runs partial transcriptions for one connection as a background task.
+
+    Only one inference runs at a time. A request that arrives while one is
+    running waits, and a newer request supersedes (drops) it, so at most one
+    partial is ever queued and it always reads the freshest audio when it
+    starts. cancel() drops everything in flight, e.g. on transcribe_request.
+    """
+
+    def __init__(self, transcribe, on_text):
+        self._transcribe = transcribe  # async (np.ndarray) -> str
+        self._on_text = on_text        # async (str) -> None
+        self._task = None
+        self._pending = None           # Callable returning the audio to transcribe
+
+    def submit(self, get_audio):
+        """Schedules a partial. `get_audio` is called when the partial actually starts."""
+        metrics.inc("stt_partials_requested_total")
+        if self._task is not None and not self._task.done():
+            if self._pending is not None:
+                metrics.inc("stt_partials_dropped_total", reason="superseded")
+            self._pending = get_audio
+            return
+        self._task = asyncio.create_task(self._run(get_audio))
+
+    async def cancel(self):
+        """Cancels the running partial (its result is never sent) and any queued one."""
+        if self._pending is not None:
+            metrics.inc("stt_partials_dropped_total", reason="cancelled")
+            self._pending = None
+
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            metrics.inc("stt_partials_dropped_total", reason="cancelled")
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, get_audio):
+        while get_audio is not None:
+            started = time.perf_counter()
+            try:
+                text = await self._transcribe(get_audio())
+                metrics.observe("stt_partial_latency_seconds", time.perf_counter() - started)
+                if text:
+                    await self._on_text(text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Partial transcription failed: {e}")
+
+            # Anything requested meanwhile runs next, on the newest audio
+            get_audio, self._pending = self._pending, None
+
+
+# ---------------------------------------------------------
+# STT engines
+# ---------------------------------------------------------
+class STTEngine:
+    """
+    Interface every STT backend implements.
+
+    transcribe_batch() receives float32 16kHz segments of at most 30s and returns
+    one string per segment ("" for silence). It is always called from a worker
+    thread, never from the event loop.
+    """
+
+    name = "base"
+
+    def transcribe_batch(self, segments):
+        raise NotImplementedError
+
+    def replicate(self):
+        """Returns an engine another worker can use concurrently with this one."""
+        return self
+
+
+class WhisperEngine(STTEngine):
+    """openai-whisper on PyTorch (fp32 on CPU). Batches segments in one forward pass."""
+
+    name = "whisper"
+
+    def __init__(self, model_size=STT_MODEL_SIZE):
+        import whisper
+
+        self.model_size = model_size
+        self.model = whisper.load_model(model_size, device="cpu")
+
+    def transcribe_batch(self, segments):
+        return _decode_batch(self.model, segments)
+
+    def replicate(self):
+        # whisper's kv-cache hooks live on the model, so each worker needs its own copy
+        clone = copy.copy(self)
+        clone.model = copy.deepcopy(self.model)
+        return clone
+
+
+class FasterWhisperEngine(STTEngine):
+    """
+    faster-whisper (CTranslate2) with int8 weights by default.
+
+    Uses roughly a quarter of the memory of the fp32 PyTorch model and runs
+    several times faster on CPU. The model is thread-safe: `num_workers` lets
+    that many workers call it concurrently without copying it.
+    """
+
+    name = "faster-whisper"
+
+    def __init__(self, model_size=STT_MODEL_SIZE, compute_type=STT_COMPUTE_TYPE,
+                 cpu_threads=STT_CPU_THREADS, num_workers=MAX_CONCURRENCY):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError("STT_ENGINE=faster-whisper requires the 'faster-whisper' package") from e
+
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.model = WhisperModel(
+            model_size,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=max(1, num_workers),
+        )
+
+    def transcribe_batch(self, segments):
+        texts = []
+        for segment in segments:
+            results, _ = self.model.transcribe(
+                segment,
+                language="en",
+                beam_size=1,
+                without_timestamps=True,
+                condition_on_previous_text=False,
+                no_speech_threshold=NO_SPEECH_THRESHOLD,
+                log_prob_threshold=LOGPROB_THRESHOLD,
+            )
+            texts.append("".join(r.text for r in results).strip())
+        return texts
+
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+
+def create_engine(name=STT_ENGINE, **kwargs):
+    """Builds the configured STT engine (see STT_ENGINE / STT_MODEL_SIZE)."""
+    try:
+        engine_cls = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown STT engine '{name}'. Choose one of: {', '.join(ENGINES)}") from None
+    return engine_cls(**kwargs)
+
+
+# ---------------------------------------------------------
+# Shared inference service
+# ---------------------------------------------------------
+class _SegmentRequest:
+    def __init__(self, audio, future):
+        self.audio = audio
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class STTInferenceService:
+    """
+    One STT inference service shared by every WebSocket session.
+
+    Callers await transcribe(audio). Audio is cut into 30s segments and queued;
+    workers pull up to `max_batch_size` segments (waiting at most `max_wait_ms`
+    for stragglers) and decode them as a single batched forward pass.
+    `max_concurrency` bounds how many forward passes run at once.
+
+    `load_engine` returns the STTEngine used by the first worker.
+    """
+
+    def __init__(self, load_engine, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=BATCH_WAIT_MS, max_concurrency=MAX_CONCURRENCY):
+        self._load_engine = load_engine
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max(1, max_concurrency)
+
+        self._queue = None  # Created on first use, inside the running event loop
+        self._workers = []
+        self._engines = []
+        self._engines_lock = threading.Lock()
+
+    async def transcribe(self, audio):
+        """Transcribes float32 16kHz audio. Cancelling the caller drops its queued segments."""
+        if audio.size == 0:
+            return ""
+
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+
+        requests = []
+        for segment in split_segments(audio):
+            request = _SegmentRequest(segment, loop.create_future())
+            requests.append(request)
+            self._queue.put_nowait(request)
+        metrics.set_gauge("stt_queue_depth", self._queue.qsize())
+
+        texts = await asyncio.gather(*(r.future for r in requests))
+        return " ".join(t for t in texts if t).strip()
+
+    def _ensure_started(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_concurrency)
+        ]
+
+    def _get_engine(self, index):
+        # Worker 0 uses the shared engine; others get a replica of it
+        with self._engines_lock:
+            while len(self._engines) <= index:
+                if not self._engines:
+                    self._engines.append(self._load_engine())
+                else:
+                    self._engines.append(self._engines[0].replicate())
+            return self._engines[index]
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Callers that went away (cancelled partials) cost nothing
+        return [r for r in batch if not r.future.done()]
+
+    async def _worker(self, index):
+        while True:
+            batch = await self._next_batch()
+            metrics.set_gauge("stt_queue_depth", self._queue.qsize())
+            if not batch:
+                continue
+
+            now = time.perf_counter()
+            for request in batch:
+                metrics.observe("stt_queue_wait_seconds", now - request.queued_at)
+
+            try:
+                engine = await asyncio.to_thread(self._get_engine, index)
+                with metrics.timer("stt_inference_seconds", engine=engine.name):
+                    texts = await asyncio.to_thread(engine.transcribe_batch, [r.audio for r in batch])
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            metrics.inc("stt_batches_total")
+            metrics.inc("stt_segments_total", len(batch))
+            for request, text in zip(batch, texts):
+                if not request.future.done():
+                    request.future.set_result(text)
+
+
+def _decode_batch(model, segments):
+    """
+    Decodes up to 30s segments in batched Whisper forward passes.
+
+    Greedy first; segments whose decode looks like a repetition loop (high
+    compression ratio) or is unsure (low avg logprob) are decoded again, together,
+    at the next temperature, as whisper.transcribe does.
+    """
+    import torch
+    import whisper
+
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(segment), n_mels=model.dims.n_mels)
+        for segment in segments
+    ]).to(model.device)
+
+    results = [None] * len(segments)
+    pending = list(range(len(segments)))
+    for temperature in TEMPERATURES:
+        options = whisper.DecodingOptions(
+            language="en", fp16=False, without_timestamps=True, temperature=temperature,
+            best_of=BEST_OF if temperature > 0 else None,
+        )
+        decoded = whisper.decode(model, mels[pending], options)
+        for i, result in zip(pending, decoded):
+            results[i] = result  # The last try stands even if it still fails the checks
+        pending = [i for i, result in zip(pending, decoded) if _needs_fallback(result)]
+        if not pending:
+            break
+
+    texts = []
+    for result in results:
+        if _is_silence(result):
+            texts.append("")
+        else:
+            texts.append(result.text.strip())
+    return texts
+
+
+def _is_silence(result):
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def _needs_fallback(result):
+    if _is_silence(result):
+        return False  # Retrying silence only invites hallucinations
+    return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
@@ -0,0 +1,212 @@
+# Stale-while-revalidate cache + circuit breaker for slow / rate-limited APIs
+# - Fresh entries are served directly
+# - Stale entries are served immediately while one background fetch refreshes them
+#   (they carry only their age; `stale: True` means the live source is failing)
+# - Results carry `source`: "cache" (served from memory), "stale" (last known data
+#   while the source fails) or none (fetched live for this call)
+# - After repeated failures (errors, 429s, timeouts) the breaker opens and the
+#   last known data is served with `stale: True` instead of waiting on the API
+# - Optional shared store (see shared_store.py): workers reuse each other's
+#   fetches, so N workers don't mean N times the upstream calls
+
+import asyncio
+import json
+import os
+import time
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "3"))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "60"))
+
+_STATE_CODES = {"closed": 0, "half_open": 1, "open": 2}  # Gauge values
+
+
+def is_upstream_failure(result):
+    """Failures that say the API is unhealthy (not that the request was bad)."""
+    if result.get("status") == "exception":
+        return True
+    http_status = result.get("http_status") or 0
+    return http_status == 429 or http_status >= 500
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half_open once `reset_timeout` has passed; one probe is let through.
+    half_open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_BREAKER_FAILURES,
+                 reset_timeout=CIRCUIT_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probing = False
+        self._publish()
+
+    @property
+    def state(self):
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = "half_open"
+            self._probing = False
+            self._publish()
+        return self._state
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self._state != "closed":
+            print(f"Circuit breaker '{self.name}' closed")
+            self._state = "closed"
+            self._publish()
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self._state == "half_open" or self.failures >= self.failure_threshold:
+            if self._state != "open":
+                print(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+                metrics.inc("circuit_breaker_trips_total", breaker=self.name)
+            self._state = "open"
+            self._opened_at = time.monotonic()
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("circuit_breaker_state", _STATE_CODES[self._state], breaker=self.name)
+
+
+class StaleWhileRevalidateCache:
+    """
+    Per-key cache in front of an async `fetch(key)` returning a tool result dict.
+
+    Successful results must carry `fetched_at` (epoch seconds). Only those
+    are cached. Results that `is_failure` flags count against the breaker.
+    """
+
+    def __init__(self, name, fetch, fresh_ttl, max_stale, breaker=None,
+                 is_failure=is_upstream_failure, store=None):
+        self.name = name
+        self._fetch_fn = fetch
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.breaker = breaker or CircuitBreaker(name)
+        self.is_failure = is_failure
+        self.store = store
+        self._entries = {}
+        self._in_flight = {}
+        self._failing = set()  # Keys whose last live fetch failed
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            metrics.set_gauge("swr_cache_age_seconds", round(age, 1), cache=self.name, key=key)
+            if age <= self.fresh_ttl:
+                metrics.inc("swr_cache_requests_total", cache=self.name, result="fresh")
+                return {**entry, "source": "cache"}
+            if age <= self.max_stale or self.breaker.state == "open":
+                # Answer now; refresh for the next caller
+                metrics.inc("swr_cache_requests_total", cache=self.name, result="stale")
+                self._revalidate(key)
+                if self.breaker.state == "open" or key in self._failing:
+                    return {**entry, "source": "stale", "stale": True}
+                return {**entry, "source": "cache"}
+
+        metrics.inc("swr_cache_requests_total", cache=self.name, result="miss")
+        result = await self.fetch(key)
+        entry = self._entries.get(key)  # May have come from the shared store
+        if result.get("status") != "success" and entry is not None:
+            return {**entry, "source": "stale", "stale": True}
+        return result
+
+    async def fetch(self, key):
+        """Live fetch through the breaker; concurrent callers for a key share one request."""
+        task = self._in_flight.get(key)
+        if task is None:
+            if not self.breaker.allow():
+                metrics.inc("swr_cache_rejected_total", cache=self.name)
+                return {
+                    "status": "error",
+                    "reason": "circuit_open",
+                    "message": f"{self.name} is temporarily unavailable after repeated failures.",
+                }
+            task = self._start(key)
+        return await asyncio.shield(task)
+
+    def _revalidate(self, key):
+        if key not in self._in_flight and self.breaker.allow():
+            self._start(key)
+
+    def _start(self, key):
+        task = asyncio.create_task(self._fetch(key))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return task
+
+    async def _fetch(self, key):
+        shared = await self._shared_get(key)
+        if shared is not None and time.time() - shared["fetched_at"] <= self.fresh_ttl:
+            # Another worker fetched it recently
+            metrics.inc("swr_cache_shared_hits_total", cache=self.name)
+            self._entries[key] = shared
+            return shared
+
+        try:
+            result = await self._fetch_fn(key)
+        except Exception as e:
+            result = {"status": "exception", "error": str(e)}
+
+        if result.get("status") != "success" and shared is not None:
+            current = self._entries.get(key)
+            if current is None or current["fetched_at"] < shared["fetched_at"]:
+                self._entries[key] = shared  # Last known data, as fetched by another worker
+
+        if result.get("status") == "success":
+            self._failing.discard(key)
+            self._entries[key] = result
+            await self._shared_set(key, result)
+            self.breaker.record_success()
+        elif self.is_failure(result):
+            self._failing.add(key)
+            self.breaker.record_failure()
+        else:
+            # The API answered; the request itself was bad (e.g. unknown chain)
+            self.breaker.record_success()
+        return result
+
+    async def _shared_get(self, key):
+        if self.store is None:
+            return None
+        try:
+            value = await self.store.get(f"swr:{self.name}:{key}")
+        except Exception as e:
+            print(f"SWR cache '{self.name}': shared store unavailable ({e})")
+            return None
+        return json.loads(value) if value is not None else None
+
+    async def _shared_set(self, key, result):
+        if self.store is None:
+            return
+        try:
+            await self.store.set(f"swr:{self.name}:{key}", json.dumps(result), ttl=self.max_stale)
+        except Exception as e:
+            print(f"SWR cache '{self.name}': shared store unavailable ({e})")
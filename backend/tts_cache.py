@@ -0,0 +1,207 @@
+# TTS audio cache
+# The agent repeats itself a lot (failure messages, price-report boilerplate,
+# headlines many users hear within minutes), so synthesized audio is reused.
+# Key = sha256(normalized text, voice, rate, audio format)
+# Tier 1: in-memory LRU (bounded by bytes)
+# Tier 2: optional on-disk store (bounded by bytes, oldest files evicted first)
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+TTS_CACHE_MEMORY_MB = float(os.getenv("TTS_CACHE_MEMORY_MB", "32"))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")  # Empty = no disk tier
+TTS_CACHE_DISK_MB = float(os.getenv("TTS_CACHE_DISK_MB", "256"))
+
+
+def normalize_text(text):
+    """Collapses whitespace so trivially different sentences share an entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text, voice, rate, audio_format):
+    raw = f"{normalize_text(text)}\x00{voice}\x00{rate}\x00{audio_format}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _MemoryLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is not None:
+                self._items.move_to_end(key)
+            return audio
+
+    def put(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._items[key] = audio
+            self.bytes += len(audio)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= len(evicted)
+                metrics.inc("tts_cache_evictions_total", tier="memory")
+
+
+class _DiskStore:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.bytes = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.audio")
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # mtime doubles as "last used" for eviction
+            return audio
+        except OSError:
+            return None
+
+    def put(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        path = self._file(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)  # Readers never see a half-written file
+        except OSError as e:
+            print(f"TTS cache: could not write {path}: {e}")
+            return
+
+        with self._lock:
+            self.bytes += len(audio)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (e for e in os.scandir(self.path) if e.is_file() and e.name.endswith(".audio")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        self.bytes = sum(e.stat().st_size for e in entries)
+        # Evict down to 90% so we don't rescan on every write
+        for entry in entries:
+            if self.bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.bytes -= size
+                metrics.inc("tts_cache_evictions_total", tier="disk")
+            except OSError:
+                pass
+
+
+class TTSCache:
+    """
+    Content-addressed cache in front of TTS synthesis.
+
+    Concurrent misses for the same sentence share one synthesis.
+    """
+
+    def __init__(self, voice, rate, memory_mb=TTS_CACHE_MEMORY_MB,
+                 disk_dir=TTS_CACHE_DIR, disk_mb=TTS_CACHE_DISK_MB):
+        self.voice = voice
+        self.rate = rate
+        self._memory = _MemoryLRU(int(memory_mb * 1024 * 1024))
+        self._disk = _DiskStore(disk_dir, int(disk_mb * 1024 * 1024)) if disk_dir else None
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def stream(self, text, audio_format, stream_audio):
+        """
+        Yields the audio for `text` in chunks.
+        Hits come back as one chunk; misses stream straight from
+        `stream_audio(text, audio_format)` and are stored once complete.
+        """
+        key = cache_key(text, self.voice, self.rate, audio_format)
+
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._record_hit("memory")
+            yield audio
+            return
+
+        if self._disk is not None:
+            audio = await asyncio.to_thread(self._disk.get, key)
+            if audio is not None:
+                self._memory.put(key, audio)
+                self._record_hit("disk")
+                yield audio
+                return
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self._record_hit("in_flight")
+            yield await asyncio.shield(pending)
+            return
+
+        self.misses += 1
+        metrics.inc("tts_cache_misses_total")
+        result = asyncio.get_running_loop().create_future()
+        result.add_done_callback(lambda f: f.cancelled() or f.exception())  # Nobody may be waiting
+        self._in_flight[key] = result
+
+        chunks = []
+        try:
+            async for chunk in stream_audio(text, audio_format):
+                chunks.append(chunk)
+                yield chunk
+            audio = b"".join(chunks)
+            result.set_result(audio)
+        except BaseException as e:
+            # Never cache a partial sentence; others waiting on it get the error
+            if not result.done():
+                result.set_exception(RuntimeError(f"TTS synthesis aborted: {e!r}"))
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        self._memory.put(key, audio)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.put, key, audio)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_bytes": self._memory.bytes,
+            "disk_bytes": self._disk.bytes if self._disk is not None else 0,
+        }
+
+    def _record_hit(self, tier):
+        self.hits += 1
+        metrics.inc("tts_cache_hits_total", tier=tier)
@@ -0,0 +1,546 @@
+# Text-to-Speech worker pool
+# Keeps a few long-lived worker processes, each with ONE initialized TTS engine
+# (voice and rate resolved once at start-up, not per sentence)
+# Sentences go in through a queue, audio comes back in memory, in chunks:
+#   "wav"  -> one chunk per sentence (what the original client plays)
+#   "opus" -> WebM/Opus, streamed in small chunks while the sentence is still synthesizing
+
+import asyncio
+import ctypes
+import ctypes.util
+import io
+import itertools
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "2"))
+TTS_RATE = int(os.getenv("TTS_RATE", "175"))  # Speed up a bit
+TTS_VOICE = os.getenv("TTS_VOICE", "Zira")    # Preferred voice (e.g., Zira on Windows)
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))
+# Workers that die before their engine is up are respawned with exponential backoff;
+# after this many in a row the pool gives up and TTS fails fast
+TTS_MAX_SPAWN_FAILURES = int(os.getenv("TTS_MAX_SPAWN_FAILURES", "5"))
+TTS_RESTART_BACKOFF_MAX = float(os.getenv("TTS_RESTART_BACKOFF_MAX", "30"))
+# Sentences of ONE reply synthesizing at the same time (keeps a long reply from hogging the pool)
+TTS_MAX_IN_FLIGHT = int(os.getenv("TTS_MAX_IN_FLIGHT", str(TTS_WORKERS)))
+
+# Opus output (speech needs very little bitrate)
+TTS_OPUS_BITRATE = os.getenv("TTS_OPUS_BITRATE", "24k")
+TTS_OPUS_CLUSTER_MS = int(os.getenv("TTS_OPUS_CLUSTER_MS", "100"))  # Size of each streamed piece
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+AUDIO_FORMATS = ("wav", "opus")
+
+# espeak engine settings
+_AUDIO_OUTPUT_SYNCHRONOUS = 2
+_POS_CHARACTER = 1
+_CHARS_UTF8 = 1
+_ENDPAUSE = 0x1000
+_ESPEAK_RATE = 1
+_SYNTH_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short), ctypes.c_int, ctypes.c_void_p)
+
+_READ_BLOCK = 4096
+
+
+# ---------------------------------------------------------
+# Engines (live inside a worker process)
+# Each engine calls write(pcm_bytes, sample_rate) with 16-bit mono PCM
+# ---------------------------------------------------------
+class _EspeakEngine:
+    """
+    Talks to libespeak(-ng) directly (what pyttsx3 uses on Linux).
+    PCM is handed on from the synth callback as it is produced, nothing touches the disk.
+    """
+
+    def __init__(self, rate=TTS_RATE, voice=TTS_VOICE):
+        lib_path = ctypes.util.find_library("espeak-ng") or ctypes.util.find_library("espeak")
+        if not lib_path:
+            raise OSError("libespeak not found")
+
+        self._lib = ctypes.CDLL(lib_path)
+        self._lib.espeak_Initialize.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        self._lib.espeak_SetSynthCallback.argtypes = [_SYNTH_CALLBACK]
+        self._lib.espeak_SetParameter.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        self._lib.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        self._lib.espeak_Synth.argtypes = [
+            ctypes.c_char_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p,
+        ]
+        self.sample_rate = self._lib.espeak_Initialize(_AUDIO_OUTPUT_SYNCHRONOUS, 0, None, 0)
+        if self.sample_rate <= 0:
+            raise OSError("espeak_Initialize failed")
+
+        self._write = None
+        self._error = None
+        self._callback = _SYNTH_CALLBACK(self._on_synth)  # Keep a reference alive
+        self._lib.espeak_SetSynthCallback(self._callback)
+        self._lib.espeak_SetParameter(_ESPEAK_RATE, rate, 0)
+
+        # espeak has no "Zira"; fall back to its default voice
+        if voice and self._lib.espeak_SetVoiceByName(voice.encode("utf-8")) != 0:
+            self._lib.espeak_SetVoiceByName(b"en")
+
+    def _on_synth(self, wav, numsamples, events):
+        if wav and numsamples > 0:
+            try:
+                self._write(ctypes.string_at(wav, numsamples * 2), self.sample_rate)
+            except Exception as e:
+                # Exceptions can't cross the C callback; stop synthesis and re-raise later
+                self._error = e
+                return 1
+        return 0  # Continue synthesis
+
+    def synthesize(self, text, write):
+        self._write = write
+        self._error = None
+        data = text.encode("utf-8")
+        self._lib.espeak_Synth(data, len(data) + 1, 0, _POS_CHARACTER, 0, _CHARS_UTF8 | _ENDPAUSE, None, None)
+        self._lib.espeak_Synchronize()
+        if self._error is not None:
+            raise self._error
+
+
+class _Pyttsx3Engine:
+    """
+    pyttsx3 engine for platforms without libespeak (SAPI5 on Windows, NSSpeech on macOS).
+    pyttsx3 can only save to a path, so each worker reuses ONE scratch file
+    and hands its PCM on once the sentence is done. SAPI5 writes WAV; NSSpeech
+    writes AIFF whatever the extension, which ffmpeg converts to 16-bit mono WAV.
+    """
+
+    def __init__(self, rate=TTS_RATE, voice=TTS_VOICE):
+        import pyttsx3
+
+        self._engine = pyttsx3.init()
+        self._engine.setProperty("rate", rate)
+
+        # Select a nice voice if available
+        for v in self._engine.getProperty("voices"):
+            if voice and voice in v.name:
+                self._engine.setProperty("voice", v.id)
+                break
+
+        self._scratch_dir = tempfile.mkdtemp(prefix="tts_worker_")
+        self._scratch_path = os.path.join(self._scratch_dir, "out.wav")
+        self._converted_path = os.path.join(self._scratch_dir, "converted.wav")
+
+    def synthesize(self, text, write):
+        self._engine.save_to_file(text, self._scratch_path)
+        self._engine.runAndWait()
+        path = self._scratch_path
+        with open(path, "rb") as f:
+            is_aiff = f.read(4) == b"FORM"
+        if is_aiff:
+            subprocess.run(
+                [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", path,
+                 "-ac", "1", "-acodec", "pcm_s16le", self._converted_path],
+                check=True, stdin=subprocess.DEVNULL,
+            )
+            path = self._converted_path
+        with wave.open(path, "rb") as wav:
+            write(wav.readframes(wav.getnframes()), wav.getframerate())
+
+    def close(self):
+        shutil.rmtree(self._scratch_dir, ignore_errors=True)
+
+
+def _create_engine():
+    if sys.platform.startswith("linux"):
+        try:
+            return _EspeakEngine()
+        except OSError as e:
+            print(f"TTS: espeak unavailable ({e}), falling back to pyttsx3")
+    return _Pyttsx3Engine()
+
+
+# ---------------------------------------------------------
+# Output stages (PCM in, encoded chunks out through emit())
+# ---------------------------------------------------------
+class _WavOutput:
+    """Collects the sentence and emits it as one WAV file."""
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._pcm = bytearray()
+        self._sample_rate = None
+
+    def write(self, pcm, sample_rate):
+        self._sample_rate = sample_rate
+        self._pcm += pcm
+
+    def close(self):
+        if self._sample_rate is None:
+            return
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self._sample_rate)
+            wav.writeframes(bytes(self._pcm))
+        self._emit(buf.getvalue())
+
+    def abort(self):
+        self._pcm = bytearray()
+
+
+class _OpusOutput:
+    """
+    Encodes PCM to WebM/Opus with ffmpeg while synthesis is still running.
+    Every ~TTS_OPUS_CLUSTER_MS of encoded audio is emitted as soon as ffmpeg writes it.
+    """
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._process = None
+        self._reader = None
+
+    def write(self, pcm, sample_rate):
+        if self._process is None:
+            self._start(sample_rate)
+        self._process.stdin.write(pcm)
+
+    def _start(self, sample_rate):
+        self._process = subprocess.Popen(
+            [
+                FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+                "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+                "-c:a", "libopus", "-b:a", TTS_OPUS_BITRATE, "-application", "voip", "-ar", "24000",
+                "-f", "webm", "-live", "1", "-cluster_time_limit", str(TTS_OPUS_CLUSTER_MS),
+                "-flush_packets", "1",
+                "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        while True:
+            chunk = self._process.stdout.read1(_READ_BLOCK)
+            if not chunk:
+                break
+            self._emit(chunk)
+
+    def close(self):
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        self._reader.join()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg opus encoder exited with {self._process.returncode}")
+
+    def abort(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+
+_OUTPUTS = {"wav": _WavOutput, "opus": _OpusOutput}
+
+
+def _worker_main(jobs, results, current=None):
+    """Worker process: initialize the engine once, then synthesize jobs until told to stop."""
+    try:
+        import pythoncom  # Required for COM (SAPI5) on Windows
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+
+    engine = _create_engine()
+    results.put((None, "ready", os.getpid()))
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+
+            job_id, text, audio_format = job
+            if current is not None:
+                current.value = job_id  # Written at once (no feeder thread): the pool sees it if we die
+            output = _OUTPUTS[audio_format](lambda chunk, job_id=job_id: results.put((job_id, "chunk", chunk)))
+            try:
+                engine.synthesize(text, output.write)
+                output.close()
+                results.put((job_id, "done", None))
+            except Exception as e:
+                output.abort()
+                results.put((job_id, "error", str(e)))
+            if current is not None:
+                current.value = -1
+    finally:
+        if hasattr(engine, "close"):
+            engine.close()
+
+
+# ---------------------------------------------------------
+# Pool (lives in the server process)
+# ---------------------------------------------------------
+class TTSWorkerPool:
+    """
+    Long-lived TTS worker processes fed from one job queue.
+
+    Processes (not threads) because espeak and SAPI engines are per-process
+    singletons: this is the only way to synthesize sentences in parallel.
+    Workers that die are restarted and the job they were running fails at once.
+    Workers that can't even start their engine are retried with backoff, then
+    the pool is marked failed.
+    """
+
+    def __init__(self, workers=TTS_WORKERS):
+        self.workers = max(1, workers)
+        self._ctx = multiprocessing.get_context("spawn")  # Never fork a threaded server
+        self._jobs = None
+        self._results = None
+        self._processes = []
+        self._listeners = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._ready = threading.Event()  # Set once a worker has its engine up
+        self._current = []  # Per slot: shared job id the worker is synthesizing (-1 when idle)
+        self._healthy = set()  # Pids whose engine came up
+        self._spawn_failures = 0  # Workers in a row that died before their engine was up
+        self._respawn_at = {}  # slot -> monotonic time of the next spawn attempt
+        self._next_check = 0.0
+        self.failed = None  # Why the pool gave up, once it has
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._jobs is not None:
+                return
+            print(f"Starting TTS worker pool ({self.workers} workers)...")
+            self._jobs = self._ctx.Queue()
+            self._results = self._ctx.Queue()
+            self._current = [self._ctx.Value("q", -1, lock=False) for _ in range(self.workers)]
+            self._processes = [self._spawn(i) for i in range(self.workers)]
+            threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def wait_ready(self, timeout=TTS_TIMEOUT):
+        """Starts the workers and blocks until one of them can synthesize (startup warm-up)."""
+        self.start()
+        deadline = time.monotonic() + timeout
+        while not self._ready.wait(min(0.5, max(0.0, deadline - time.monotonic()))):
+            if self.failed:
+                raise RuntimeError(f"TTS unavailable: {self.failed}")
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No TTS worker ready after {timeout:.0f}s")
+
+    def _spawn(self, slot):
+        self._current[slot].value = -1
+        process = self._ctx.Process(target=_worker_main, args=(self._jobs, self._results, self._current[slot]),
+                                    daemon=True)
+        process.start()
+        return process
+
+    async def stream(self, text, audio_format="wav"):
+        """Yields encoded audio chunks for one sentence as the worker produces them."""
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format '{audio_format}'")
+
+        self.start()
+        if self.failed:
+            raise RuntimeError(f"TTS unavailable: {self.failed}")
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        job_id = next(self._ids)
+        with self._lock:
+            self._listeners[job_id] = lambda kind, payload: loop.call_soon_threadsafe(events.put_nowait, (kind, payload))
+        self._jobs.put((job_id, text, audio_format))
+
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            while True:
+                kind, payload = await asyncio.wait_for(events.get(), TTS_TIMEOUT)
+                if kind == "chunk":
+                    if first_chunk:
+                        metrics.observe("tts_first_chunk_seconds", time.perf_counter() - started, format=audio_format)
+                        first_chunk = False
+                    yield payload
+                elif kind == "done":
+                    metrics.observe("tts_synthesis_seconds", time.perf_counter() - started, format=audio_format)
+                    return
+                else:
+                    raise RuntimeError(f"TTS failed: {payload}")
+        finally:
+            with self._lock:
+                self._listeners.pop(job_id, None)
+
+    async def synthesize(self, text, audio_format="wav"):
+        """Synthesizes one sentence to a complete audio file (bytes)."""
+        return b"".join([chunk async for chunk in self.stream(text, audio_format)])
+
+    def shutdown(self):
+        self._closed = True
+        if self._jobs is None:
+            return
+        for _ in self._processes:
+            self._jobs.put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5)
+
+    def _dispatch(self):
+        # Routes worker output back to whoever is streaming that job; restarts crashed workers
+        while not self._closed:
+            if time.monotonic() >= self._next_check:
+                # Also under load, when the results queue is never empty
+                self._next_check = time.monotonic() + 0.5
+                self._restart_dead_workers()
+            try:
+                job_id, kind, payload = self._results.get(timeout=0.5)
+            except Exception:  # queue.Empty
+                continue
+
+            if kind == "ready":
+                self._healthy.add(payload)
+                self._spawn_failures = 0
+                self._ready.set()
+                continue
+            self._notify(job_id, kind, payload)
+
+    def _notify(self, job_id, kind, payload):
+        with self._lock:
+            listener = self._listeners.get(job_id)
+        if listener is not None:
+            listener(kind, payload)
+
+    def _restart_dead_workers(self):
+        now = time.monotonic()
+        for i, process in enumerate(self._processes):
+            if self._closed or self.failed:
+                return
+            if process is not None:
+                if process.is_alive():
+                    continue
+                print(f"TTS worker {process.pid} died (exit {process.exitcode}), restarting")
+                metrics.inc("tts_worker_restarts_total")
+                job_id = self._current[i].value
+                if job_id >= 0:
+                    self._notify(job_id, "error", f"worker {process.pid} died")
+                if process.pid in self._healthy:
+                    self._healthy.discard(process.pid)
+                else:
+                    self._spawn_failures += 1
+                    if self._spawn_failures >= TTS_MAX_SPAWN_FAILURES:
+                        self._give_up(f"{self._spawn_failures} workers in a row failed to start their engine")
+                        return
+                self._processes[i] = None
+                self._respawn_at[i] = now + min(TTS_RESTART_BACKOFF_MAX, 2 ** self._spawn_failures - 1)
+            if now >= self._respawn_at.get(i, 0.0):
+                self._processes[i] = self._spawn(i)
+
+    def _give_up(self, reason):
+        print(f"TTS worker pool failed: {reason}")
+        self.failed = reason
+        with self._lock:
+            listeners = list(self._listeners.values())
+        for listener in listeners:
+            listener("error", f"TTS unavailable: {reason}")
+
+
+# ---------------------------------------------------------
+# Per-reply pipeline
+# ---------------------------------------------------------
+class SpeechPipeline:
+    """
+    Turns the sentences of one reply into audio while the LLM keeps streaming.
+
+    submit() returns immediately: synthesis starts in the background (at most
+    `max_in_flight` sentences at once). A sender task delivers audio strictly in
+    sentence order through `send_audio(index, seq, chunk, last, final)`; chunks
+    of the sentence being played go out as they are encoded, later sentences
+    are buffered until their turn. If no audio chunk carried `final` (the reply
+    ended on a sentence boundary, or its last sentence failed), close() sends an
+    empty final chunk so the client still learns the reply is over.
+    """
+
+    def __init__(self, stream_audio, send_audio, max_in_flight=TTS_MAX_IN_FLIGHT):
+        self._stream_audio = stream_audio  # text -> async iterator of chunks
+        self._send_audio = send_audio
+        self._slots = asyncio.Semaphore(max(1, max_in_flight))
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._next_index = 0
+        self._final_sent = False
+        self._sender = asyncio.create_task(self._send_in_order())
+
+    def submit(self, text, final=False):
+        """Queues a sentence for synthesis. Never waits for the audio."""
+        chunks = asyncio.Queue()
+        task = asyncio.create_task(self._produce(text, chunks))
+        self._tasks.append(task)
+        self._queue.put_nowait((self._next_index, chunks, task, final))
+        self._next_index += 1
+
+    async def close(self):
+        """Waits until every submitted sentence has been sent."""
+        self._queue.put_nowait(None)
+        await self._sender
+
+    async def cancel(self):
+        """Drops anything not yet sent (e.g. the reply failed). Safe after close()."""
+        for task in self._tasks + [self._sender]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, self._sender, return_exceptions=True)
+
+    async def _produce(self, text, chunks):
+        try:
+            async with self._slots:
+                async for chunk in self._stream_audio(text):
+                    chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(None)  # End of sentence (also after a failure)
+
+    async def _send_in_order(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                if not self._final_sent:
+                    await self._send_audio(self._next_index, 0, b"", True, True)
+                return
+
+            index, chunks, task, final = item
+            # Hold back one chunk so the sentence's last chunk can be flagged as such
+            seq = 0
+            held = None
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if held is not None:
+                    await self._send_audio(index, seq, held, False, False)
+                    seq += 1
+                held = chunk
+
+            try:
+                await task
+            except Exception as e:
+                # One bad sentence shouldn't silence the rest of the reply
+                print(f"TTS failed for sentence {index}: {e}")
+                metrics.inc("tts_failures_total")
+
+            if held is not None:
+                await self._send_audio(index, seq, held, True, final)
+                self._final_sent = final
@@ -0,0 +1,145 @@
+# Startup warm-up
+# Heavy components (RAG collection + embedding model, STT model, TTS workers)
+# load in the background once the server is up, so the first user doesn't pay
+# the cold start and the health check answers straight away.
+# - "eager" components are warmed at startup, one at a time (bounded peak memory)
+# - "lazy" components load on first use, as before
+# Either way a component loads once, under its own lock: concurrent first
+# requests wait for the one load instead of racing.
+
+import asyncio
+import os
+import threading
+import time
+
+try:
+    import metrics
+except ImportError:
+    from . import metrics
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+# Components to warm at startup, in order; anything not listed stays lazy.
+# Only the agent by default: the models stay load-on-first-use so small (512MB)
+# instances don't hold them all at once. Opt in with e.g. "agent,tts,stt,rag".
+WARMUP_EAGER = [
+    name.strip().lower()
+    for name in os.getenv("WARMUP_EAGER", "agent").split(",")
+    if name.strip()
+]
+
+
+class Component:
+    """
+    One lazily loaded resource. `load()` returns the resource (or None);
+    `loaded()` optionally reports a load that happened outside ensure().
+    """
+
+    def __init__(self, name, load, eager=False, loaded=None):
+        self.name = name
+        self.eager = eager
+        self.state = "pending"  # pending -> loading -> ready | failed
+        self.error = None
+        self.seconds = None
+        self.value = None
+        self._load = load
+        self._loaded = loaded
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        if self.state != "ready" and self._loaded is not None and self._loaded():
+            self.state = "ready"
+        return self.state == "ready"
+
+    def ensure(self):
+        """Loads the component if needed (blocking) and returns it. Failed loads are retried."""
+        if self.state == "ready":
+            return self.value
+        with self._lock:
+            if self.state == "ready":
+                return self.value
+            self.state = "loading"
+            started = time.perf_counter()
+            try:
+                self.value = self._load()
+            except Exception as e:
+                self.state, self.error = "failed", str(e)
+                metrics.set_gauge("warmup_ready", 0, component=self.name)
+                raise
+            self.seconds = time.perf_counter() - started
+            self.state, self.error = "ready", None
+            metrics.observe("warmup_seconds", self.seconds, component=self.name)
+            metrics.set_gauge("warmup_ready", 1, component=self.name)
+            return self.value
+
+    def status(self):
+        status = {"state": "ready" if self.ready else self.state, "mode": "eager" if self.eager else "lazy"}
+        if self.seconds is not None:
+            status["load_seconds"] = round(self.seconds, 2)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class WarmupManager:
+    """Registry of heavy components; warms the eager ones in a background task."""
+
+    def __init__(self, eager=WARMUP_EAGER):
+        self.eager = list(eager)
+        self.components = {}
+        self._task = None
+
+    def register(self, name, load, loaded=None):
+        self.components[name] = Component(name, load, name in self.eager, loaded)
+        return self.components[name]
+
+    def ensure(self, name):
+        return self.components[name].ensure()
+
+    async def aensure(self, name):
+        """ensure() for async callers: a cold load runs in a thread, never on the event loop."""
+        component = self.components[name]
+        if component.ready:
+            return component.value
+        return await asyncio.to_thread(component.ensure)
+
+    def start(self):
+        """Schedules the eager warm-up and returns immediately."""
+        eager = [self.components[name] for name in self.eager if name in self.components]
+        unknown = [name for name in self.eager if name not in self.components]
+        if unknown:
+            print(f"Warm-up: unknown components in WARMUP_EAGER: {', '.join(unknown)}")
+        if eager and self._task is None:
+            self._task = asyncio.create_task(self._warm(eager))
+
+    async def _warm(self, components):
+        for component in components:
+            if component.ready:
+                continue
+            print(f"Warm-up: loading {component.name}...")
+            try:
+                await asyncio.to_thread(component.ensure)
+                print(f"Warm-up: {component.name} ready in {component.seconds:.1f}s")
+            except Exception as e:
+                # Stays lazy: the first request retries the load
+                print(f"Warm-up: {component.name} failed: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            # A load already running in its thread finishes on its own
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def ready(self):
+        """True once every eager component has loaded."""
+        return all(c.ready for c in self.components.values() if c.eager)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "components": {name: c.status() for name, c in self.components.items()},
+        }
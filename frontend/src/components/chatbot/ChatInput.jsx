@@ -1,27 +1,31 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { Send, Mic, MicOff } from 'lucide-react';
 
-const ChatInput = ({ onSendMessage, isListening, setIsListening, onAudioChunk, onRecordingStop, currentTranscript }) => {
+const ChatInput = ({ onSendMessage, isListening, setIsListening, onAudioChunk, onRecordingStop, currentTranscript, speechEndCount }) => {
     const [message, setMessage] = useState('');
     const mediaRecorderRef = React.useRef(null);
     const chunksRef = React.useRef([]);
 
-    const startRecording = async () => {
-        try {
-            const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-            mediaRecorderRef.current = new MediaRecorder(stream, { mimeType: 'audio/webm' });
+    const startRecorder = (stream) => {
+        mediaRecorderRef.current = new MediaRecorder(stream, { mimeType: 'audio/webm' });
 
-            mediaRecorderRef.current.ondataavailable = (e) => {
-                if (e.data.size > 0) {
-                    onAudioChunk(e.data);
-                }
-            };
+        mediaRecorderRef.current.ondataavailable = (e) => {
+            if (e.data.size > 0) {
+                onAudioChunk(e.data);
+            }
+        };
 
-            mediaRecorderRef.current.onstop = () => {
-                onRecordingStop();
-            };
+        mediaRecorderRef.current.onstop = () => {
+            onRecordingStop();
+        };
+
+        mediaRecorderRef.current.start(250); // Timeslice 250ms
+    };
 
-            mediaRecorderRef.current.start(250); // Timeslice 250ms
+    const startRecording = async () => {
+        try {
+            const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+            startRecorder(stream);
             setIsListening(true);
         } catch (err) {
             console.error("Error accessing microphone:", err);
@@ -37,6 +41,18 @@ const ChatInput = ({ onSendMessage, isListening, setIsListening, onAudioChunk, o
         }
     };
 
+    // The server ended the utterance itself (speech.end): keep the microphone open, but
+    // start a new recording so the next chunks begin with a fresh WebM header.
+    // The old recorder's last chunk is trailing silence; it is dropped, not sent.
+    useEffect(() => {
+        const recorder = mediaRecorderRef.current;
+        if (!speechEndCount || !recorder || recorder.state === 'inactive') return;
+        recorder.ondataavailable = null;
+        recorder.onstop = null;
+        recorder.stop();
+        startRecorder(recorder.stream);
+    }, [speechEndCount]);
+
     const handleVoiceClick = () => {
         if (isListening) {
             stopRecording();
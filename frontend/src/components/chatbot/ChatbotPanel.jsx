@@ -17,7 +17,8 @@ const ChatbotPanel = () => {
         sendTranscribeRequest,
         stopAudio,
         sendMessage,
-        currentTranscript
+        currentTranscript,
+        speechEndCount
     } = useChatWebSocket(import.meta.env.VITE_WS_URL || 'ws://localhost:8001/ws/chat/user-session-1');
 
     // Add initial greeting if empty
@@ -84,6 +85,7 @@ const ChatbotPanel = () => {
                 currentTranscript={currentTranscript}
                 onAudioChunk={handleAudioChunk}
                 onRecordingStop={handleRecordingStop}
+                speechEndCount={speechEndCount}
             />
         </div>
     );
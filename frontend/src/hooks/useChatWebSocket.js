@@ -1,21 +1,37 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 
+// Size of the header on binary audio frames sent by the backend
+const AUDIO_FRAME_HEADER_SIZE = 8;
+const AUDIO_FRAME_FINAL = 0x01; // Flags bit: final chunk of the reply
+const OPUS_MIME = 'audio/webm; codecs="opus"';
+
+// Stream WebM/Opus when the browser can play it chunk by chunk; otherwise one WAV per sentence
+const supportsOpusStreaming = () =>
+    typeof window !== 'undefined' && window.MediaSource?.isTypeSupported(OPUS_MIME);
+
 export const useChatWebSocket = (url) => {
     const [isConnected, setIsConnected] = useState(false);
     const [messages, setMessages] = useState([]);
     const [isTyping, setIsTyping] = useState(false);
     const [currentTranscript, setCurrentTranscript] = useState(""); // For real-time feedback
+    const [speechEndCount, setSpeechEndCount] = useState(0); // Bumped on each server-side end of utterance
 
     // Refs for socket and audio
     const socketRef = useRef(null);
     const audioQueueRef = useRef([]);
     const isPlayingRef = useRef(false);
     const currentAudioRef = useRef(null);
+    const audioFormatRef = useRef("wav");
+    const opusPlayerRef = useRef(null);
 
     const connect = useCallback(() => {
         if (socketRef.current?.readyState === WebSocket.OPEN) return;
 
-        socketRef.current = new WebSocket(url);
+        // Ask for binary audio frames (no base64 overhead); server falls back to JSON if unsupported
+        let wsUrl = url + (url.includes('?') ? '&' : '?') + 'audio=binary';
+        if (supportsOpusStreaming()) wsUrl += '&audio_format=opus';
+        socketRef.current = new WebSocket(wsUrl);
+        socketRef.current.binaryType = 'arraybuffer';
 
         socketRef.current.onopen = () => {
             console.log("WebSocket Connected");
@@ -33,9 +49,24 @@ export const useChatWebSocket = (url) => {
         };
 
         socketRef.current.onmessage = async (event) => {
+            if (event.data instanceof ArrayBuffer) {
+                // Binary audio frame: 8-byte header (version, flags, seq, index) + audio
+                // The reply's final frame may be empty (it only marks the end)
+                const audioBytes = event.data.slice(AUDIO_FRAME_HEADER_SIZE);
+                if (audioFormatRef.current === "opus") {
+                    const flags = new DataView(event.data).getUint8(1);
+                    playOpusChunk(audioBytes, (flags & AUDIO_FRAME_FINAL) !== 0);
+                } else if (audioBytes.byteLength > 0) {
+                    playAudioBlob(new Blob([audioBytes], { type: 'audio/wav' }));
+                }
+                return;
+            }
+
             const data = JSON.parse(event.data);
 
-            if (data.type === "transcript") {
+            if (data.type === "session.config") {
+                audioFormatRef.current = data.audio_format || "wav";
+            } else if (data.type === "transcript") {
                 // User's text recognized
                 setIsTyping(true);
                 setMessages(prev => [...prev, { id: Date.now(), text: data.text, isUser: true }]);
@@ -67,6 +98,9 @@ export const useChatWebSocket = (url) => {
                     return prev;
                 });
                 setIsTyping(false);
+            } else if (data.type === "speech.end") {
+                // Server detected the pause and is answering; the recorder starts a new recording
+                setSpeechEndCount(n => n + 1);
             } else if (data.type === 'transcript_partial') {
                 setCurrentTranscript(data.text);
             } else if (data.type === 'transcript') {
@@ -76,7 +110,11 @@ export const useChatWebSocket = (url) => {
                 setIsTyping(true);
             } else if (data.type === "response.audio") {
                 // Queue Audio Chunk
-                playAudioChunk(data.data);
+                if (data.format === "opus") {
+                    playOpusChunk(Uint8Array.from(atob(data.data), c => c.charCodeAt(0)), data.final);
+                } else if (data.data) {
+                    playAudioChunk(data.data);
+                }
             } else if (data.type === "error") {
                 console.error("Socket Error:", data.message);
                 setIsTyping(false);
@@ -90,6 +128,70 @@ export const useChatWebSocket = (url) => {
         processQueue();
     };
 
+    const playAudioBlob = (blob) => {
+        audioQueueRef.current.push(URL.createObjectURL(blob));
+        processQueue();
+    };
+
+    // One MediaSource per reply; each sentence's WebM chunks are appended in arrival order.
+    // The reply's final chunk ends the stream, and the next reply starts a new player.
+    const playOpusChunk = (bytes, final = false) => {
+        let player = opusPlayerRef.current;
+        if (player?.ending) {
+            // A new reply supersedes what is left of the previous one
+            resetOpusPlayer();
+            player = null;
+        }
+        if (!player && bytes.byteLength === 0) return; // Reply without audio
+        if (!player) {
+            const mediaSource = new MediaSource();
+            const audio = new Audio(URL.createObjectURL(mediaSource));
+            player = { mediaSource, audio, sourceBuffer: null, pending: [], ending: false };
+            opusPlayerRef.current = player;
+
+            mediaSource.addEventListener('sourceopen', () => {
+                player.sourceBuffer = mediaSource.addSourceBuffer(OPUS_MIME);
+                player.sourceBuffer.mode = 'sequence'; // Sentences play back to back
+                player.sourceBuffer.addEventListener('updateend', () => appendOpus(player));
+                appendOpus(player);
+            }, { once: true });
+            audio.onended = () => {
+                if (opusPlayerRef.current === player) resetOpusPlayer();
+            };
+            audio.play().catch(e => console.error("Playback error", e));
+        }
+        if (bytes.byteLength > 0) player.pending.push(bytes);
+        if (final) player.ending = true;
+        appendOpus(player);
+    };
+
+    const appendOpus = (player) => {
+        const { mediaSource, sourceBuffer, pending } = player;
+        if (!sourceBuffer || sourceBuffer.updating) return;
+        if (pending.length === 0) {
+            // Everything of the reply is buffered: let the element play out and fire 'ended'
+            if (player.ending && mediaSource.readyState === 'open') mediaSource.endOfStream();
+            return;
+        }
+        try {
+            sourceBuffer.appendBuffer(pending.shift());
+        } catch (e) {
+            console.error("Audio append error", e);
+        }
+    };
+
+    const resetOpusPlayer = () => {
+        const player = opusPlayerRef.current;
+        if (!player) return;
+        player.audio.pause();
+        URL.revokeObjectURL(player.audio.src);
+        opusPlayerRef.current = null;
+    };
+
+    const releaseAudioSrc = (src) => {
+        if (src.startsWith('blob:')) URL.revokeObjectURL(src);
+    };
+
     const processQueue = () => {
         if (isPlayingRef.current || audioQueueRef.current.length === 0) return;
 
@@ -101,6 +203,7 @@ export const useChatWebSocket = (url) => {
         audio.play().catch(e => console.error("Playback error", e));
 
         audio.onended = () => {
+            releaseAudioSrc(nextAudio);
             isPlayingRef.current = false;
             processQueue();
         };
@@ -111,8 +214,10 @@ export const useChatWebSocket = (url) => {
             currentAudioRef.current.pause();
             currentAudioRef.current = null;
         }
+        audioQueueRef.current.forEach(releaseAudioSrc);
         audioQueueRef.current = [];
         isPlayingRef.current = false;
+        resetOpusPlayer();
 
         // Send stop signal to backend to clear its buffers
         if (socketRef.current?.readyState === WebSocket.OPEN) {
@@ -166,6 +271,7 @@ export const useChatWebSocket = (url) => {
         sendTranscribeRequest,
         stopAudio,
         sendMessage,
-        currentTranscript
+        currentTranscript,
+        speechEndCount
     };
 };
\ No newline at end of file